@@ -0,0 +1,105 @@
+"""
+Backends - indirection between these modules and the OS / GUI libraries they drive (win32gui, win32con, pyautogui,
+PIL.ImageGrab)
+    Modules register their library and keep the returned proxy under the usual name, e.g.
+        win32gui = backends.register("win32gui", win32gui)
+    and call it as before. use() swaps another implementation in for the whole process, e.g. the simulated window
+    manager from sim_backend, so the dialog and PDF viewer code can run and be benchmarked on Linux.
+
+    Heavy or OS specific libraries are registered by module name and imported on first use instead:
+        pyautogui = backends.register_module("pyautogui", "pyautogui")
+    so importing a module stays fast and works on platforms without the library, only calling it fails there.
+"""
+
+import importlib
+import threading
+
+
+"""Global variables"""
+_implementations = {}  # name -> registered implementation
+_overrides = {}  # name -> implementation installed with use()
+_loaders = {}  # name -> (module name, attribute) imported on first use
+_lock = threading.Lock()
+
+
+class BackendProxy:
+    """Forwards attribute access to the current implementation of a backend."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attribute):
+        return getattr(get(self._name), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(get(self._name), attribute, value)
+
+    def __call__(self, *args, **kwargs):  # Class backends, e.g. ActionChains(driver).
+        return get(self._name)(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<BackendProxy {self._name}: {get(self._name)!r}>"
+
+
+def register(name, implementation):
+    """Registers the default implementation of a backend and returns a proxy for it. implementation may be None
+    when the library is not available on this platform, use() must then provide one before it is called."""
+    with _lock:
+        if _implementations.get(name) is None:
+            _implementations[name] = implementation
+    return BackendProxy(name)
+
+
+def register_module(name, module_name, attribute=None):
+    """Registers a backend that is imported on first use: module_name, or one of its attributes, e.g.
+    register_module("ActionChains", "selenium.webdriver.common.action_chains", "ActionChains")."""
+    with _lock:
+        _loaders.setdefault(name, (module_name, attribute))
+    return BackendProxy(name)
+
+
+def _load(name):
+    loader = _loaders.get(name)
+    if loader is None:
+        raise LookupError(f"No backend registered for {name!r}")
+    module_name, attribute = loader
+    module = importlib.import_module(module_name)  # ImportError when the library is missing on this platform.
+    implementation = module if attribute is None else getattr(module, attribute)
+    with _lock:
+        _implementations[name] = implementation
+    return implementation
+
+
+def get(name):
+    """Returns the implementation currently in use for name, importing a register_module() backend if needed."""
+    implementation = _overrides.get(name)
+    if implementation is None:
+        implementation = _implementations.get(name)
+    if implementation is None:
+        implementation = _load(name)
+    return implementation
+
+
+def available(name):
+    """Returns True if get(name) would succeed."""
+    try:
+        get(name)
+        return True
+    except (LookupError, ImportError):
+        return False
+
+
+def use(**implementations):
+    """Overrides backends for the whole process, e.g. use(win32gui=manager). Pass None to restore the default."""
+    with _lock:
+        for name, implementation in implementations.items():
+            if implementation is None:
+                _overrides.pop(name, None)
+            else:
+                _overrides[name] = implementation
+
+
+def reset():
+    """Removes all overrides."""
+    with _lock:
+        _overrides.clear()
@@ -0,0 +1,264 @@
+"""
+Benchmark - end-to-end and per-phase latency, CPU time and throughput of save_pdf(), save_many() (with and without
+prefetch), save_as_window_interact(), open_window_interact() and open_many() against the simulated desktop from
+sim_backend, so it runs on Linux / CI
+    python benchmark.py                      # Run and compare with benchmark_baseline.json
+    python benchmark.py --update-baseline    # Run and store the results as the new baseline
+    python benchmark.py --scenario save_pdf --iterations 50 --threshold 1.25
+    python benchmark.py --scenario import   # Cold import time of pdf_you / com_on_dlg_man only
+
+    A scenario regresses when its p50 latency or CPU time per operation exceeds baseline * threshold plus
+    slack seconds (absorbs scheduler noise on small numbers). Cold import regresses when it exceeds the fixed
+    --import-budget. The exit code is 1 on any regression.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+from time import process_time
+import phase_metrics
+from sim_backend import SimulatedDesktop
+from com_on_dlg_man import OpenCommonDlg, SaveAsCommonDlg
+from pdf_you import ClassPDFView
+from pdf_prefetch import PrefetchPool
+from save_policy import SaveError
+
+
+"""Global variables"""
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+_browser_views = {}  # SimulatedDesktop -> (SimulatedBrowser, ClassPDFView) reused by the save_pdf / save_many scenarios
+
+"""Cold import budget (seconds) of the modules short-lived worker processes import."""
+IMPORT_TIME_BUDGET = 0.1
+IMPORT_MODULES = ("pdf_you", "com_on_dlg_man")
+
+"""Files selected per Open dialog in the open_many scenario."""
+OPEN_MANY_FILES = 10
+
+"""Documents per save_many() batch and iframes loaded ahead in the save_many_prefetch scenario."""
+SAVE_MANY_FILES = 5
+PREFETCH_DEPTH = 1
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))]
+
+
+def _scenario_save_as(desktop, directory, iteration):
+    """Save As dialog already on its way (as after the download click), fill it in and wait for the file."""
+    owner = desktop.manager.create_window("Chrome_WidgetWin_1", "Owner")
+    try:
+        desktop.manager.open_save_as_dialog(owner)
+        file_path = os.path.join(directory, f"save_as_{iteration}.pdf")
+        SaveAsCommonDlg(owner).save_as_window_interact(file_path)
+        return os.path.exists(file_path)
+    finally:
+        desktop.manager.destroy_window(owner)
+
+
+def _scenario_open(desktop, directory, iteration):
+    owner = desktop.manager.create_window("Chrome_WidgetWin_1", "Owner")
+    try:
+        file_path = os.path.join(directory, f"open_{iteration}.pdf")
+        with open(file_path, "wb") as file:
+            file.write(b"%PDF-1.7\n%%EOF\n")
+        desktop.manager.open_open_dialog(owner)
+        OpenCommonDlg(owner).open_window_interact(file_path)
+        return file_path in desktop.manager.opened_files
+    finally:
+        desktop.manager.destroy_window(owner)
+
+
+def _scenario_open_many(desktop, directory, iteration):
+    """OPEN_MANY_FILES files selected in one Open dialog, compare its per_file latency with open_window_interact."""
+    owner = desktop.manager.create_window("Chrome_WidgetWin_1", "Owner")
+    try:
+        file_paths = [os.path.join(directory, f"open_many_{iteration}_{index}.pdf")
+                      for index in range(OPEN_MANY_FILES)]
+        for file_path in file_paths:
+            with open(file_path, "wb") as file:
+                file.write(b"%PDF-1.7\n%%EOF\n")
+        desktop.manager.open_open_dialog(owner)
+        remaining = OpenCommonDlg(owner).open_many(file_paths)
+        return not remaining and desktop.manager.opened_files[-OPEN_MANY_FILES:] == file_paths
+    finally:
+        desktop.manager.destroy_window(owner)
+
+
+def _browser_view(desktop):
+    if desktop not in _browser_views:
+        browser = desktop.create_browser()
+        _browser_views[desktop] = (browser, ClassPDFView(browser.hwnd, browser.pdf_iframe))
+    return _browser_views[desktop]
+
+
+def _scenario_save_pdf(desktop, directory, iteration):
+    """Full pipeline: document loads in the viewer, download click, Save As dialog, file written."""
+    browser, view = _browser_view(desktop)
+    browser.navigate()
+    file_path = os.path.join(directory, f"save_pdf_{iteration}.pdf")
+    view.save_pdf(file_path)
+    return os.path.exists(file_path)
+
+
+def _scenario_save_many(desktop, directory, iteration):
+    """SAVE_MANY_FILES documents, each navigated to once the previous Save As dialog has closed."""
+    browser, view = _browser_view(desktop)
+    jobs = [(browser.navigate, os.path.join(directory, f"save_many_{iteration}_{index}.pdf"))
+            for index in range(SAVE_MANY_FILES)]
+    return all(result.ok for result in view.save_many(jobs))
+
+
+def _scenario_save_many_prefetch(desktop, directory, iteration):
+    """As save_many, the next PREFETCH_DEPTH documents load in hidden iframes while one is saved."""
+    browser, view = _browser_view(desktop)
+    pool = PrefetchPool(browser.pdf_iframe, PREFETCH_DEPTH)
+    jobs = [(f"http://localhost/prefetch-{iteration}-{index}.pdf",
+             os.path.join(directory, f"save_many_prefetch_{iteration}_{index}.pdf"))
+            for index in range(SAVE_MANY_FILES)]
+    try:
+        return all(result.ok for result in view.save_many(jobs, prefetch=pool))
+    finally:
+        pool.close()
+        view.pdf_view_element = browser.pdf_iframe
+
+
+"""Files handled per operation, for the per file latency."""
+FILES_PER_OPERATION = {"open_many": OPEN_MANY_FILES, "save_many": SAVE_MANY_FILES,
+                       "save_many_prefetch": SAVE_MANY_FILES}
+
+SCENARIOS = {
+    "save_as_window_interact": _scenario_save_as,
+    "open_window_interact": _scenario_open,
+    "open_many": _scenario_open_many,
+    "save_pdf": _scenario_save_pdf,
+    "save_many": _scenario_save_many,
+    "save_many_prefetch": _scenario_save_many_prefetch,
+}
+
+
+def run_scenario(name, iterations=20, warmup=2):
+    """Runs one scenario against a fresh simulated desktop. Returns latency percentiles, CPU time per operation,
+    throughput, failures (file not saved / opened) and the mean latency of every phase recorded by phase_metrics."""
+    function = SCENARIOS[name]
+    was_enabled = phase_metrics.metrics.enabled
+    with tempfile.TemporaryDirectory() as directory, SimulatedDesktop() as desktop:
+        for iteration in range(warmup):
+            function(desktop, directory, -1 - iteration)
+        phase_metrics.enable()
+        phase_metrics.metrics.reset()
+        latencies, failures = [], 0
+        cpu_start_time, start_time = process_time(), perf_counter()
+        for iteration in range(iterations):
+            operation_start_time = perf_counter()
+            try:
+                ok = function(desktop, directory, iteration)
+            except SaveError as e:  # Failed phase, see save_policy.
+                logging.warning(f"{name} iteration {iteration}: {type(e).__name__}: {e}")
+                ok = False
+            if not ok:
+                failures += 1
+            latencies.append(perf_counter() - operation_start_time)
+        elapsed, cpu_time = perf_counter() - start_time, process_time() - cpu_start_time
+        phases = {phase: stats["sum"] / stats["count"] for phase, stats in phase_metrics.metrics.snapshot().items()
+                  if stats["count"]}
+        phase_metrics.enable(was_enabled)
+        _browser_views.pop(desktop, None)
+    return {
+        "iterations": iterations,
+        "failures": failures,
+        "p50": _percentile(latencies, 50),
+        "per_file_p50": _percentile(latencies, 50) / FILES_PER_OPERATION.get(name, 1),
+        "p95": _percentile(latencies, 95),
+        "max": max(latencies),
+        "cpu_per_op": cpu_time / iterations,
+        "ops_per_second": iterations / elapsed,
+        "phases": phases,
+    }
+
+
+def measure_import_time(modules=IMPORT_MODULES, runs=5):
+    """Imports modules in fresh interpreters and returns the fastest import time in seconds (interpreter start
+    excluded). Nothing GUI or OS specific may be imported here, see backends.register_module()."""
+    script = f"import time; t = time.perf_counter(); import {', '.join(modules)}; print(time.perf_counter() - t)"
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return min(float(subprocess.run([sys.executable, "-c", script], cwd=directory, capture_output=True, text=True,
+                                    check=True).stdout) for _ in range(runs))
+
+
+def compare(results, baseline, threshold=1.5, slack=0.02):
+    """Returns a list of regression messages for results that exceed baseline * threshold + slack."""
+    regressions = []
+    for name, result in results.items():
+        if result["failures"]:
+            regressions.append(f"{name}: {result['failures']} of {result['iterations']} operations failed")
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p50", "cpu_per_op"):
+            limit = base[key] * threshold + slack
+            if result[key] > limit:
+                regressions.append(f"{name}: {key} {result[key]:.4f}s > {limit:.4f}s (baseline {base[key]:.4f}s)")
+    return regressions
+
+
+def _print_result(name, result):
+    print(f"{name}: p50 {result['p50'] * 1000:.1f} ms, p95 {result['p95'] * 1000:.1f} ms, "
+          f"cpu/op {result['cpu_per_op'] * 1000:.1f} ms, {result['ops_per_second']:.2f} ops/s, "
+          f"failures {result['failures']}, per file {result['per_file_p50'] * 1000:.1f} ms")
+    for phase, latency in sorted(result["phases"].items()):
+        print(f"    {phase:<24} {latency * 1000:8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS) + ["import"],
+                        help="Default: all scenarios and import")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--slack", type=float, default=0.02, help="Seconds added to every limit")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_TIME_BUDGET)
+    args = parser.parse_args(argv)
+    scenarios = args.scenario or sorted(SCENARIOS) + ["import"]
+
+    import_regressions = []
+    if "import" in scenarios:
+        import_time = measure_import_time()
+        print(f"import {', '.join(IMPORT_MODULES)}: {import_time * 1000:.1f} ms (budget "
+              f"{args.import_budget * 1000:.0f} ms)")
+        if import_time > args.import_budget:
+            import_regressions.append(f"import: {import_time:.4f}s > budget {args.import_budget:.4f}s")
+
+    results = {}
+    for name in scenarios:
+        if name != "import":
+            results[name] = run_scenario(name, args.iterations)
+            _print_result(name, results[name])
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = import_regressions + compare(results, baseline, args.threshold, args.slack)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Click Strategies - ways to click a point (the PDFViewer Download button) in a browser window
+    PostMessageClick: Posts WM_MOUSEMOVE / WM_LBUTTONDOWN / WM_LBUTTONUP to the browser's render child window
+        (Chrome_RenderWidgetHostHWND) at the point in client coordinates. The real cursor doesn't move and the
+        window needn't be in the foreground, so many viewers on one desktop can click at the same time.
+    PointerClick: The real mouse through pyautogui (moves the cursor and moves it back), one click at a time.
+    FallbackClick: Tries strategies in order until confirm sees the click take effect. For each window it then
+        starts with the strategy that worked, unless that one moves the pointer: the pointer is only ever a fallback.
+
+    strategy.click(hwnd_parent, (x, y)) -> bool, (x, y) in screen coordinates.
+    await strategy.click_async(hwnd_parent, (x, y)) -> bool, the same without blocking the event loop.
+"""
+
+import inspect
+import logging
+import threading
+import backends
+from window_events import wait_for_condition, wait_for_condition_async, WINDOW_OPEN_EVENTS
+from error_log import error_message as _error_message
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")
+pyautogui = backends.register_module("pyautogui", "pyautogui")  # Imported on first use, see backends.
+win32con = backends.register_module("win32con", "win32con")
+win32gui = backends.register_module("win32gui", "win32gui")
+
+"""Child window classes that receive mouse input for the page, most specific first."""
+RENDER_WINDOW_CLASSES = ("Chrome_RenderWidgetHostHWND", "Intermediate D3D Window")
+
+
+def _make_lparam(x, y):
+    return ((y & 0xFFFF) << 16) | (x & 0xFFFF)
+
+
+class ClickStrategy:
+    """Clicks screen point (x, y) in the window hwnd_parent. Returns True if the click was delivered."""
+    name = "base"
+    moves_pointer = False  # True: takes over the real cursor, see FallbackClick.
+
+    def click(self, hwnd_parent, point):
+        raise NotImplementedError
+
+    async def click_async(self, hwnd_parent, point):
+        """Awaitable click(), run on a worker thread unless the strategy overrides it."""
+        return await asyncio.to_thread(self.click, hwnd_parent, point)
+
+
+class PostMessageClick(ClickStrategy):
+    """Posted mouse messages to the render child window, see the module docstring."""
+    name = "post_message"
+
+    def __init__(self, window_classes=RENDER_WINDOW_CLASSES):
+        self.window_classes = window_classes
+
+    def target_window(self, hwnd_parent):
+        """Returns the render child window of hwnd_parent, or hwnd_parent itself if it has none."""
+        for class_name in self.window_classes:
+            hwnd = win32gui.FindWindowEx(hwnd_parent, 0, class_name, None)
+            if hwnd:
+                return hwnd
+        return hwnd_parent
+
+    def click(self, hwnd_parent, point):
+        hwnd = self.target_window(hwnd_parent)
+        x, y = win32gui.ScreenToClient(hwnd, (int(point[0]), int(point[1])))
+        lparam = _make_lparam(x, y)
+        win32gui.PostMessage(hwnd, win32con.WM_MOUSEMOVE, 0, lparam)
+        win32gui.PostMessage(hwnd, win32con.WM_LBUTTONDOWN, win32con.MK_LBUTTON, lparam)
+        win32gui.PostMessage(hwnd, win32con.WM_LBUTTONUP, 0, lparam)
+        return True
+
+    async def click_async(self, hwnd_parent, point):
+        return self.click(hwnd_parent, point)  # Posting doesn't wait for the window.
+
+
+class PointerClick(ClickStrategy):
+    """The original click: moves the real cursor to the point, clicks and moves it back."""
+    name = "pointer"
+    moves_pointer = True
+    __lock = threading.Lock()  # One cursor per desktop.
+
+    def click(self, hwnd_parent, point):
+        with PointerClick.__lock:
+            saved_x, saved_y = pyautogui.position()
+            # win32gui.SetActiveWindow(hwnd)
+            pyautogui.click(point[0], point[1])
+            pyautogui.moveTo(saved_x, saved_y)
+        return True
+
+
+class FallbackClick(ClickStrategy):
+    """Tries strategies in order. With confirm a click only counts once it took effect within confirm_time seconds
+    (e.g. a new Save As dialog opened), otherwise the next strategy is tried. confirm(hwnd_parent) is called right
+    before each click and returns the predicate checked after it, so it can tell a new effect from an earlier one.
+    The strategy that worked last in a window is tried first next time in that window, unless it moves the
+    pointer."""
+    name = "fallback"
+
+    def __init__(self, strategies, confirm=None, confirm_time=3.0):
+        self.strategies = list(strategies)
+        self.confirm = confirm
+        self.confirm_time = confirm_time
+        self.last_strategy = None  # Name of the strategy used by the last successful click
+        self.__preferred = {}  # hwnd_parent: index into strategies
+        self.__lock = threading.Lock()
+
+    def preferred(self, hwnd_parent):
+        """Index of the strategy tried first in hwnd_parent."""
+        with self.__lock:
+            return self.__preferred.get(hwnd_parent, 0)
+
+    def __order(self, hwnd_parent):
+        preferred = self.preferred(hwnd_parent)
+        return [preferred] + [index for index in range(len(self.strategies)) if index != preferred]
+
+    def __worked(self, hwnd_parent, index):
+        strategy = self.strategies[index]
+        with self.__lock:
+            if strategy.moves_pointer:  # Worked this time, the next click still tries the others first.
+                self.__preferred.pop(hwnd_parent, None)
+            else:
+                self.__preferred[hwnd_parent] = index
+        self.last_strategy = strategy.name
+
+    def click(self, hwnd_parent, point):
+        for index in self.__order(hwnd_parent):
+            strategy = self.strategies[index]
+            confirmed = None if self.confirm is None else self.confirm(hwnd_parent)
+            try:
+                if not strategy.click(hwnd_parent, point):
+                    continue
+            except Exception as e:  # e.g. backend not available on this platform
+                _error_message(e, inspect.currentframe())
+                continue
+            if confirmed is None or wait_for_condition(confirmed, self.confirm_time, WINDOW_OPEN_EVENTS):
+                self.__worked(hwnd_parent, index)
+                return True
+            logging.warning(f"Click strategy {strategy.name} had no effect within {self.confirm_time} s")
+        return False
+
+    async def click_async(self, hwnd_parent, point):
+        for index in self.__order(hwnd_parent):
+            strategy = self.strategies[index]
+            confirmed = None if self.confirm is None else self.confirm(hwnd_parent)
+            try:
+                if not await strategy.click_async(hwnd_parent, point):
+                    continue
+            except Exception as e:  # e.g. backend not available on this platform
+                _error_message(e, inspect.currentframe())
+                continue
+            if confirmed is None or await wait_for_condition_async(confirmed, self.confirm_time, WINDOW_OPEN_EVENTS):
+                self.__worked(hwnd_parent, index)
+                return True
+            logging.warning(f"Click strategy {strategy.name} had no effect within {self.confirm_time} s")
+        return False
@@ -14,11 +14,17 @@ Common Dialog Box - methods to interact with Windows Common Dialog Boxes
 
 import os
 import inspect
-import win32con
-import win32gui
-from time import time
+import backends
 from time import sleep
 import logging
+import threading
+import collections
+from download_watch import DownloadCompletionDetector
+from phase_metrics import span, count_retry
+from window_events import wait_for_condition, wait_for_condition_async, WINDOW_OPEN_EVENTS, WINDOW_CLOSE_EVENTS
+from save_policy import DialogNotFoundError, DialogControlsNotFoundError, DialogCloseTimeoutError, \
+    DownloadTimeoutError
+from error_log import error_message as _error_message
 
 
 # class MsoFileDialogType(enum.IntEnum):
@@ -28,60 +34,295 @@ import logging
 #     # FileDialogFolderPicker = 4  # MSO
 
 
+class CommonDlgSession:
+    """State of one common dialog in flight: owner window, dialog handle, target path and timeouts.
+    Each SaveAsCommonDlg / OpenCommonDlg owns one, so several dialogs can be driven at the same time."""
+
+    def __init__(self, owner_hwnd=None, open_wait_time=120, close_wait_time=120, file_wait_time=300,
+                 discovery_wait_time=120):
+        self.owner_hwnd = owner_hwnd  # e.g. the browser hwnd passed to ClassPDFView. None matches any owner.
+        self.window_handle = None
+        self.file_path = ""
+        self.open_wait_time = open_wait_time
+        self.close_wait_time = close_wait_time
+        self.file_wait_time = file_wait_time
+        self.discovery_wait_time = discovery_wait_time  # Finding the dialog's controls once it is open.
+
+
+class CommonDlgSessionManager:
+    """Thread-safe registry of dialogs claimed by sessions. A newly opened dialog is handed to the session whose
+    owner window it belongs to, and never to two sessions at once."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__claimed = {}  # dialog hwnd -> CommonDlgSession
+        self.__claims = collections.Counter()  # (owner hwnd, caption) -> dialogs claimed so far
+
+    def __claim_window_function(self, session, class_name, caption):
+        """Returns a find_window function for _wait_for_window_open() that claims the first matching dialog."""
+        def claim_window():
+            with self.__lock:
+                for hwnd in list(self.__claimed):  # Forget dialogs that have since closed.
+                    if not win32gui.IsWindow(hwnd):
+                        del self.__claimed[hwnd]
+                for hwnd in _find_top_level_windows(class_name, caption):
+                    if hwnd in self.__claimed:
+                        continue
+                    owner_hwnd = win32gui.GetWindow(hwnd, win32con.GW_OWNER)
+                    if session.owner_hwnd is not None and owner_hwnd != session.owner_hwnd:
+                        continue
+                    self.__claimed[hwnd] = session
+                    self.__claims[owner_hwnd, caption] += 1
+                    return hwnd
+            return 0
+        return claim_window
+
+    def claim(self, session, class_name, caption, sleep_time=0.1, event_source=None):
+        """Waits for an unclaimed dialog owned by session.owner_hwnd, assigns it to the session and returns it."""
+        session.window_handle = _wait_for_window_open(class_name, caption, sleep_time, session.open_wait_time,
+                                                      event_source,
+                                                      self.__claim_window_function(session, class_name, caption))
+        return session.window_handle
+
+    async def claim_async(self, session, class_name, caption, sleep_time=0.1, event_source=None):
+        """Awaitable claim()."""
+        session.window_handle = await _wait_for_window_open_async(
+            class_name, caption, sleep_time, session.open_wait_time, event_source,
+            self.__claim_window_function(session, class_name, caption))
+        return session.window_handle
+
+    def claims(self, owner_hwnd, caption):
+        """Number of dialogs with caption owned by owner_hwnd claimed so far, including ones closed since."""
+        with self.__lock:
+            return self.__claims[owner_hwnd, caption]
+
+    def release(self, session):
+        with self.__lock:
+            if self.__claimed.get(session.window_handle) is session:
+                del self.__claimed[session.window_handle]
+
+    def dismiss(self, session, cancel_button_handle=0):
+        """Closes a dialog the session gave up on (Cancel, else WM_CLOSE) and releases it, so a retry gets a new
+        one instead of finding the modal dialog still in the way."""
+        try:
+            if session.window_handle and win32gui.IsWindow(session.window_handle):
+                if isinstance(cancel_button_handle, int) and cancel_button_handle and \
+                        win32gui.IsWindow(cancel_button_handle):  # Unset handles are the int class itself.
+                    win32gui.PostMessage(cancel_button_handle, win32con.BM_CLICK, 0, 0)
+                else:
+                    win32gui.PostMessage(session.window_handle, win32con.WM_CLOSE, 0, 0)
+        except Exception as e:
+            _error_message(e, inspect.currentframe())
+        self.release(session)
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported on first use, see backends.
+win32con = backends.register_module("win32con", "win32con")
+win32gui = backends.register_module("win32gui", "win32gui")
+
+"""Open dialog multi-select: the file name box takes several quoted paths ("C:\\a.pdf" "C:\\b.pdf") from one
+folder. Characters per dialog, kept well inside the file name buffer browsers give the dialog."""
+MULTI_SELECT_MAX_LENGTH = 2048
+
 """Global variables"""
-_common_dlg_window_handle = None
-_common_dlg_path = ""
+_session_manager = CommonDlgSessionManager()
+
 
+class WindowTreeIndex:
+    """Snapshot of a dialog's window tree. The tree is enumerated once and indexed by (parent, class, caption),
+    so path lookups cost one dict access per level instead of a full EnumChildWindows per level."""
 
-def _get_child_windows_by_class_and_caption_path_call_back(hwnd, param):
-    """Called by find_window_by_class_and_caption_path()."""
-    child_class_name = win32gui.GetClassName(hwnd)
-    child_text_name = win32gui.GetWindowText(hwnd)
-    child_text_name = None if child_text_name == "" else child_text_name
-    if param[0][2] == win32gui.GetParent(hwnd):
-        if param[0][0] == child_class_name and param[0][1] == child_text_name:
-            param[1].append(hwnd)  # Found
+    def __init__(self, hwnd_root):
+        self.hwnd_root = hwnd_root
+        self.__children = {}  # (hwnd_parent, class_name, caption) -> [hwnd, ...] in Z-order
+        win32gui.EnumChildWindows(hwnd_root, self.__add_window, None)
 
+    def __add_window(self, hwnd, _param):
+        caption = win32gui.GetWindowText(hwnd)
+        key = (win32gui.GetParent(hwnd), win32gui.GetClassName(hwnd), None if caption == "" else caption)
+        self.__children.setdefault(key, []).append(hwnd)
+        return True
+
+    def find_children(self, hwnd_parent, class_name, caption=None):
+        """Returns the direct children of hwnd_parent with the given class name and caption."""
+        return list(self.__children.get((hwnd_parent, class_name, caption), ()))
+
+    def find_path(self, hwnd_parent, element_path):
+        """Returns all hwnds reached by following element_path ([[class_name, caption], ...]) from hwnd_parent."""
+        hwnds = [hwnd_parent]
+        for class_name, caption in element_path:
+            hwnds = [hwnd for hwnd_level in hwnds for hwnd in self.find_children(hwnd_level, class_name, caption)]
+        return hwnds
+
+
+class ControlPathCache:
+    """Learned routes from a dialog to its controls. A route is the class name and ordinal (among siblings of the
+    same class) of every window between the dialog and the control, recorded after the first full discovery.
+    Later dialogs with the same layout resolve the control along the route with a few FindWindowEx calls and a
+    validation, instead of enumerating the whole tree. hits / misses count resolve() calls per dialog."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__routes = {}  # (dialog caption, control name) -> ((class_name, ordinal), ...)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def __route(hwnd_root, hwnd):
+        route = []
+        while hwnd and hwnd != hwnd_root:
+            hwnd_parent = win32gui.GetParent(hwnd)
+            class_name = win32gui.GetClassName(hwnd)
+            ordinal, sibling = 0, win32gui.FindWindowEx(hwnd_parent, 0, class_name, None)
+            while sibling and sibling != hwnd:
+                ordinal += 1
+                sibling = win32gui.FindWindowEx(hwnd_parent, sibling, class_name, None)
+            if not sibling:
+                return None
+            route.append((class_name, ordinal))
+            hwnd = hwnd_parent
+        return tuple(reversed(route)) if hwnd == hwnd_root else None
+
+    @staticmethod
+    def __follow(hwnd_root, route):
+        hwnd = hwnd_root
+        for class_name, ordinal in route:
+            hwnd_parent, hwnd = hwnd, 0
+            for _ in range(ordinal + 1):
+                hwnd = win32gui.FindWindowEx(hwnd_parent, hwnd, class_name, None)
+                if not hwnd:
+                    return 0
+        return hwnd
+
+    def record(self, dialog, hwnd_root, handles):
+        """Learns the routes to handles ({control name: hwnd}) found by a full discovery in dialog hwnd_root."""
+        try:
+            routes = {name: self.__route(hwnd_root, hwnd) for name, hwnd in handles.items() if hwnd}
+        except Exception as e:  # Dialog closed while recording, keep the previous routes.
+            _error_message(e, inspect.currentframe())
+            return
+        with self.__lock:
+            for name, route in routes.items():
+                if route is not None:
+                    self.__routes[(dialog, name)] = route
+
+    def resolve(self, dialog, hwnd_root, validators):
+        """validators: {control name: validate(hwnd) -> bool}. Returns {control name: hwnd} if every control is
+        found along its learned route and validates (a hit), otherwise None (a miss, do a full discovery)."""
+        with self.__lock:
+            routes = {name: self.__routes.get((dialog, name)) for name in validators}
+        handles = None
+        if None not in routes.values():
+            try:
+                handles = {name: self.__follow(hwnd_root, route) for name, route in routes.items()}
+                if not all(hwnd and validators[name](hwnd) for name, hwnd in handles.items()):
+                    handles = None
+            except Exception:  # Invalid handle: dialog layout changed or closed, fall back to discovery.
+                handles = None
+        with self.__lock:
+            if handles is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return handles
+
+    def forget(self, dialog=None):
+        """Drops the routes of one dialog (all dialogs if None), e.g. after a Windows update changed the layout."""
+        with self.__lock:
+            for key in [key for key in self.__routes if dialog is None or key[0] == dialog]:
+                del self.__routes[key]
+
+    def stats(self):
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "routes": len(self.__routes)}
+
+
+"""Global variables"""
+_control_path_cache = ControlPathCache()
 
-def _get_child_windows_by_class_and_caption_path(hwnd_parent, element_path):
+
+def get_control_path_cache():
+    """Returns the process wide ControlPathCache shared by all SaveAsCommonDlg / OpenCommonDlg instances."""
+    return _control_path_cache
+
+
+def _get_child_windows_by_class_and_caption_path(hwnd_parent, element_path, window_tree=None):
     """Returns a list containing the hwnd of all child window items
     found matching the class name and caption from ordered list passed into element_path"""
     # noinspection SpellCheckingInspection
     """Class names found using uuspy.exe Source:https://uuware.com/st_l.en/st_p2.uw_spy.html"""
-    element_path.append(["Final", "Result"])
-    element_path[0].append(hwnd_parent)
-    while len(element_path) > 1:
-        while len(element_path[0][2:]) > 0:
-            win32gui.EnumChildWindows(element_path[0][2], _get_child_windows_by_class_and_caption_path_call_back,
-                                      element_path)
-            del element_path[0][2]
-        del element_path[0]
-    return element_path[0][2:]
+    """Pass window_tree (WindowTreeIndex) to reuse one enumeration across several lookups."""
+    if window_tree is None:
+        window_tree = WindowTreeIndex(hwnd_parent)
+    return window_tree.find_path(hwnd_parent, element_path)
 
 
-def _error_message(e, details):
-    calling_function_name = inspect.getframeinfo(details).function
-    logging.error("The exception type is:", type(e), f"An error occurred in function: "
-                                                     f"{calling_function_name}", f"Error details: {e}")
+def _find_top_level_windows(class_name, caption):
+    """Returns all top level windows with the given class name and caption."""
+    hwnds = []
 
+    def call_back(hwnd, _param):
+        if win32gui.GetClassName(hwnd) == class_name and win32gui.GetWindowText(hwnd) == caption:
+            hwnds.append(hwnd)
+        return True
+
+    win32gui.EnumWindows(call_back, None)
+    return hwnds
+
+
+def find_owned_windows(owner_hwnd, class_name, caption):
+    """Returns the top level windows with the given class name and caption owned by owner_hwnd."""
+    return [hwnd for hwnd in _find_top_level_windows(class_name, caption)
+            if win32gui.GetWindow(hwnd, win32con.GW_OWNER) == owner_hwnd]
+
+
+def dialogs_claimed(owner_hwnd, caption):
+    """Number of dialogs with caption owned by owner_hwnd that sessions (e.g. a DialogResponder's) have claimed."""
+    return _session_manager.claims(owner_hwnd, caption)
 
-def _wait_for_window_open(class_name, caption, sleep_time=0.1, wait_time=120):
-    """Waits for a window with the given caption to open and returns its window handle."""
-    """Can return incorrect window if multiple are open at the same time."""
-    try:
-        start_time = time()  # Seconds
-        hwnd_save_as = 0
-        while not win32gui.IsWindow(hwnd_save_as) and (time() - start_time) < wait_time:
-            hwnd_save_as = win32gui.FindWindowEx(0, 0, class_name, caption)
-            # print(win32gui.IsWindowVisible(hwnd_save_as))
 
+def _first_window_function(class_name, caption):
+    """Returns a find_window function for _wait_for_window_open() that accepts the first matching window."""
+    def find_first_window():
+        hwnd = win32gui.FindWindowEx(0, 0, class_name, caption)
+        return hwnd if hwnd and win32gui.IsWindow(hwnd) else 0
+    return find_first_window
+
+
+def _counting_retries(attempt, phase):
+    """Wraps a retried attempt for wait_for_condition(), counting every unsuccessful call as a retry of phase."""
+    def counted_attempt():
+        if attempt():
+            return True
+        count_retry(phase)
+    return counted_attempt
+
+
+def _wait_for_window_open(class_name, caption, sleep_time=0.1, wait_time=120, event_source=None, find_window=None):
+    """Waits for a window with the given caption to open and returns its window handle."""
+    """Can return incorrect window if multiple are open at the same time, pass find_window (see
+    CommonDlgSessionManager.claim) to pick the right one."""
+    """Sleeps on window create/show events (see window_events) instead of spinning on FindWindowEx."""
+    """Raises DialogNotFoundError after wait_time seconds."""
+    with span("window_open"):
+        find_window = _first_window_function(class_name, caption) if find_window is None else find_window
+        hwnd_save_as = wait_for_condition(find_window, wait_time, WINDOW_OPEN_EVENTS, event_source) or 0
         if hwnd_save_as == 0:
-            raise TimeoutError("A timeout error occurred in: wait_for_window_to_close()")
-        else:
-            sleep(sleep_time)  # If not here edit_handle isn't set.
-            return hwnd_save_as
-    except Exception as e:
-        _error_message(e, inspect.currentframe())
+            raise DialogNotFoundError(f"{caption} dialog did not open within {wait_time} s")
+        sleep(sleep_time)  # If not here edit_handle isn't set.
+        return hwnd_save_as
+
+
+def prepare_save_path(file_path, make_directory=True, file_overwrite=True):
+    """Creates the target directory / removes an existing file as requested and returns True if the directory
+    exists. These checks are necessary to avoid additional pop-up dialog boxes."""
+    if not os.path.exists(os.path.dirname(file_path)):  # Check directory.
+        if make_directory:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)  # Proceed if path already exists.
+    elif os.path.exists(file_path) and file_overwrite:
+        os.remove(file_path)
+    return os.path.exists(os.path.dirname(file_path))
 
 
 def _get_text_from_dialog_box(hwnd):
@@ -101,38 +342,137 @@ def _get_text_from_dialog_box(hwnd):
         _error_message(e, inspect.currentframe())
 
 
-def _wait_for_window_close(sleep_time=0.1, wait_time=120):
+def _get_window_text(hwnd):
+    """Full text of a control, however long (_get_text_from_dialog_box() reads up to 511 characters)."""
+    length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
+    buffer = win32gui.PyMakeBuffer(2 * (length + 1))
+    result = win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
+    return buffer.tobytes().decode("utf-16", errors="replace")[:result]
+
+
+def _set_edit_text_function(hwnd, text):
+    """Returns a predicate for wait_for_condition() that sets the text and is True once the control reads it back.
+    An Edit that is not ready yet drops the text or has it replaced while the dialog initializes."""
+    def set_edit_text():
+        win32gui.SendMessage(hwnd, win32con.WM_SETTEXT, 0, text)
+        return _get_window_text(hwnd) == text
+    return set_edit_text
+
+
+def _set_edit_text(hwnd, text, wait_time=10, sleep_time=0.05):
+    """Sets the text of an Edit as soon as it accepts it. Raises DialogControlsNotFoundError after wait_time."""
+    with span("set_text"):
+        if not wait_for_condition(_set_edit_text_function(hwnd, text), wait_time, WINDOW_OPEN_EVENTS,
+                                  poll_time=sleep_time, blocking=True):  # SendMessage, see poll_scheduler
+            raise DialogControlsNotFoundError(f"File name box did not accept the text within {wait_time} s")
+
+
+async def _set_edit_text_async(hwnd, text, wait_time=10, sleep_time=0.05):
+    """Awaitable _set_edit_text()."""
+    with span("set_text"):
+        if not await wait_for_condition_async(_set_edit_text_function(hwnd, text), wait_time, WINDOW_OPEN_EVENTS,
+                                              poll_time=sleep_time, blocking=True):
+            raise DialogControlsNotFoundError(f"File name box did not accept the text within {wait_time} s")
+
+
+def multi_select_chunks(file_paths, max_length=MULTI_SELECT_MAX_LENGTH):
+    """Splits file_paths into the selections for OpenCommonDlg.open_many(), one Open dialog each: paths from one
+    folder, whose multi_select_text() stays within max_length characters. Order within a folder is kept."""
+    folders = {}
+    for file_path in file_paths:
+        file_path = os.path.abspath(file_path)
+        folders.setdefault(os.path.dirname(file_path), []).append(file_path)
+    chunks = []
+    for paths in folders.values():
+        chunk, length = [], 0
+        for path in paths:
+            entry_length = len(path) + 3  # Quotes and separating space.
+            if chunk and length + entry_length > max_length:
+                chunks.append(chunk)
+                chunk, length = [], 0
+            chunk.append(path)
+            length += entry_length
+        chunks.append(chunk)
+    return chunks
+
+
+def multi_select_text(file_paths):
+    """File name box text selecting file_paths (one folder). A single path is entered as it is."""
+    if len(file_paths) == 1:
+        return file_paths[0]
+    return " ".join(f'"{file_path}"' for file_path in file_paths)
+
+
+def _wait_for_window_close(window_handle, sleep_time=0.1, wait_time=120, event_source=None):
     """Waits for a window with the given handle to close."""
     """Before closing window verify file path to avoid additional popup windows:"""
     """'Path doesn't' exist & 'File Overwrite'"""
-    try:
-        start_time = time()  # Seconds
-        global _common_dlg_window_handle
-        while win32gui.IsWindow(_common_dlg_window_handle) and (time() - start_time) < wait_time:
-            sleep(sleep_time)
-        if win32gui.IsWindow(_common_dlg_window_handle):
-            raise TimeoutError("A timeout error occurred in: wait_for_window_to_close()")
-        else:
-            return True
-    except Exception as e:
-        _error_message(e, inspect.currentframe())
+    """Woken by window destroy/hide events, sleep_time is only used when no event source is available."""
+    """Raises DialogCloseTimeoutError after wait_time seconds."""
+    with span("window_close"):
+        wait_for_condition(lambda: not win32gui.IsWindow(window_handle), wait_time,
+                           WINDOW_CLOSE_EVENTS, event_source, poll_time=sleep_time)
+        if win32gui.IsWindow(window_handle):
+            raise DialogCloseTimeoutError(f"Dialog did not close within {wait_time} s")
+        return True
 
 
-def _wait_for_file_exist(sleep_time=0.1, wait_time=120):
-    try:
-        start_time = time()  # Seconds
-        global _common_dlg_path
-        while not os.path.isfile(_common_dlg_path) and (time() - start_time) < wait_time:
-            sleep(sleep_time)
-        if not os.path.isfile(_common_dlg_path):
-            raise TimeoutError("A timeout error occurred in: wait_for_file_download()")
-        else:
-            return True
-    except Exception as e:
-        _error_message(e, inspect.currentframe())
+def _wait_for_file_exist(file_path, sleep_time=0.1, wait_time=120):
+    """Waits for the download to file_path to complete (see download_watch), not just for the file to appear.
+    Raises DownloadTimeoutError after wait_time seconds."""
+    detector = DownloadCompletionDetector(file_path, poll_time=sleep_time)
+    with span("file_wait"):
+        try:
+            detector.wait(wait_time)
+        except TimeoutError:
+            raise DownloadTimeoutError(f"Download of {file_path} not complete within {wait_time} s") from None
+    logging.info(f"Downloaded: {file_path} ({detector.size} bytes, {detector.bytes_per_second:.0f} bytes/s)")
+    return True
+
+
+async def _wait_for_window_open_async(class_name, caption, sleep_time=0.1, wait_time=120, event_source=None,
+                                      find_window=None):
+    """Awaitable _wait_for_window_open(). Raises DialogNotFoundError."""
+    with span("window_open"):
+        find_window = _first_window_function(class_name, caption) if find_window is None else find_window
+        hwnd = await wait_for_condition_async(find_window, wait_time, WINDOW_OPEN_EVENTS, event_source) or 0
+        if hwnd == 0:
+            raise DialogNotFoundError(f"{caption} dialog did not open within {wait_time} s")
+        await asyncio.sleep(sleep_time)  # If not here edit_handle isn't set.
+        return hwnd
+
+
+async def _wait_for_window_close_async(window_handle, sleep_time=0.1, wait_time=120, event_source=None):
+    """Awaitable _wait_for_window_close(). Raises DialogCloseTimeoutError."""
+    with span("window_close"):
+        if not await wait_for_condition_async(lambda: not win32gui.IsWindow(window_handle), wait_time,
+                                              WINDOW_CLOSE_EVENTS, event_source, poll_time=sleep_time):
+            raise DialogCloseTimeoutError(f"Dialog did not close within {wait_time} s")
+        return True
+
+
+async def _wait_for_file_exist_async(file_path, sleep_time=0.1, wait_time=120):
+    """Awaitable _wait_for_file_exist(). Raises DownloadTimeoutError."""
+    with span("file_wait"):
+        try:
+            return await DownloadCompletionDetector(file_path, poll_time=sleep_time).wait_async(wait_time)
+        except TimeoutError:
+            raise DownloadTimeoutError(f"Download of {file_path} not complete within {wait_time} s") from None
+
+
+def _existing_files(file_paths):
+    """Returns file_paths as a list, raises FileNotFoundError naming every path that isn't a file."""
+    file_paths = list(file_paths)
+    if not file_paths:
+        raise ValueError("No files to open")
+    missing = [file_path for file_path in file_paths if not os.path.isfile(file_path)]
+    if missing:
+        raise FileNotFoundError(f"{len(missing)} of {len(file_paths)} files not found: {', '.join(missing)}")
+    return file_paths
 
 
 class OpenCommonDlg:
+    __window_tree = None  # WindowTreeIndex
     __open_file_name_handle = int
     __open_type_handle = int
     __open_open_button_handle = int
@@ -144,41 +484,124 @@ class OpenCommonDlg:
         found dialog box find_and_confirm_OK_button() sleep(sleep_time)
         """
         if os.path.isfile(file_path):
-            self.file_path = file_path
-            try:  # Open Window
-                # win32gui.SetActiveWindow(self.window_handle)
-                sleep(.5)
-                win32gui.SendMessage(self.open_file_name_handle, win32con.WM_SETTEXT, 0, self.file_path)
-                win32gui.SendMessage(self.open_open_button_handle, win32con.BM_CLICK, 0, 0)  # Open
-                # win32gui.SendMessage(self.save_as_cancel_button_handle, win32con.BM_CLICK, 0, 0)
-
-                _wait_for_window_close()
-                return
-            except Exception as e:
-                _error_message(e, inspect.currentframe())
+            self.__open(file_path)
         else:
             raise FileNotFoundError()
 
-    def __set_open_window_handles(self, sleep_time=0.1, wait_time=120):
+    def open_many(self, file_paths, max_length=MULTI_SELECT_MAX_LENGTH):
+        """Selects several files in this one Open dialog (the page's file input must accept multiple files).
+        Every path is checked before the dialog is touched. One dialog takes the first selection of
+        multi_select_chunks(), the paths that didn't fit (other folders, too long) are returned for the next one."""
+        chunks = multi_select_chunks(_existing_files(file_paths), max_length)
+        self.__open(multi_select_text(chunks[0]))
+        return [file_path for chunk in chunks[1:] for file_path in chunk]
+
+    async def open_window_interact_async(self, file_path):
+        """Awaitable open_window_interact()."""
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError()
+        await self.__open_async(file_path)
+
+    async def open_many_async(self, file_paths, max_length=MULTI_SELECT_MAX_LENGTH):
+        """Awaitable open_many()."""
+        chunks = multi_select_chunks(_existing_files(file_paths), max_length)
+        await self.__open_async(multi_select_text(chunks[0]))
+        return [file_path for chunk in chunks[1:] for file_path in chunk]
+
+    def __open(self, text):
+        """Enters text in the file name box once it is ready, confirms and waits for the dialog to close."""
+        self.file_path = text
+        try:  # Open Window
+            # win32gui.SetActiveWindow(self.window_handle)
+            _set_edit_text(self.open_file_name_handle, text, self.session.discovery_wait_time)
+            self.__confirm_open(text)
+            _wait_for_window_close(self.window_handle, wait_time=self.session.close_wait_time)
+        except Exception:
+            _session_manager.dismiss(self.session, self.open_cancel_button_handle)
+            raise
+        _session_manager.release(self.session)
+
+    async def __open_async(self, text):
+        self.file_path = text
+        try:
+            await _set_edit_text_async(self.open_file_name_handle, text, self.session.discovery_wait_time)
+            self.__confirm_open(text)
+            await _wait_for_window_close_async(self.window_handle, wait_time=self.session.close_wait_time)
+        except Exception:
+            _session_manager.dismiss(self.session, self.open_cancel_button_handle)
+            raise
+        _session_manager.release(self.session)
+
+    def __confirm_open(self, text, attempts=3):
+        """Clicks Open once the file name box still reads text. Read right before the click: a dialog that is still
+        initializing can replace the text after _set_edit_text() read it back, it is then set again. Raises
+        DialogControlsNotFoundError if it doesn't keep the text."""
+        for _attempt in range(attempts):
+            if _get_window_text(self.open_file_name_handle) == text:
+                win32gui.SendMessage(self.open_open_button_handle, win32con.BM_CLICK, 0, 0)  # Open
+                return
+            win32gui.SendMessage(self.open_file_name_handle, win32con.WM_SETTEXT, 0, text)
+        raise DialogControlsNotFoundError("File name box did not keep the text")
+        # win32gui.SendMessage(self.save_as_cancel_button_handle, win32con.BM_CLICK, 0, 0)
+
+    def __set_open_window_handles(self, sleep_time=0.1):
         """Keep trying to set these until successful or time runs out."""
-        start_time = time()  # Seconds
-        while True and (time() - start_time) < wait_time:
-            try:
-                if self.__set_open_open_button_handle():
-                    if self.__set_open_cancel_button_handle():
-                        if self.__set_open_file_name_handle():
-                            if self.__set_open_type_handle():
-                                return True
-            except TimeoutError:
-                pass
-                # print("The function timed out after {} seconds.".format(wait_time))
-                # return None
-            sleep(sleep_time)
+        """Retried on the shared PollScheduler, right away when controls are created, else backing off up to
+        sleep_time. Raises DialogControlsNotFoundError after session.discovery_wait_time seconds."""
+        with span("handle_discovery"):
+            if wait_for_condition(_counting_retries(self.__try_set_open_window_handles, "handle_discovery"),
+                                  self.session.discovery_wait_time, WINDOW_OPEN_EVENTS, poll_time=sleep_time):
+                return True
+            raise DialogControlsNotFoundError(f"Dialog controls not found within "
+                                              f"{self.session.discovery_wait_time} s")
+
+    async def __set_open_window_handles_async(self, sleep_time=0.1):
+        """Awaitable __set_open_window_handles()."""
+        with span("handle_discovery"):
+            if await wait_for_condition_async(
+                    _counting_retries(self.__try_set_open_window_handles, "handle_discovery"),
+                    self.session.discovery_wait_time, WINDOW_OPEN_EVENTS, poll_time=sleep_time):
+                return True
+            raise DialogControlsNotFoundError(f"Dialog controls not found within "
+                                              f"{self.session.discovery_wait_time} s")
+
+    def __try_set_open_window_handles(self):
+        if self.__try_set_open_window_handles_cached():
+            return True
+        try:
+            self.__window_tree = WindowTreeIndex(self.window_handle)  # One walk shared by all lookups.
+            if self.__set_open_open_button_handle():
+                if self.__set_open_cancel_button_handle():
+                    if self.__set_open_file_name_handle():
+                        if self.__set_open_type_handle():
+                            _control_path_cache.record("Open", self.window_handle, {
+                                "open_button": self.open_open_button_handle,
+                                "cancel_button": self.open_cancel_button_handle,
+                                "file_name": self.open_file_name_handle, "type": self.open_type_handle})
+                            return True
+        except (TimeoutError, IndexError):  # IndexError: dialog tree not complete yet.
+            pass
+            # print("The function timed out after {} seconds.".format(wait_time))
+            # return None
+
+    def __try_set_open_window_handles_cached(self):
+        """Resolves the controls along the routes learned from an earlier Open dialog (see ControlPathCache)."""
+        handles = _control_path_cache.resolve("Open", self.window_handle, {
+            "open_button": lambda hwnd: win32gui.GetWindowText(hwnd) == "&Open",
+            "cancel_button": lambda hwnd: win32gui.GetWindowText(hwnd) == "Cancel",
+            "file_name": win32gui.IsWindow, "type": win32gui.IsWindow})
+        if handles is None:
+            return False
+        self.open_open_button_handle = handles["open_button"]
+        self.open_cancel_button_handle = handles["cancel_button"]
+        self.open_file_name_handle = handles["file_name"]
+        self.open_type_handle = handles["type"]
+        return True
 
     def __set_open_file_name_handle(self):
         element_path = [["ComboBoxEx32", None], ["ComboBox", None], ["Edit", None]]
         # noinspection SpellCheckingInspection
-        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path)
+        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path, self.__window_tree)
         if len(hwnds) > 1:
             raise IndexError
         else:
@@ -188,7 +611,7 @@ class OpenCommonDlg:
     def __set_open_type_handle(self):
         element_path = [["ComboBox", None]]
         # noinspection SpellCheckingInspection
-        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path)
+        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path, self.__window_tree)
         if len(hwnds) > 1:
             raise IndexError
         else:
@@ -197,19 +620,39 @@ class OpenCommonDlg:
 
     def __set_open_open_button_handle(self):
         """Get the handle to the child window with the class name "Button" and caption &Open (top level)"""
-        self.open_open_button_handle = win32gui.FindWindowEx(self.window_handle, None, "Button", "&Open")
+        hwnds = self.__window_tree.find_children(self.window_handle, "Button", "&Open")
+        self.open_open_button_handle = hwnds[0] if hwnds else 0
         return True
 
     def __set_open_cancel_button_handle(self):
         """Get the handle to the child window with the class name "Button" and caption &Save (top level)"""
-        self.open_cancel_button_handle = win32gui.FindWindowEx(self.window_handle, None, "Button", "Cancel")
+        hwnds = self.__window_tree.find_children(self.window_handle, "Button", "Cancel")
+        self.open_cancel_button_handle = hwnds[0] if hwnds else 0
         return True
 
-    def __init__(self):
-        """The constructor for the class."""
+    def __init__(self, owner_hwnd=None, session=None):
+        """The constructor for the class. owner_hwnd restricts the dialog to the one opened by that window."""
         # self.dlg_type = MsoFileDialogType.FileDialogOpen
-        self.window_handle = _wait_for_window_open("#32770", "Open")
-        self.__set_open_window_handles()
+        self.session = CommonDlgSession(owner_hwnd) if session is None else session
+        _session_manager.claim(self.session, "#32770", "Open")
+        try:
+            self.__set_open_window_handles()
+        except DialogControlsNotFoundError:
+            _session_manager.dismiss(self.session)
+            raise
+
+    @classmethod
+    async def create_async(cls, owner_hwnd=None, session=None):
+        """Awaitable constructor: waits for the Open dialog and its controls without blocking the event loop."""
+        self = cls.__new__(cls)
+        self.session = CommonDlgSession(owner_hwnd) if session is None else session
+        await _session_manager.claim_async(self.session, "#32770", "Open")
+        try:
+            await self.__set_open_window_handles_async()
+        except DialogControlsNotFoundError:
+            _session_manager.dismiss(self.session)
+            raise
+        return self
 
     """__save_as_file_name_handle"""
     @property  # Get
@@ -247,7 +690,7 @@ class OpenCommonDlg:
     def cancel_button_handle(self, cancel_button_handle):
         self.__open_cancel_button_handle = cancel_button_handle
 
-    """___Global accessors___"""
+    """___Session accessors___"""
     """__common_dlg_type"""
     # @property  # Get
     # def dlg_type(self):
@@ -259,98 +702,174 @@ class OpenCommonDlg:
     #     global __common_dlg_type
     #     __common_dlg_type = dlg_type
 
-    """_common_dlg_window_handle"""
+    """session.window_handle"""
     @property  # Get
     def window_handle(self):
-        # _common_dlg_window_handle
-        return _common_dlg_window_handle
+        return self.session.window_handle
 
     @window_handle.setter  # Set
     def window_handle(self, window_handle):
-        global _common_dlg_window_handle
-        _common_dlg_window_handle = window_handle
+        self.session.window_handle = window_handle
 
-    """__common_dlg_file_path"""
+    """session.file_path"""
     @property  # Get
     def file_path(self):
-        global _common_dlg_path
-        return _common_dlg_path
+        return self.session.file_path
 
     @file_path.setter  # Set
     def file_path(self, file_path):
-        global _common_dlg_path
-        _common_dlg_path = file_path
+        self.session.file_path = file_path
 
 
 class SaveAsCommonDlg:
+    __window_tree = None  # WindowTreeIndex
     __save_as_file_name_handle = int
     __save_as_type_handle = int
     __save_as_save_button_handle = int
     __save_as_cancel_button_handle = int
 
-    def save_as_window_interact(self, file_path, make_directory=True, file_overwrite=True):
+    def save_as_window_interact(self, file_path, make_directory=True, file_overwrite=True, wait_for_file=True,
+                                staging=None):
         """Overwrite dialog box if overwrite_files:
         find_and_confirm_yes_button() else: find_and_confirm_no_button()
         # Do not overwrite files. Path not
         found dialog box find_and_confirm_OK_button() sleep(sleep_time)
+        wait_for_file=False returns once the dialog has closed, the caller then waits for the download itself.
+        staging: a staging.StagingArea. The dialog saves into its local directory and the file is moved to
+        file_path in the background, the transfer's Future is returned (None when an existing file_path is kept).
+        make_directory / file_overwrite are checked against file_path before the dialog is confirmed.
+        Raises the SaveError of the phase that failed (see save_policy), a dialog left open is cancelled.
         """
-        # These checks are necessary to avoid additional pop-up dialog boxes.
-        if not os.path.exists(os.path.dirname(file_path)):  # Check directory.
-            if make_directory:
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)  # Proceed if path already exists.
-        elif os.path.exists(file_path) and file_overwrite:
-            os.remove(file_path)
-
-        if os.path.exists(os.path.dirname(file_path)):  # Does file path exist.
+        try:  # Save As Window
+            save_path = self.__prepare_file_path(file_path, make_directory, file_overwrite, staging)
+            saved = self.__confirm_save_as(save_path, file_path, file_overwrite)
+            _wait_for_window_close(self.window_handle, wait_time=self.session.close_wait_time)
+        except Exception:
+            _session_manager.dismiss(self.session, self.cancel_button_handle)
+            raise
+        _session_manager.release(self.session)
+        if wait_for_file and saved:
+            _wait_for_file_exist(self.file_path, 0.1, self.session.file_wait_time)
+        if staging is not None and saved:
+            return staging.transfer(self.file_path, file_path, make_directory, file_overwrite,
+                                    self.session.file_wait_time)
+
+    async def save_as_window_interact_async(self, file_path, make_directory=True, file_overwrite=True,
+                                            wait_for_file=True, staging=None):
+        """Awaitable save_as_window_interact(). Cancelling the awaiting task stops the waits but leaves the dialog
+        to finish on its own. With staging the transfer's Future is returned."""
+        try:
+            save_path = self.__prepare_file_path(file_path, make_directory, file_overwrite, staging)
+            saved = self.__confirm_save_as(save_path, file_path, file_overwrite)
+            await _wait_for_window_close_async(self.window_handle, wait_time=self.session.close_wait_time)
+        except Exception:
+            _session_manager.dismiss(self.session, self.cancel_button_handle)
+            raise
+        _session_manager.release(self.session)
+        if wait_for_file and saved:
+            await _wait_for_file_exist_async(self.file_path, 0.1, self.session.file_wait_time)
+        if staging is not None and saved:  # transfer() can block on max_in_flight_bytes, keep it off the loop.
+            return await asyncio.to_thread(staging.transfer, self.file_path, file_path, make_directory,
+                                           file_overwrite, self.session.file_wait_time)
+
+    def __prepare_file_path(self, file_path, make_directory, file_overwrite, staging):
+        """Sets and returns self.file_path, the path typed into the dialog: file_path, or a local staging path for
+        it. The directory of file_path is created / checked either way, raises FileNotFoundError when it is
+        missing."""
+        if staging is not None:
+            staging.prepare_destination(file_path, make_directory)  # Cached, no makedirs per file.
+            self.file_path = staging.local_path(file_path)
+        elif prepare_save_path(file_path, make_directory, file_overwrite):  # Does file path exist.
             self.file_path = file_path
-            try:  # Save As Window
-                win32gui.SendMessage(self.file_name_handle, win32con.WM_SETTEXT, 0, self.file_path)
-                # sleep(0.25)
-                if os.path.exists(file_path) and not file_overwrite:
-                    win32gui.SendMessage(self.cancel_button_handle, win32con.BM_CLICK, 0, 0)
-                else:
-                    win32gui.SendMessage(self.save_button_handle, win32con.BM_CLICK, 0, 0)
-                    # win32gui.SendMessage(self.save_as_cancel_button_handle, win32con.BM_CLICK, 0, 0)
-                    logging.info("Downloading: " + self.file_path)
-                _wait_for_window_close()
-                _wait_for_file_exist(0.1, 300)
-            except Exception as e:
-                _error_message(e, inspect.currentframe())
-                return
         else:
-            raise FileNotFoundError()
+            raise FileNotFoundError(f"Directory does not exist: {os.path.dirname(file_path)}")
+        return self.file_path
+
+    def __confirm_save_as(self, save_path, destination, file_overwrite):
+        """Types save_path and clicks Save, or Cancel when destination exists and file_overwrite is False.
+        Returns True if Save was clicked."""
+        with span("set_text"):
+            win32gui.SendMessage(self.file_name_handle, win32con.WM_SETTEXT, 0, save_path)
+        # sleep(0.25)
+        if os.path.exists(destination) and not file_overwrite:
+            win32gui.SendMessage(self.cancel_button_handle, win32con.BM_CLICK, 0, 0)
+            return False
+        win32gui.SendMessage(self.save_button_handle, win32con.BM_CLICK, 0, 0)
+        # win32gui.SendMessage(self.save_as_cancel_button_handle, win32con.BM_CLICK, 0, 0)
+        logging.info("Downloading: " + save_path)
+        return True
 
-    def __set_save_as_window_handles(self, sleep_time=0.1, wait_time=120):
+    def __set_save_as_window_handles(self, sleep_time=0.1):
         """Keep trying to set these until successful or time runs out."""
-        start_time = time()  # Seconds
-        while True and (time() - start_time) < wait_time:
-            try:
-                if self.__set_save_as_button_handle():
-                    if self.__set_save_as_cancel_button_handle():  # if self.__set_save_as_cancel_button_handle():
-                        if self.__set_save_as_file_name_handle():
-                            if self.__set_save_as_type_handle():
-                                return True
-            except TimeoutError:
-                pass
-                # print("The function timed out after {} seconds.".format(wait_time))
-                # return None
-            sleep(sleep_time)
+        """Retried on the shared PollScheduler, right away when controls are created, else backing off up to
+        sleep_time. Raises DialogControlsNotFoundError after session.discovery_wait_time seconds."""
+        with span("handle_discovery"):
+            if wait_for_condition(_counting_retries(self.__try_set_save_as_window_handles, "handle_discovery"),
+                                  self.session.discovery_wait_time, WINDOW_OPEN_EVENTS, poll_time=sleep_time):
+                return True
+            raise DialogControlsNotFoundError(f"Dialog controls not found within "
+                                              f"{self.session.discovery_wait_time} s")
+
+    async def __set_save_as_window_handles_async(self, sleep_time=0.1):
+        """Awaitable __set_save_as_window_handles()."""
+        with span("handle_discovery"):
+            if await wait_for_condition_async(
+                    _counting_retries(self.__try_set_save_as_window_handles, "handle_discovery"),
+                    self.session.discovery_wait_time, WINDOW_OPEN_EVENTS, poll_time=sleep_time):
+                return True
+            raise DialogControlsNotFoundError(f"Dialog controls not found within "
+                                              f"{self.session.discovery_wait_time} s")
+
+    def __try_set_save_as_window_handles(self):
+        if self.__try_set_save_as_window_handles_cached():
+            return True
+        try:
+            self.__window_tree = WindowTreeIndex(self.window_handle)  # One walk shared by all lookups.
+            if self.__set_save_as_button_handle():
+                if self.__set_save_as_cancel_button_handle():  # if self.__set_save_as_cancel_button_handle():
+                    if self.__set_save_as_file_name_handle():
+                        if self.__set_save_as_type_handle():
+                            _control_path_cache.record("Save As", self.window_handle, {
+                                "save_button": self.save_button_handle, "cancel_button": self.cancel_button_handle,
+                                "file_name": self.file_name_handle, "type": self.type_handle})
+                            return True
+        except (TimeoutError, IndexError):  # IndexError: dialog tree not complete yet.
+            pass
+            # print("The function timed out after {} seconds.".format(wait_time))
+            # return None
+
+    def __try_set_save_as_window_handles_cached(self):
+        """Resolves the controls along the routes learned from an earlier Save As dialog (see ControlPathCache)."""
+        handles = _control_path_cache.resolve("Save As", self.window_handle, {
+            "save_button": lambda hwnd: win32gui.GetWindowText(hwnd) == "&Save",
+            "cancel_button": lambda hwnd: win32gui.GetWindowText(hwnd) == "Cancel",
+            "file_name": lambda hwnd: _get_text_from_dialog_box(hwnd) is not None,
+            "type": lambda hwnd: not win32gui.FindWindowEx(hwnd, 0, "Edit", None)})  # Only 'File name' has one.
+        if handles is None:
+            return False
+        self.save_button_handle = handles["save_button"]
+        self.cancel_button_handle = handles["cancel_button"]
+        self.file_name_handle = handles["file_name"]
+        self.type_handle = handles["type"]
+        return True
 
     def __set_save_as_button_handle(self,):
         """Get the handle to the child window with the class name "Button" and caption &Save (top level)"""
-        self.save_button_handle = win32gui.FindWindowEx(self.window_handle, None, "Button", "&Save")
+        hwnds = self.__window_tree.find_children(self.window_handle, "Button", "&Save")
+        self.save_button_handle = hwnds[0] if hwnds else 0
         return True
 
     def __set_save_as_cancel_button_handle(self):
         """Get the handle to the child window with the class name "Button" and caption Cancel (top level)"""
-        self.cancel_button_handle = win32gui.FindWindowEx(self.window_handle, None, "Button", "Cancel")
+        hwnds = self.__window_tree.find_children(self.window_handle, "Button", "Cancel")
+        self.cancel_button_handle = hwnds[0] if hwnds else 0
         return True
 
     def __set_save_as_file_name_handle(self):
         element_path = [["DUIViewWndClassName", None], ["DirectUIHWND", None], ["FloatNotifySink", None],
                         ["ComboBox", None], ["Edit", None]]
         # noinspection SpellCheckingInspection
-        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path)
+        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path, self.__window_tree)
         for hwnd in hwnds:  # It looks like there is only 1.
             if not _get_text_from_dialog_box(hwnd) is None:
                 self.file_name_handle = hwnd
@@ -360,18 +879,35 @@ class SaveAsCommonDlg:
         element_path = [["DUIViewWndClassName", None], ["DirectUIHWND", None],
                         ["FloatNotifySink", None], ["ComboBox", None]]
         # noinspection SpellCheckingInspection
-        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path)
+        hwnds = _get_child_windows_by_class_and_caption_path(self.window_handle, element_path, self.__window_tree)
         for hwnd in hwnds:  # Look for child, which only exits in 'File name' field.
-            if len(_get_child_windows_by_class_and_caption_path(hwnd, [["Edit", None]])) == 0:
+            if len(self.__window_tree.find_children(hwnd, "Edit")) == 0:
                 # if "Adobe Acrobat Document (*.pdf)" in __get_text_from_save_as_dialog_box(hwnd) is None:
                 self.type_handle = hwnd
                 return True
 
-    def __init__(self):
-        """The constructor for the class."""
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-        self.window_handle = _wait_for_window_open("#32770", "Save As")
-        self.__set_save_as_window_handles()
+    def __init__(self, owner_hwnd=None, session=None):
+        """The constructor for the class. owner_hwnd restricts the dialog to the one opened by that window."""
+        self.session = CommonDlgSession(owner_hwnd) if session is None else session
+        _session_manager.claim(self.session, "#32770", "Save As")
+        try:
+            self.__set_save_as_window_handles()
+        except DialogControlsNotFoundError:
+            _session_manager.dismiss(self.session)
+            raise
+
+    @classmethod
+    async def create_async(cls, owner_hwnd=None, session=None):
+        """Awaitable constructor: waits for the Save As dialog and its controls without blocking the event loop."""
+        self = cls.__new__(cls)
+        self.session = CommonDlgSession(owner_hwnd) if session is None else session
+        await _session_manager.claim_async(self.session, "#32770", "Save As")
+        try:
+            await self.__set_save_as_window_handles_async()
+        except DialogControlsNotFoundError:
+            _session_manager.dismiss(self.session)
+            raise
+        return self
 
     """__save_as_file_name_handle"""
     @property  # Get
@@ -409,28 +945,24 @@ class SaveAsCommonDlg:
     def cancel_button_handle(self, value):
         self.__save_as_cancel_button_handle = value
 
-    """___Global accessors___"""
-    """_common_dlg_window_handle"""
+    """___Session accessors___"""
+    """session.window_handle"""
     @property  # Get
     def window_handle(self):
-        global _common_dlg_window_handle
-        return _common_dlg_window_handle
+        return self.session.window_handle
 
     @window_handle.setter  # Set
     def window_handle(self, value):
-        global _common_dlg_window_handle
-        _common_dlg_window_handle = value
+        self.session.window_handle = value
 
-    """__common_dlg_file_path"""
+    """session.file_path"""
     @property  # Get
     def file_path(self):
-        global _common_dlg_path
-        return _common_dlg_path
+        return self.session.file_path
 
     @file_path.setter  # Set
     def file_path(self, value):
-        global _common_dlg_path
-        _common_dlg_path = value
+        self.session.file_path = value
 
 
 # copy_dir(filepath + "\\" + patient_folder_template, patient_full_path)
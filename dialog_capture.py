@@ -0,0 +1,272 @@
+"""
+Dialog Capture - records real common dialog window trees and replays them on the simulated desktop
+    The handle discovery in com_on_dlg_man follows undocumented class chains (ComboBoxEx32/ComboBox/Edit,
+    DUIViewWndClassName/DirectUIHWND/FloatNotifySink/ComboBox/Edit) that differ between Windows builds. A capture
+    holds one live #32770 dialog: every window (hwnd, parent, class, caption, text, rect) with the time it appeared
+    and the time its text was last set (control readiness), plus how long the dialog took to open and to close.
+
+    On Windows (record, while the dialog is opened by hand or by the trigger):
+        python dialog_capture.py record --caption "Save As" --output captures/win11_23h2_save_as.json.gz
+    Anywhere (replay through SaveAsCommonDlg / OpenCommonDlg, 10x faster than recorded):
+        python dialog_capture.py replay captures/*.json.gz --speed 10
+
+    Replay prints, per capture, whether the dialog was found, filled in and confirmed and how long handle discovery
+    took. The exit code is 1 if any capture failed.
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import inspect
+import argparse
+import platform
+import tempfile
+import threading
+import backends
+from time import sleep
+from time import perf_counter
+from window_events import wait_for_condition, WINDOW_OPEN_EVENTS, WINDOW_CLOSE_EVENTS
+from error_log import error_message as _error_message
+
+
+"""Backends"""
+win32con = backends.register_module("win32con", "win32con")
+win32gui = backends.register_module("win32gui", "win32gui")
+
+"""Capture file format version."""
+CAPTURE_FORMAT = 1
+"""Button captions that confirm a dialog."""
+CONFIRM_CAPTIONS = ("&Save", "&Open")
+
+
+def _window_text(hwnd):
+    """Control contents (WM_GETTEXT), which for edits and combo boxes in other processes GetWindowText doesn't
+    return."""
+    length = win32gui.SendMessage(hwnd, win32con.WM_GETTEXTLENGTH, 0, 0)
+    buffer = win32gui.PyMakeBuffer(2 * (length + 1))
+    result = win32gui.SendMessage(hwnd, win32con.WM_GETTEXT, length + 1, buffer)
+    return buffer.tobytes().decode("utf-16", errors="replace")[:result]
+
+
+def _describe_window(hwnd, parent):
+    return [hwnd, parent, win32gui.GetClassName(hwnd), win32gui.GetWindowText(hwnd), _window_text(hwnd),
+            list(win32gui.GetWindowRect(hwnd))]
+
+
+def _find_dialog_function(class_name, caption, owner_hwnd):
+    def find_dialog():
+        hwnd = win32gui.FindWindowEx(0, 0, class_name, caption)
+        while hwnd and owner_hwnd is not None and win32gui.GetWindow(hwnd, win32con.GW_OWNER) != owner_hwnd:
+            hwnd = win32gui.FindWindowEx(0, hwnd, class_name, caption)
+        return hwnd
+    return find_dialog
+
+
+def record_dialog(caption="Save As", class_name="#32770", owner_hwnd=None, trigger=None, wait_time=60,
+                  settle_time=0.5, sample_time=0.01, dismiss=True):
+    """Waits for the dialog (calling trigger() first if given, e.g. a click on Download), samples its window tree
+    every sample_time seconds until nothing has changed for settle_time and returns the capture. With dismiss the
+    dialog is cancelled afterwards and its close time recorded. Times are seconds: "open" from the start (or
+    trigger), window times from the dialog appearing."""
+    start_time = perf_counter()
+    if trigger is not None:
+        trigger()
+    hwnd_dialog = wait_for_condition(_find_dialog_function(class_name, caption, owner_hwnd), wait_time,
+                                     WINDOW_OPEN_EVENTS, poll_time=sample_time)
+    if not hwnd_dialog:
+        raise TimeoutError(f"{caption} dialog did not open within {wait_time} s")
+    open_time = perf_counter()
+    windows = {hwnd_dialog: _describe_window(hwnd_dialog, 0) + [0.0, 0.0]}
+    order = [hwnd_dialog]
+    last_change_time = open_time
+    while perf_counter() - last_change_time < settle_time and perf_counter() - open_time < wait_time:
+        now = perf_counter()
+        found = []
+        win32gui.EnumChildWindows(hwnd_dialog, lambda hwnd, _param: found.append(hwnd) or True, None)
+        for hwnd in found:
+            try:
+                if hwnd not in windows:
+                    windows[hwnd] = _describe_window(hwnd, win32gui.GetParent(hwnd)) + [now - open_time] * 2
+                    order.append(hwnd)
+                    last_change_time = now
+                else:
+                    text = _window_text(hwnd)
+                    if text != windows[hwnd][4]:
+                        windows[hwnd][4], windows[hwnd][7] = text, now - open_time
+                        last_change_time = now
+            except Exception as e:  # Control destroyed while sampling.
+                _error_message(e, inspect.currentframe())
+        sleep(max(0.0, sample_time - (perf_counter() - now)))
+    close_time = None
+    if dismiss:
+        close_time = _dismiss(hwnd_dialog, windows, wait_time)
+    return {"format": CAPTURE_FORMAT, "build": platform.platform(), "class": class_name, "caption": caption,
+            "open": open_time - start_time, "close": close_time, "windows": [windows[hwnd] for hwnd in order]}
+
+
+def _dismiss(hwnd_dialog, windows, wait_time):
+    """Cancels the dialog and returns the seconds it took to close."""
+    cancel = [hwnd for hwnd, window in windows.items() if window[2] == "Button" and window[3] == "Cancel"]
+    start_time = perf_counter()
+    if cancel:
+        win32gui.SendMessage(cancel[0], win32con.BM_CLICK, 0, 0)
+    else:
+        win32gui.PostMessage(hwnd_dialog, win32con.WM_CLOSE, 0, 0)
+    if not wait_for_condition(lambda: not win32gui.IsWindow(hwnd_dialog), wait_time, WINDOW_CLOSE_EVENTS):
+        return None
+    return perf_counter() - start_time
+
+
+def save_capture(capture, path):
+    """Writes compact JSON, gzip compressed when path ends with .gz."""
+    data = json.dumps(capture, separators=(",", ":")).encode("utf-8")
+    with (gzip.open if path.endswith(".gz") else open)(path, "wb") as file:
+        file.write(data)
+
+
+def load_capture(path):
+    with (gzip.open if path.endswith(".gz") else open)(path, "rb") as file:
+        capture = json.loads(file.read().decode("utf-8"))
+    if capture.get("format") != CAPTURE_FORMAT:
+        raise ValueError(f"{path}: unsupported capture format {capture.get('format')}")
+    return capture
+
+
+def replay_capture(manager, capture, owner=0, speed=1.0):
+    """Builds the captured dialog, owned by owner, in a sim_backend.SimulatedWindowManager on a thread and returns
+    the thread. Windows appear at their recorded times divided by speed (None: all at once) and controls get their
+    recorded text when it was set. The confirm button and Cancel work like the simulated desktop's own dialogs:
+    a confirmed Save As writes the download, a confirmed Open adds to manager.opened_files."""
+    from sim_backend import SIM_WIN32CON
+    scale = 0.0 if not speed else 1.0 / speed
+    steps = []  # (time, order, window, set text only)
+    for index, window in enumerate(capture["windows"]):
+        steps.append((window[6], index, window, False))
+        if window[7] > window[6]:
+            steps.append((window[7], index, window, True))
+    steps.sort(key=lambda step: (step[0], step[1], step[3]))
+    hwnds = {}  # Captured hwnd -> simulated hwnd
+
+    def close_later(hwnd_dialog, then=None):
+        def close():
+            manager.destroy_window(hwnd_dialog)
+            if then is not None:
+                then()
+        threading.Timer((capture["close"] or 0.0) * scale, close).start()
+
+    def confirm(hwnd_dialog):
+        texts = []
+        for window in capture["windows"]:
+            if window[2] == "Edit" and window[0] in hwnds:
+                text = _window_text(hwnds[window[0]])
+                if text and text != window[4]:  # Entered by the dialog code.
+                    texts.append(text)
+        text = texts[0] if texts else ""
+        if capture["caption"] == "Save As":
+            close_later(hwnd_dialog, lambda: manager.download_writer.start(text))
+        else:
+            manager.opened_files.extend(re.findall(r'"([^"]+)"', text) if text.startswith('"') else [text])
+            close_later(hwnd_dialog)
+
+    def build():
+        start_time = perf_counter()
+        for step_time, _index, window, set_text in steps:
+            delay = (capture["open"] + step_time) * scale - (perf_counter() - start_time)
+            if delay > 0:
+                sleep(delay)
+            if set_text:
+                manager.SendMessage(hwnds[window[0]], SIM_WIN32CON.WM_SETTEXT, 0, window[4])
+                continue
+            hwnd_window, parent, class_name, caption, text, rect = window[:6]
+            initial_text = text if window[7] <= window[6] else ""
+            if parent == 0:
+                hwnd = manager.create_window(class_name, caption, owner=owner, rect=tuple(rect), text=initial_text)
+                hwnd_dialog = hwnd  # The first window.
+            else:
+                hwnd = manager.create_window(class_name, caption, hwnds[parent], rect=tuple(rect), text=initial_text)
+            hwnds[hwnd_window] = hwnd
+            if class_name == "Button" and caption in CONFIRM_CAPTIONS:
+                manager.set_on_click(hwnd, lambda dialog=hwnd_dialog: confirm(dialog))
+            elif class_name == "Button" and caption == "Cancel":
+                manager.set_on_click(hwnd, lambda dialog=hwnd_dialog: close_later(dialog))
+
+    thread = threading.Thread(target=build, name="ReplayCapture", daemon=True)
+    thread.start()
+    return thread
+
+
+def evaluate_capture(capture, speed=10.0, iterations=3, wait_time=10):
+    """Replays capture iterations times against SaveAsCommonDlg / OpenCommonDlg on a simulated desktop, each dialog
+    phase limited to wait_time seconds. Returns the successful iterations and the mean handle discovery time in
+    seconds."""
+    import phase_metrics
+    from sim_backend import SimulatedDesktop
+    from com_on_dlg_man import CommonDlgSession, OpenCommonDlg, SaveAsCommonDlg
+    was_enabled = phase_metrics.metrics.enabled
+    phase_metrics.enable()
+    phase_metrics.metrics.reset()
+    succeeded = 0
+    with tempfile.TemporaryDirectory() as directory, SimulatedDesktop() as desktop:
+        for iteration in range(iterations):
+            owner = desktop.manager.create_window("Chrome_WidgetWin_1", "Owner")
+            file_path = os.path.join(directory, f"replay_{iteration}.pdf")
+            session = CommonDlgSession(owner, wait_time + capture["open"] * (1.0 / speed if speed else 0.0),
+                                       wait_time, wait_time, wait_time)
+            try:
+                replay_capture(desktop.manager, capture, owner, speed)
+                if capture["caption"] == "Save As":
+                    SaveAsCommonDlg(session=session).save_as_window_interact(file_path)
+                    succeeded += os.path.isfile(file_path)
+                else:
+                    with open(file_path, "wb") as file:
+                        file.write(b"%PDF-1.7\n%%EOF\n")
+                    OpenCommonDlg(session=session).open_window_interact(file_path)
+                    succeeded += file_path in desktop.manager.opened_files
+            except Exception as e:
+                _error_message(e, inspect.currentframe())
+            finally:
+                desktop.manager.destroy_window(owner)
+    stats = phase_metrics.metrics.snapshot().get("handle_discovery", {"sum": 0.0, "count": 0})
+    phase_metrics.enable(was_enabled)
+    return {"iterations": iterations, "succeeded": succeeded,
+            "discovery": stats["sum"] / stats["count"] if stats["count"] else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="Capture the next dialog (Windows)")
+    record.add_argument("--caption", default="Save As")
+    record.add_argument("--class-name", default="#32770")
+    record.add_argument("--owner", type=lambda value: int(value, 0), help="Owner window handle")
+    record.add_argument("--wait", type=float, default=60)
+    record.add_argument("--output", required=True)
+    replay = commands.add_parser("replay", help="Replay captures through the dialog code")
+    replay.add_argument("captures", nargs="+")
+    replay.add_argument("--speed", type=float, default=10.0, help="0: build each dialog at once")
+    replay.add_argument("--iterations", type=int, default=3)
+    replay.add_argument("--wait", type=float, default=10, help="Seconds each dialog phase may take")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        print(f"Waiting {args.wait:.0f} s for the {args.caption} dialog...")
+        capture = record_dialog(args.caption, args.class_name, args.owner, wait_time=args.wait)
+        save_capture(capture, args.output)
+        print(f"{len(capture['windows'])} windows, opened after {capture['open']:.3f} s, written to {args.output}")
+        return 0
+
+    failed = 0
+    for path in args.captures:
+        capture = load_capture(path)
+        result = evaluate_capture(capture, args.speed, args.iterations, args.wait)
+        discovery = "-" if result["discovery"] is None else f"{result['discovery'] * 1000:.1f} ms"
+        print(f"{os.path.basename(path)} ({capture['build']}, {capture['caption']}): "
+              f"{result['succeeded']}/{result['iterations']} ok, handle discovery {discovery}")
+        failed += result["succeeded"] < result["iterations"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
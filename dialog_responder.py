@@ -0,0 +1,136 @@
+"""
+Dialog Responder - standing service that fills Save As / Open dialogs as soon as they appear
+    The expected dialog (owner window, path, overwrite policy) is queued before the action that opens it, so the
+    click never waits for dialog handling:
+        responder = get_default_responder()
+        future = responder.expect_save_as(browser_hwnd, full_path)
+        ...  # click Download
+        future.result()  # full_path, once the dialog has closed and the download is complete
+
+    All expectations are served by one asyncio loop on a daemon thread, using the SaveAsCommonDlg / OpenCommonDlg
+    async APIs. Dialogs of one owner window are claimed in the order they were expected. The returned
+    concurrent.futures.Future raises what the dialog code raised (e.g. DialogNotFoundError, see save_policy) and
+    can be cancelled while the dialog hasn't been found yet. close() cancels every Future still outstanding.
+"""
+
+import threading
+import backends
+import concurrent.futures
+from com_on_dlg_man import CommonDlgSession, OpenCommonDlg, SaveAsCommonDlg
+from save_policy import DEFAULT_TIMEOUTS
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported by the first expectation, see backends.
+
+
+class DialogResponder:
+    """See the module docstring. The loop thread is started by the first expectation. The wait times default to
+    save_policy's phase timeouts."""
+
+    def __init__(self, open_wait_time=DEFAULT_TIMEOUTS["window_open"],
+                 close_wait_time=DEFAULT_TIMEOUTS["window_close"], file_wait_time=DEFAULT_TIMEOUTS["file_wait"],
+                 discovery_wait_time=DEFAULT_TIMEOUTS["handle_discovery"]):
+        self.open_wait_time = open_wait_time
+        self.close_wait_time = close_wait_time
+        self.file_wait_time = file_wait_time
+        self.discovery_wait_time = discovery_wait_time
+        self.__loop = None
+        self.__thread = None
+        self.__claim_locks = {}  # (dialog caption, owner hwnd) -> asyncio.Lock, FIFO per owner
+        self.__futures = set()  # Outstanding expectations, cancelled by close()
+        self.__lock = threading.Lock()
+
+    def __get_loop(self):
+        with self.__lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                self.__thread = threading.Thread(target=self.__loop.run_forever, name="DialogResponder", daemon=True)
+                self.__thread.start()
+            return self.__loop
+
+    def __session(self, owner_hwnd):
+        return CommonDlgSession(owner_hwnd, self.open_wait_time, self.close_wait_time, self.file_wait_time,
+                                self.discovery_wait_time)
+
+    def __submit(self, coroutine):
+        """Runs coroutine on the loop thread and returns its concurrent.futures.Future, tracked until it is done."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.__get_loop())
+        with self.__lock:
+            self.__futures.add(future)
+        future.add_done_callback(self.__futures.discard)
+        return future
+
+    async def __cancel_tasks(self):
+        """Called on the loop thread by close(). Cancels every expectation and waits until they have unwound."""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __claim_lock(self, caption, owner_hwnd):
+        """Called on the loop thread."""
+        return self.__claim_locks.setdefault((caption, owner_hwnd), asyncio.Lock())
+
+    async def __respond_save_as(self, owner_hwnd, file_path, make_directory, file_overwrite, wait_for_file, staging,
+                                session):
+        async with self.__claim_lock("Save As", owner_hwnd):  # Dialog and its controls found, in order.
+            dialog = await SaveAsCommonDlg.create_async(session=session or self.__session(owner_hwnd))
+        transfer = await dialog.save_as_window_interact_async(file_path, make_directory, file_overwrite,
+                                                              wait_for_file, staging)
+        return file_path if staging is None else transfer
+
+    async def __respond_open(self, owner_hwnd, file_path, session):
+        async with self.__claim_lock("Open", owner_hwnd):
+            dialog = await OpenCommonDlg.create_async(session=session or self.__session(owner_hwnd))
+        await dialog.open_window_interact_async(file_path)
+        return file_path
+
+    def expect_save_as(self, owner_hwnd, file_path, make_directory=True, file_overwrite=True, wait_for_file=True,
+                       staging=None, session=None):
+        """Fills the next Save As dialog owned by owner_hwnd (None: any owner) with file_path and confirms it.
+        Returns a Future resolving to file_path once the dialog has closed, and with wait_for_file once the
+        download is complete. With a staging.StagingArea that is the local write and the Future resolves to the
+        transfer's Future instead (None when an existing file_path was kept), the transfer continues in the
+        background. session: a CommonDlgSession for owner_hwnd with the caller's timeouts, default this
+        responder's."""
+        return self.__submit(self.__respond_save_as(owner_hwnd, file_path, make_directory, file_overwrite,
+                                                    wait_for_file, staging, session))
+
+    def expect_open(self, owner_hwnd, file_path, session=None):
+        """Fills the next Open dialog owned by owner_hwnd (None: any owner) with file_path and confirms it.
+        Returns a Future resolving to file_path once the dialog has closed. session: as in expect_save_as()."""
+        return self.__submit(self.__respond_open(owner_hwnd, file_path, session))
+
+    def close(self, wait_time=5):
+        """Cancels the pending expectations (their Futures raise CancelledError) and stops the loop thread."""
+        with self.__lock:
+            if self.__loop is None:
+                return
+            loop, thread, self.__loop, self.__thread = self.__loop, self.__thread, None, None
+            futures, self.__futures = self.__futures, set()
+        try:
+            asyncio.run_coroutine_threadsafe(self.__cancel_tasks(), loop).result(wait_time)
+        except concurrent.futures.TimeoutError:  # Not the builtin TimeoutError before Python 3.11.
+            pass  # Loop wedged (e.g. a blocking call on it), the Futures are still cancelled below.
+        for future in list(futures):
+            future.cancel()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(wait_time)
+        if not thread.is_alive():
+            loop.close()
+        self.__claim_locks.clear()
+
+
+"""Global variables"""
+_default_responder = None
+_default_responder_lock = threading.Lock()
+
+
+def get_default_responder():
+    """Returns the process wide DialogResponder."""
+    global _default_responder
+    with _default_responder_lock:
+        if _default_responder is None:
+            _default_responder = DialogResponder()
+        return _default_responder
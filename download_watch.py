@@ -0,0 +1,230 @@
+"""
+Download Watch - detects when a browser download has really finished
+    A download is complete once the target file exists, no partial file (".crdownload", ".part", ...) belonging to
+    it remains and, unless a partial file was seen being renamed away, its size has stopped changing (not been
+    written for stable_time seconds, going by its modification time). Chrome's "Unconfirmed <n>.crdownload" files
+    carry no target name: only the ones that appeared after the detector started (or after the caller's snapshot,
+    see unconfirmed_files()) count, so stale ones and other downloads into the same directory don't block it.
+
+    Backends (wake the detector when something in the target directory changes):
+    - InotifyBackend: Linux inotify.
+    - DirectoryChangeBackend: Windows FindFirstChangeNotification.
+    - PollingBackend: Fallback, re-checks every poll_time seconds.
+"""
+
+import os
+import sys
+import select
+import inspect
+import backends
+from time import time
+from time import sleep
+from poll_scheduler import Backoff, get_default_scheduler
+from error_log import error_message as _error_message
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Only wait_async() needs it, imported on first use.
+
+"""Suffixes browsers use for files still being written."""
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".partial", ".download", ".tmp")
+"""Chrome writes "Unconfirmed <n>.crdownload" until the final file name is known."""
+UNCONFIRMED_PREFIX = "Unconfirmed "
+
+
+class PollingBackend:
+    """Fallback backend, wait() simply sleeps for poll_time (or less)."""
+
+    def __init__(self, directory=None, poll_time=0.1):
+        self.poll_time = poll_time
+
+    def wait(self, timeout):
+        sleep(max(0.0, min(timeout, self.poll_time)))
+
+    def close(self):
+        pass
+
+
+class InotifyBackend:
+    """Linux inotify backend. wait() returns as soon as an entry in the directory is created, written, renamed or
+    deleted."""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    def __init__(self, directory):
+        import ctypes
+        self.__libc = ctypes.CDLL(None, use_errno=True)
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | \
+            self.IN_DELETE
+        if self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), mask) < 0:
+            os.close(self.__fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.__fd], [], [], max(0.0, timeout))
+        if readable:
+            try:
+                while os.read(self.__fd, 4096):  # Drain, the detector re-checks the files itself.
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+
+class DirectoryChangeBackend:
+    """Windows change-notification backend (FindFirstChangeNotification on the target directory)."""
+
+    def __init__(self, directory):
+        import win32con
+        import win32file
+        import win32event
+        self.__win32file = win32file
+        self.__win32event = win32event
+        flags = win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_SIZE | \
+            win32con.FILE_NOTIFY_CHANGE_LAST_WRITE
+        self.__handle = win32file.FindFirstChangeNotification(directory, False, flags)
+
+    def wait(self, timeout):
+        result = self.__win32event.WaitForSingleObject(self.__handle, int(max(0.0, timeout) * 1000))
+        if result == self.__win32event.WAIT_OBJECT_0:
+            self.__win32file.FindNextChangeNotification(self.__handle)
+
+    def close(self):
+        if self.__handle is not None:
+            self.__win32file.FindCloseChangeNotification(self.__handle)
+            self.__handle = None
+
+
+def unconfirmed_files(directory):
+    """Returns the paths of Chrome's "Unconfirmed <n>.crdownload" files in directory, e.g. taken before a click
+    as DownloadCompletionDetector's partials_before."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.path for entry in entries if entry.name.startswith(UNCONFIRMED_PREFIX) and
+                    entry.name.endswith(".crdownload")}
+    except FileNotFoundError:
+        return set()
+
+
+def create_backend(directory, poll_time=0.1):
+    """Returns the best notification backend for this platform, falling back to polling."""
+    try:
+        if sys.platform == "win32":
+            return DirectoryChangeBackend(directory)
+        if sys.platform.startswith("linux"):
+            return InotifyBackend(directory)
+    except Exception as e:
+        _error_message(e, inspect.currentframe())
+    return PollingBackend(directory, poll_time)
+
+
+class DownloadCompletionDetector:
+    """Watches file_path until the download is complete. Also reports the observed transfer rate. partials_before:
+    Unconfirmed files that belong to other downloads, by default the ones present when the detector is created."""
+
+    def __init__(self, file_path, stable_time=0.25, poll_time=0.1, backend=None, partials_before=None):
+        self.file_path = file_path
+        self.directory = os.path.dirname(file_path) or "."
+        self.stable_time = stable_time  # Seconds the size must stay unchanged when no partial file was seen.
+        self.poll_time = poll_time
+        self.__backend = backend
+        self.__start_time = time()
+        self.__end_time = None
+        self.__last_state = None
+        self.__last_change_time = self.__start_time
+        self.__partial_seen = False
+        self.__partials_before = unconfirmed_files(self.directory) if partials_before is None else \
+            set(partials_before)
+        self.size = 0
+
+    def __partial_files(self):
+        """Returns the partial files that still belong to this download."""
+        partials = [self.file_path + suffix for suffix in PARTIAL_SUFFIXES if os.path.exists(self.file_path + suffix)]
+        if not partials:
+            partials = sorted(unconfirmed_files(self.directory) - self.__partials_before)
+        return partials
+
+    def __state(self):
+        try:
+            stat = os.stat(self.file_path)
+            file_state = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            file_state = None
+        partial_state = []
+        for partial in self.__partial_files():
+            try:
+                partial_state.append((partial, os.path.getsize(partial)))
+            except FileNotFoundError:
+                pass
+        return file_state, tuple(partial_state)
+
+    def poll(self):
+        """Checks the files once and returns True when the download is complete."""
+        if self.__end_time is not None:
+            return True
+        now = time()
+        file_state, partial_state = self.__state()
+        self.size = max([file_state[0] if file_state else 0] + [size for _, size in partial_state])
+        if (file_state, partial_state) != self.__last_state:
+            self.__last_state = (file_state, partial_state)
+            # The file's own write time: a download that finished before the detector started is stable already.
+            self.__last_change_time = min(now, file_state[1] / 1e9) if file_state and not partial_state else now
+        if partial_state:
+            self.__partial_seen = True
+            return False
+        if file_state is None:
+            return False
+        # The partial file was renamed to the final name: done. Otherwise wait for the size to settle.
+        if self.__partial_seen or now - self.__last_change_time >= self.stable_time:
+            self.__end_time = now
+            return True
+        return False
+
+    def __next_timeout(self, remaining):
+        if self.__last_state is not None and self.__last_state[0] is not None and not self.__last_state[1]:
+            return min(remaining, max(0.0, self.stable_time - (time() - self.__last_change_time)))
+        return remaining
+
+    def wait(self, wait_time=300):
+        """Blocks until the download is complete. Returns True, or raises TimeoutError after wait_time seconds."""
+        deadline = time() + wait_time
+        backend = create_backend(self.directory, self.poll_time) if self.__backend is None else self.__backend
+        try:
+            while not self.poll():
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise TimeoutError("A timeout error occurred in: DownloadCompletionDetector.wait()")
+                # Re-check at least every second in case a notification is missed.
+                backend.wait(min(1.0, self.__next_timeout(remaining)))
+            return True
+        finally:
+            if self.__backend is None:
+                backend.close()
+
+    async def wait_async(self, wait_time=300):
+        """Awaitable wait(). Checked on the shared PollScheduler (see poll_scheduler), backing off up to poll_time
+        seconds, instead of using a backend."""
+        future = get_default_scheduler().submit(self.poll, wait_time, Backoff(maximum=self.poll_time))
+        if not await asyncio.wrap_future(future):
+            raise TimeoutError("A timeout error occurred in: DownloadCompletionDetector.wait_async()")
+        return True
+
+    @property  # Get
+    def elapsed(self):
+        return (self.__end_time or time()) - self.__start_time
+
+    @property  # Get
+    def bytes_per_second(self):
+        elapsed = self.elapsed
+        return self.size / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,18 @@
+"""
+Error Log - the error logging helper shared by these modules
+    Modules import it under their usual name and log caught exceptions with the function that caught them:
+        from error_log import error_message as _error_message
+        ...
+        except Exception as e:
+            _error_message(e, inspect.currentframe())
+"""
+
+import inspect
+import logging
+
+
+def error_message(e, details):
+    """Logs e with the name of the function whose frame (inspect.currentframe()) is passed as details."""
+    calling_function_name = inspect.getframeinfo(details).function
+    logging.error(f"An error occurred in function: {calling_function_name}. The exception type is: "
+                  f"{type(e).__name__}. Error details: {e}")
@@ -0,0 +1,224 @@
+"""
+PDF DOM Status - PDFViewer load status read from the page through the WebDriver instead of screen pixels
+    A small script is installed on the pdfView iframe element once (HOOK_SCRIPT) and records status transitions in
+    the page as they happen:
+        src MutationObserver     src attribute set or changed      "Loading" ("Empty" for about:blank)
+        iframe load event        new document committed             "Loaded" (or "Loading" until the viewer is ready)
+        viewer ready state       same origin only: document readyState and, for pdf.js, pdfDocument
+    sample() collects the transitions recorded since the last call in one execute_script round trip, calls the
+    subscribed callbacks with each of them and returns the current status. Nothing is read from the screen, so
+    this works for minimized, covered and background windows. A WebDriver round trip can take a while, pollers
+    on a shared thread (the PollScheduler) use sample_nowait(): the round trips run on the status's own sampling
+    thread and the poller reads the last result. status.changed is a window_events.EventSource that fires when
+    such a sample finds a new status, so a wait subscribed to it checks again right away.
+
+    "Loaded" means the viewer's document is ready, not that its toolbar has been painted: ClassPDFView still
+    confirms it with the pixels while the window is on screen.
+
+    None from sample() means the page can't tell (no scripting, stale element, hook installed on an already loaded
+    cross-origin viewer): ClassPDFView falls back to the pixel sampler (pdf_view_status) for that check.
+
+        dom_status = DomPdfViewStatus()
+        dom_status.subscribe(lambda old, new, source: print(old, "->", new, source))
+        view = ClassPDFView(hwnd, iframe, dom_status=dom_status)
+"""
+
+import inspect
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from window_events import EventSource
+from error_log import error_message as _error_message
+
+
+"""Installs the hook on arguments[0] (the iframe), returns true. Does nothing if it is already installed."""
+HOOK_SCRIPT = """
+var iframe = arguments[0];
+if (iframe.__pdfViewHook) { return true; }
+var hook = {status: "Unknown", transitions: [], navigating: false};
+function setStatus(status, source) {
+    if (status === hook.status) { return; }
+    hook.transitions.push([hook.status, status, source]);
+    if (hook.transitions.length > 100) { hook.transitions.shift(); }
+    hook.status = status;
+}
+function isEmpty() {
+    var src = iframe.getAttribute("src");
+    return !src || src === "about:blank";
+}
+function viewerState() {
+    if (isEmpty()) { return "Empty"; }
+    try {
+        var doc = iframe.contentDocument;
+        if (!doc) { return null; }
+        if (doc.readyState !== "complete") { return "Loading"; }
+        var app = iframe.contentWindow.PDFViewerApplication;
+        return app && !app.pdfDocument ? "Loading" : "Loaded";
+    } catch (e) {
+        return null;
+    }
+}
+hook.check = function (source) {
+    var state = hook.navigating ? null : viewerState();
+    if (state) { setStatus(state, source); }
+};
+new MutationObserver(function () {
+    hook.navigating = !isEmpty();
+    setStatus(isEmpty() ? "Empty" : "Loading", "src");
+}).observe(iframe, {attributes: true, attributeFilter: ["src"]});
+iframe.addEventListener("load", function () {
+    hook.navigating = false;
+    setStatus(viewerState() || "Loaded", "load");
+});
+hook.check("install");
+iframe.__pdfViewHook = hook;
+return true;
+"""
+
+"""Returns {status, transitions} and clears the transitions, or null if the hook isn't installed on arguments[0]."""
+TAKE_SCRIPT = """
+var hook = arguments[0].__pdfViewHook;
+if (!hook) { return null; }
+hook.check("ready");
+var transitions = hook.transitions;
+hook.transitions = [];
+return {status: hook.status, transitions: transitions};
+"""
+
+
+"""Event delivered by DomPdfViewStatus.changed."""
+EVENT_DOM_STATUS_CHANGE = "dom_status_change"
+
+
+class _StatusEvents(EventSource):
+    def __init__(self):
+        super().__init__((EVENT_DOM_STATUS_CHANGE,))
+
+    def emit(self):
+        self._emit(EVENT_DOM_STATUS_CHANGE, None)
+
+
+class DomPdfViewStatus:
+    """Hooks the pdfView iframe and reports its status. Callbacks are called as callback(old_status, new_status,
+    source), source being "src", "load", "ready" or "install", on the thread calling sample() (the sampling
+    thread with sample_nowait()). After max_failures failed samples in a row the page is not asked again
+    (available is False) until reset()."""
+
+    def __init__(self, max_failures=3):
+        self.max_failures = max_failures
+        self.status = "Unknown"  # Last status reported by the page
+        self.transitions = 0  # Transitions seen, see statuses_since()
+        self.__history = collections.deque(maxlen=100)  # (transition number, new status)
+        self.__callbacks = []
+        self.__hooked_iframe = None
+        self.__failures = 0
+        self.changed = _StatusEvents()  # Fires when a sample_nowait() sample finds a new status
+        self.__latest = (None, None)  # (pdf_iframe, status) of the last sample_nowait() sample
+        self.__pending = None  # Future of the running sample_nowait() sample
+        self.__executor = None  # Sampling thread, started by the first sample_nowait()
+        self.__lock = threading.Lock()
+
+    @property  # Get
+    def available(self):
+        return self.__failures < self.max_failures
+
+    def subscribe(self, callback):
+        with self.__lock:
+            self.__callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.__lock:
+            if callback in self.__callbacks:
+                self.__callbacks.remove(callback)
+
+    def reset(self):
+        """Asks the page again, e.g. after the driver was replaced."""
+        with self.__lock:
+            self.__failures = 0
+            self.__hooked_iframe = None
+            self.__latest = (None, None)
+
+    def sample(self, pdf_iframe):
+        """Returns "Empty", "Loading" or "Loaded" as reported by the page, None when the caller should fall back to
+        the pixels."""
+        if not self.available:
+            return None
+        state = self.__take(pdf_iframe)  # WebDriver round trips, without the lock.
+        if state is None:
+            return None
+        with self.__lock:
+            for _old_status, new_status, _source in state["transitions"]:
+                self.transitions += 1
+                self.__history.append((self.transitions, new_status))
+            callbacks = list(self.__callbacks)
+        for old_status, new_status, source in state["transitions"]:
+            for callback in callbacks:
+                try:
+                    callback(old_status, new_status, source)
+                except Exception as e:  # A failing subscriber doesn't stop the others or the wait.
+                    _error_message(e, inspect.currentframe())
+        self.status = state["status"]
+        return None if self.status == "Unknown" else self.status
+
+    def statuses_since(self, transitions):
+        """Statuses the page went through after the given value of self.transitions, oldest first. A status held
+        only between two samples (a fast reload: Loaded, Loading, Loaded) is not missed."""
+        with self.__lock:
+            return [status for number, status in self.__history if number > transitions]
+
+    def sample_nowait(self, pdf_iframe):
+        """sample() without the WebDriver round trip on the calling thread: returns the status of the last finished
+        sample of pdf_iframe (None before there is one) and starts the next on the sampling thread unless one is
+        running. The status can be one poll interval old."""
+        if not self.available:
+            return None
+        with self.__lock:
+            latest_iframe, status = self.__latest
+            if self.__pending is None or self.__pending.done():
+                if self.__executor is None:
+                    self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="DomPdfViewStatus")
+                self.__pending = self.__executor.submit(self.__sample_latest, pdf_iframe)
+        return status if latest_iframe is pdf_iframe else None
+
+    def close(self):
+        """Stops the sampling thread."""
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __sample_latest(self, pdf_iframe):
+        status = self.sample(pdf_iframe)
+        with self.__lock:
+            changed = self.__latest != (pdf_iframe, status)
+            self.__latest = (pdf_iframe, status)
+        if changed:
+            self.changed.emit()
+
+    def __take(self, pdf_iframe):
+        """Installs the hook on a new iframe element, returns the page's state or None. The driver is called
+        without the lock, only the hooked iframe and the failure count are read and updated under it."""
+        with self.__lock:
+            hooked = pdf_iframe is self.__hooked_iframe
+        try:
+            driver = pdf_iframe.parent
+            if not hooked:
+                if driver.execute_script(HOOK_SCRIPT, pdf_iframe) is not True:
+                    raise RuntimeError("PDF view status hook not installed, the driver doesn't run scripts")
+            state = driver.execute_script(TAKE_SCRIPT, pdf_iframe)
+        except Exception as e:  # StaleElementReferenceException, JavascriptException, no driver, ...
+            with self.__lock:
+                self.__hooked_iframe = None
+                self.__failures += 1
+            if not self.available:
+                logging.warning(f"PDF view status from the DOM not available, using pixels ({type(e).__name__}: "
+                                f"{e})")
+            return None
+        with self.__lock:
+            if state is None:  # Element replaced by the page, hook it again next time.
+                self.__hooked_iframe = None
+                return None
+            self.__hooked_iframe = pdf_iframe
+            self.__failures = 0
+        return state
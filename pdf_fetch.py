@@ -0,0 +1,202 @@
+"""
+PDF Fetch - downloads the PDFViewer document directly over HTTP, skipping the mouse click and Save As dialog
+    The iframe's document URL and the WebDriver session cookies are read from the browser, then the bytes are
+    streamed to disk in chunks through a pooled keep-alive session. Works with headless browsers.
+
+    For documents that are not reachable by URL from outside the page (blob: URLs, or session bound URLs the cookies
+    don't cover), extract_iframe_blob reads the document inside the page and pulls it back in bounded base64 chunks.
+    A same-origin pdf.js viewer hands over the document it already loaded (pdfDocument.getData()); otherwise the
+    iframe's src is fetched again with a GET from the page. A document that only a POST returns (form submit into
+    the iframe) can't be fetched again that way and the built-in viewer doesn't expose its bytes: use save_pdf().
+"""
+
+import os
+import base64
+import threading
+from urllib.parse import urljoin
+import backends
+from pdf_store import PDF_HEADER, MARKER_WINDOW
+
+
+"""Backends (imported on first use)"""
+requests = backends.register_module("requests", "requests")  # Install via 'requests'
+
+
+def _prepare_directory(full_path, make_directory=True):
+    """Creates the directory of full_path if allowed, else raises FileNotFoundError if it is missing. An existing
+    full_path is left alone, it is only replaced (os.replace) once the new document is complete."""
+    directory = os.path.dirname(full_path)
+    if directory and not os.path.isdir(directory):
+        if not make_directory:
+            raise FileNotFoundError(f"Directory does not exist: {directory}")
+        os.makedirs(directory, exist_ok=True)
+
+
+def _check_pdf_header(head, source, content_type=None):
+    """Raises IOError unless head (the first bytes) has the %PDF- header, e.g. a login page after the session
+    expired."""
+    if PDF_HEADER not in head[:MARKER_WINDOW]:
+        raise IOError(f"Not a PDF: {source} (Content-Type {content_type}, starts with {head[:32]!r})")
+
+
+def pdf_url_from_iframe(pdf_iframe):
+    """Returns the absolute URL of the document shown in the iframe."""
+    driver = pdf_iframe.parent
+    return urljoin(driver.current_url, pdf_iframe.get_attribute("src"))
+
+
+def cookies_from_driver(driver):
+    """Copies the WebDriver session cookies into a requests cookie jar."""
+    jar = requests.cookies.RequestsCookieJar()
+    for cookie in driver.get_cookies():
+        jar.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    return jar
+
+
+class PdfFetcher:
+    """Streams documents to disk through one pooled, keep-alive HTTP session. At most max_concurrency downloads
+    run at the same time, further callers block until a slot is free."""
+
+    def __init__(self, max_concurrency=4, chunk_size=1 << 16, timeout=(10, 300)):
+        self.chunk_size = chunk_size
+        self.timeout = timeout  # (connect, read) seconds
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.__slots = threading.BoundedSemaphore(max_concurrency)
+
+    def fetch(self, url, full_path, cookies=None, headers=None, make_directory=True, file_overwrite=True):
+        """Streams url to full_path and returns the number of bytes written. The data goes to full_path + ".part"
+        and is renamed when complete, a response that is not a PDF raises IOError and an existing full_path is
+        kept whenever the fetch fails. make_directory / file_overwrite behave as in save_as_window_interact(),
+        an existing file that may not be overwritten is left alone and 0 is returned."""
+        _prepare_directory(full_path, make_directory)
+        if os.path.exists(full_path) and not file_overwrite:
+            return 0
+
+        partial_path = full_path + ".part"
+        size = 0
+        with self.__slots:
+            with self.session.get(url, cookies=cookies, headers=headers, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type")
+                head = b""
+                try:
+                    with open(partial_path, "wb") as file:
+                        for chunk in response.iter_content(self.chunk_size):
+                            if len(head) < MARKER_WINDOW:  # Checked as soon as there is enough, not at the end.
+                                head += chunk[:MARKER_WINDOW - len(head)]
+                                if len(head) == MARKER_WINDOW:
+                                    _check_pdf_header(head, url, content_type)
+                            file.write(chunk)
+                            size += len(chunk)
+                    _check_pdf_header(head, url, content_type)
+                    os.replace(partial_path, full_path)
+                finally:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+        return size
+
+    def fetch_iframe(self, pdf_iframe, full_path, make_directory=True, file_overwrite=True):
+        """Fetches the document shown in a PDFViewer iframe with the browser's cookies and user agent."""
+        driver = pdf_iframe.parent
+        headers = {"User-Agent": driver.execute_script("return navigator.userAgent;"), "Referer": driver.current_url}
+        return self.fetch(pdf_url_from_iframe(pdf_iframe), full_path, cookies_from_driver(driver), headers,
+                          make_directory, file_overwrite)
+
+    def close(self):
+        self.session.close()
+
+
+"""Global variables"""
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    """Returns the process wide PdfFetcher, so every ClassPDFView shares one connection pool."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = PdfFetcher()
+        return _default_fetcher
+
+
+"""In-page scripts for extract_iframe_blob(). The document stays in the page until it is released."""
+_BLOB_FETCH_SCRIPT = """
+const [iframe, done] = [arguments[0], arguments[arguments.length - 1]];
+function loadedDocument() {
+    try {
+        const app = iframe.contentWindow.PDFViewerApplication;  // Same-origin pdf.js: the bytes it already has.
+        return app && app.pdfDocument ? app.pdfDocument.getData() : null;
+    } catch (e) {
+        return null;  // Cross-origin or built-in viewer.
+    }
+}
+function refetch() {
+    return fetch(iframe.src, {credentials: "include"}).then(response => {  // GET, blob: URLs are read from memory.
+        if (!response.ok) throw new Error("HTTP " + response.status);
+        return response.arrayBuffer();
+    });
+}
+Promise.resolve(loadedDocument() || refetch())
+    .then(data => {
+        const bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+        window.__pdfYouBlobs = window.__pdfYouBlobs || {};
+        const id = Date.now().toString(36) + Math.random().toString(36).slice(2);
+        window.__pdfYouBlobs[id] = bytes;
+        done({id: id, size: bytes.byteLength});
+    })
+    .catch(error => done({error: String(error)}));
+"""
+_BLOB_CHUNK_SCRIPT = """
+const [id, offset, length, done] = arguments;
+const bytes = window.__pdfYouBlobs[id].subarray(offset, offset + length);
+const reader = new FileReader();
+reader.onload = () => done(reader.result.slice(reader.result.indexOf(",") + 1));
+reader.onerror = () => done(null);
+reader.readAsDataURL(new Blob([bytes]));
+"""
+_BLOB_RELEASE_SCRIPT = """
+if (window.__pdfYouBlobs) delete window.__pdfYouBlobs[arguments[0]];
+"""
+
+
+def extract_iframe_blob(pdf_iframe, full_path, chunk_size=4 << 20, make_directory=True, file_overwrite=True):
+    """Reads the iframe's document inside the page (execute_async_script, see the module docstring for which
+    documents can be read) and streams it to full_path in base64 chunks of at most chunk_size bytes, so neither
+    Python nor the driver ever holds the whole document. The driver's script timeout must cover the in-page fetch.
+    Raises IOError when it is not a PDF, an existing full_path is kept whenever the extraction fails. Returns the
+    number of bytes written."""
+    _prepare_directory(full_path, make_directory)
+    if os.path.exists(full_path) and not file_overwrite:
+        return 0
+
+    driver = pdf_iframe.parent
+    blob = driver.execute_async_script(_BLOB_FETCH_SCRIPT, pdf_iframe)
+    if not blob or "error" in blob:
+        raise IOError(f"In-page fetch failed: {blob and blob.get('error')}")
+
+    partial_path = full_path + ".part"
+    source = pdf_iframe.get_attribute("src")
+    head = b""
+    try:
+        with open(partial_path, "wb") as file:
+            for offset in range(0, blob["size"], chunk_size):
+                chunk = driver.execute_async_script(_BLOB_CHUNK_SCRIPT, blob["id"], offset, chunk_size)
+                if chunk is None:
+                    raise IOError(f"In-page read failed at offset {offset}")
+                chunk = base64.b64decode(chunk)
+                if len(head) < MARKER_WINDOW:  # Checked as soon as there is enough, as in PdfFetcher.fetch().
+                    head += chunk[:MARKER_WINDOW - len(head)]
+                    if len(head) == MARKER_WINDOW:
+                        _check_pdf_header(head, source)
+                file.write(chunk)
+        _check_pdf_header(head, source)  # Also an empty or short document.
+        os.replace(partial_path, full_path)
+    finally:
+        driver.execute_script(_BLOB_RELEASE_SCRIPT, blob["id"])
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return blob["size"]
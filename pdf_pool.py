@@ -0,0 +1,271 @@
+"""
+PDF Pool - saves documents with several worker processes, each owning its own browser / WebDriver and ClassPDFView
+    class MyWorker(PdfWorker):  # At module level, so it can be sent to the worker processes.
+        def open(self):  # Runs in the worker process: start the browser, return its ClassPDFView.
+            ...
+        def navigate(self, locator):  # Show the document, e.g. self.driver.get(locator)
+            ...
+
+    pool = PdfPool(MyWorker(), processes=4)
+    for result in pool.run([(url, full_path), ...]):  # PoolResult per job, as they finish
+        ...
+    print(pool.summary)  # Aggregate throughput, pool.worker_stats() per worker
+
+    The parent hands each job to one idle worker, so it always knows what a worker is doing. A worker that dies or
+    exceeds job_timeout is terminated and restarted, its job is retried until max_attempts is reached. A worker
+    whose view's circuit breaker opens (see save_policy) exits and is restarted with a fresh browser.
+
+    Every worker needs its own browser window. The default click strategy posts mouse messages to that window
+    (see click_strategies), if it falls back to the real mouse, clicks from different processes can collide.
+"""
+
+import os
+import queue
+import inspect
+import logging
+import multiprocessing
+from time import time
+from collections import deque, namedtuple
+from pdf_you import BatchSummary
+from pdf_store import ContentStore, PostSaveStage
+from save_policy import CircuitOpenError
+from error_log import error_message as _error_message
+
+
+"""Outcome of one job. latency covers navigation and saving, attempts counts tries including restarts."""
+PoolResult = namedtuple("PoolResult", ["locator", "full_path", "ok", "latency", "size", "error", "worker", "attempts"])
+
+
+class PdfWorker:
+    """What runs inside each worker process. Subclass at module level and override open() and navigate()."""
+    store_root = None  # Directory of a pdf_store.ContentStore to de-duplicate saved documents into (same volume).
+    __post_save = None  # Created in the worker process.
+
+    def open(self):
+        """Starts the browser / WebDriver and returns the ClassPDFView driving it."""
+        raise NotImplementedError
+
+    def navigate(self, locator):
+        """Loads the document identified by locator (e.g. a URL) into the viewer."""
+        raise NotImplementedError
+
+    def save(self, view, locator, full_path):
+        """Saves one document and returns its size in bytes, raises if it was not saved or is not a complete PDF."""
+        self.navigate(locator)
+        transfer = view.save_pdf(full_path)
+        if transfer is not None:  # Staged, see staging: at full_path once the transfer is done.
+            transfer.result()
+        if not os.path.isfile(full_path):
+            raise IOError(f"Document was not saved: {full_path}")
+        if self.__post_save is None:
+            self.__post_save = PostSaveStage(ContentStore(self.store_root) if self.store_root else None)
+        stored = self.__post_save.process(full_path)
+        if not stored.ok:
+            raise IOError(f"Corrupt PDF {full_path}: {stored.error}")
+        return stored.size
+
+    def close(self):
+        """Quits the browser. Not called when the worker is terminated after a hang."""
+        pass
+
+
+def _worker_main(worker, worker_id, generation, jobs, results):
+    """Worker process: opens the browser, then saves jobs from its own queue until it receives None."""
+    try:
+        view = worker.open()
+    except Exception as e:
+        results.put(("open_failed", worker_id, generation, repr(e)))
+        return
+    results.put(("ready", worker_id, generation))
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            locator, full_path = job
+            start_time = time()
+            try:
+                size = worker.save(view, locator, full_path)
+                results.put(("done", worker_id, generation, True, time() - start_time, size, None))
+            except CircuitOpenError as e:  # Browser / desktop wedged: exit, the pool starts a fresh worker.
+                results.put(("done", worker_id, generation, False, time() - start_time, 0, repr(e)))
+                break
+            except Exception as e:  # Exceptions may not pickle, send their text.
+                results.put(("done", worker_id, generation, False, time() - start_time, 0, repr(e)))
+    finally:
+        worker.close()
+
+
+class _WorkerSlot:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.generation = 0
+        self.process = None
+        self.jobs = None
+        self.ready = False
+        self.started_time = 0.0
+        self.job = None  # [locator, full_path, attempts]
+        self.job_start_time = 0.0
+        self.restarts = 0
+        self.open_failures = 0  # Consecutive
+        self.summary = BatchSummary()
+
+
+class PdfPool:
+    """Multiprocessing orchestrator for PdfWorker processes. See the module docstring."""
+
+    def __init__(self, worker, processes=None, job_timeout=600, start_timeout=120, max_attempts=2,
+                 max_open_failures=3, start_method=None):
+        self.worker = worker
+        self.processes = processes or os.cpu_count() or 1
+        self.job_timeout = job_timeout  # Seconds a job may run before its worker counts as hung.
+        self.start_timeout = start_timeout  # Seconds open() may take.
+        self.max_attempts = max_attempts  # Tries per job when workers crash or hang on it.
+        self.max_open_failures = max_open_failures  # Consecutive failed open() before a worker is given up.
+        self.summary = None  # BatchSummary of the last run()
+        self.__context = multiprocessing.get_context(start_method)
+        self.__results = None
+        self.__slots = []
+
+    def __start(self, slot):
+        slot.generation += 1
+        slot.jobs = self.__context.Queue()
+        slot.process = self.__context.Process(
+            target=_worker_main, args=(self.worker, slot.worker_id, slot.generation, slot.jobs, self.__results),
+            name=f"PdfPool-{slot.worker_id}", daemon=True)
+        slot.ready, slot.job, slot.started_time = False, None, time()
+        slot.process.start()
+
+    def __restart(self, slot, reason):
+        logging.warning(f"PdfPool worker {slot.worker_id} restarted: {reason}")
+        if slot.process.is_alive():
+            slot.process.terminate()
+        slot.process.join(5)
+        slot.restarts += 1
+        self.__start(slot)
+
+    def __stop(self, slot):
+        if slot.process is None:
+            return
+        if slot.process.is_alive():
+            slot.jobs.put(None)
+            slot.process.join(10)
+            if slot.process.is_alive():
+                slot.process.terminate()
+                slot.process.join(5)
+        slot.process = None
+
+    def __result(self, slot, ok, latency, size, error):
+        locator, full_path, attempts = slot.job
+        result = PoolResult(locator, full_path, ok, latency, size, error, slot.worker_id, attempts)
+        slot.summary.add(result)
+        self.summary.add(result)
+        slot.job = None
+        return result
+
+    def __open_failed(self, slot, reason):
+        slot.open_failures += 1
+        if slot.open_failures < self.max_open_failures:
+            self.__restart(slot, reason)
+        else:
+            logging.error(f"PdfPool worker {slot.worker_id} given up: {reason}")
+            if slot.process.is_alive():
+                slot.process.terminate()
+            slot.process = None
+
+    def __handle(self, message):
+        """Processes one message from a worker, returns a PoolResult if it completed a job."""
+        kind, worker_id, generation = message[:3]
+        slot = self.__slots[worker_id]
+        if generation != slot.generation:  # From a worker that has since been restarted.
+            return None
+        if kind == "ready":
+            slot.ready, slot.open_failures = True, 0
+        elif kind == "open_failed":
+            slot.process.join(5)
+            self.__open_failed(slot, f"open() failed: {message[3]}")
+        elif kind == "done" and slot.job is not None:
+            return self.__result(slot, *message[3:])
+        return None
+
+    def __supervise(self, retry):
+        """Restarts crashed and hung workers. Their jobs are retried, or failed after max_attempts."""
+        results = []
+        for slot in self.__slots:
+            if slot.process is None:
+                continue
+            if slot.job is not None and time() - slot.job_start_time > self.job_timeout:
+                reason = f"job exceeded {self.job_timeout} s"
+            elif not slot.ready and time() - slot.started_time > self.start_timeout:
+                reason = f"open() exceeded {self.start_timeout} s"
+            elif not slot.process.is_alive() and (slot.ready or slot.process.exitcode not in (0, None)):
+                reason = f"exit code {slot.process.exitcode}"
+            else:
+                continue
+            if not slot.ready:
+                self.__open_failed(slot, reason)
+                continue
+            if slot.job is not None:
+                if slot.job[2] < self.max_attempts:
+                    retry.append(slot.job)
+                    slot.job = None
+                else:
+                    results.append(self.__result(slot, False, time() - slot.job_start_time, 0, reason))
+            self.__restart(slot, reason)
+        return results
+
+    def run(self, jobs, poll_time=0.25):
+        """Saves (locator, full_path) jobs from an iterable (or generator) and yields a PoolResult per job as each
+        one finishes. Throughput figures are kept in self.summary and worker_stats()."""
+        self.summary = BatchSummary()
+        self.__results = self.__context.Queue()
+        self.__slots = [_WorkerSlot(worker_id) for worker_id in range(self.processes)]
+        jobs, retry, exhausted = iter(jobs), deque(), False
+        try:
+            for slot in self.__slots:
+                self.__start(slot)
+            while True:
+                for slot in self.__slots:  # Hand out work to idle workers.
+                    if slot.process is None or not slot.ready or slot.job is not None:
+                        continue
+                    if retry:
+                        job = retry.popleft()
+                    elif not exhausted:
+                        try:
+                            job = [*next(jobs), 0]
+                        except StopIteration:
+                            exhausted = True
+                            continue
+                    else:
+                        continue
+                    job[2] += 1
+                    slot.job, slot.job_start_time = job, time()
+                    slot.jobs.put((job[0], job[1]))
+
+                busy = any(slot.job is not None for slot in self.__slots)
+                if exhausted and not retry and not busy:
+                    break
+                if all(slot.process is None for slot in self.__slots):
+                    raise RuntimeError("PdfPool: every worker failed to open its browser")
+
+                try:
+                    result = self.__handle(self.__results.get(timeout=poll_time))
+                    if result is not None:
+                        yield result
+                except queue.Empty:
+                    pass
+                for result in self.__supervise(retry):
+                    yield result
+        finally:
+            for slot in self.__slots:
+                try:
+                    self.__stop(slot)
+                except Exception as e:
+                    _error_message(e, inspect.currentframe())
+            logging.info(f"PdfPool: {self.summary}")
+
+    def worker_stats(self):
+        """Per worker: documents saved / failed, restarts and throughput of the last run()."""
+        return [{"worker": slot.worker_id, "succeeded": slot.summary.succeeded, "failed": slot.summary.failed,
+                 "restarts": slot.restarts, "documents_per_minute": slot.summary.documents_per_minute,
+                 "bytes_per_second": slot.summary.bytes_per_second} for slot in self.__slots]
@@ -0,0 +1,146 @@
+"""
+PDF Prefetch - the next documents load in hidden iframes while the visible one is being saved
+    A PrefetchPool keeps up to depth + 1 pdfView iframes in the page: the original one plus depth copies stacked
+    exactly over it (visibility hidden). ClassPDFView.save_many(..., prefetch=pool) loads the next depth documents
+    into hidden iframes while the Save As dialog of the current one is handled, then shows the next iframe, which
+    has usually finished loading by then. An iframe whose document has been saved is kept until its download is
+    complete (up to max_held of them, Chrome may still be reading the document), then blanked (about:blank, which
+    releases the document) and reused for the next one, so browser memory stays bounded by depth + 1 + max_held
+    documents.
+
+        pool = PrefetchPool(pdf_iframe, depth=2)
+        jobs = ((url, full_path) for url, full_path in documents)  # or (navigate(pdf_iframe), full_path)
+        for result in view.save_many(jobs, prefetch=pool):
+            ...
+        pool.close()  # Removes the copies, the original iframe is shown again
+
+    Iframes rather than tabs: WebDriver only scripts the current tab, and switching to a tab brings it to the front,
+    so tabs can't be loaded in the background. Each iframe gets the pdf_dom_status hook before it is navigated, its
+    whole load is recorded even when the pixels of a hidden iframe can't be read.
+"""
+
+import inspect
+import threading
+from pdf_dom_status import HOOK_SCRIPT
+from error_log import error_message as _error_message
+
+
+"""Adds a hidden copy of arguments[0] stacked over it and returns it."""
+OPEN_SCRIPT = """
+var template = arguments[0];
+var copy = template.cloneNode(false);
+copy.removeAttribute("id");
+copy.removeAttribute("name");
+copy.src = "about:blank";
+copy.style.position = "absolute";
+copy.style.left = template.offsetLeft + "px";
+copy.style.top = template.offsetTop + "px";
+copy.style.width = template.offsetWidth + "px";
+copy.style.height = template.offsetHeight + "px";
+copy.style.visibility = "hidden";
+template.parentNode.insertBefore(copy, template.nextSibling);
+return copy;
+"""
+
+"""Shows arguments[0] and hides arguments[1]."""
+SHOW_SCRIPT = """
+arguments[0].style.visibility = "visible";
+if (arguments[1] && arguments[1] !== arguments[0]) { arguments[1].style.visibility = "hidden"; }
+"""
+
+"""Navigates arguments[0] to arguments[1]."""
+LOAD_SCRIPT = """
+arguments[0].src = arguments[1];
+"""
+
+"""Removes arguments[0] from the page."""
+CLOSE_SCRIPT = """
+arguments[0].parentNode.removeChild(arguments[0]);
+"""
+
+
+class PrefetchPool:
+    """Up to depth + 1 pdfView iframes loading or showing documents plus max_held keeping saved ones: load() a
+    document into a free one, show() it when it's needed, recycle() it once its download is complete. Copies are
+    added on first use. Thread-safe."""
+
+    def __init__(self, pdf_iframe, depth=1, max_held=4):
+        self.template = pdf_iframe
+        self.depth = depth
+        self.max_held = max_held
+        self.prefetched = 0  # Documents loaded
+        self.recycled = 0  # Iframes blanked for reuse
+        self.__frames = [pdf_iframe]
+        self.__free = [pdf_iframe]
+        self.__visible = pdf_iframe
+        self.__lock = threading.Lock()
+
+    @property  # Get
+    def capacity(self):
+        """Documents loading or showing at a time."""
+        return self.depth + 1
+
+    @property  # Get
+    def max_frames(self):
+        return self.capacity + self.max_held
+
+    @property  # Get
+    def free(self):
+        """Iframes ready to load a document, including ones not added to the page yet."""
+        with self.__lock:
+            return len(self.__free) + self.max_frames - len(self.__frames)
+
+    @property  # Get
+    def visible(self):
+        return self.__visible
+
+    def load(self, source):
+        """Starts loading source into a free iframe and returns the iframe. source: the document URL, or a
+        callable navigate(pdf_iframe). Raises RuntimeError when every iframe is in use."""
+        with self.__lock:
+            if self.__free:
+                pdf_iframe = self.__free.pop()
+            elif len(self.__frames) < self.max_frames:
+                pdf_iframe = self.template.parent.execute_script(OPEN_SCRIPT, self.template)
+                self.__frames.append(pdf_iframe)
+            else:
+                raise RuntimeError(f"All {self.max_frames} prefetch iframes are in use")
+        try:
+            driver = pdf_iframe.parent
+            driver.execute_script(HOOK_SCRIPT, pdf_iframe)  # Record the whole load, see pdf_dom_status.
+            if callable(source):
+                source(pdf_iframe)
+            else:
+                driver.execute_script(LOAD_SCRIPT, pdf_iframe, source)
+        except Exception:
+            self.recycle(pdf_iframe)
+            raise
+        self.prefetched += 1
+        return pdf_iframe
+
+    def show(self, pdf_iframe):
+        """Makes pdf_iframe the visible one (the one clicked and saved)."""
+        pdf_iframe.parent.execute_script(SHOW_SCRIPT, pdf_iframe, self.__visible)
+        self.__visible = pdf_iframe
+
+    def recycle(self, pdf_iframe):
+        """Blanks pdf_iframe, releasing its document, and returns it to the free list."""
+        try:
+            pdf_iframe.parent.execute_script(LOAD_SCRIPT, pdf_iframe, "about:blank")
+        except Exception as e:  # Still reusable, the next load() navigates it anyway.
+            _error_message(e, inspect.currentframe())
+        with self.__lock:
+            if pdf_iframe not in self.__free:
+                self.__free.append(pdf_iframe)
+        self.recycled += 1
+
+    def close(self):
+        """Removes the copies and shows the original iframe again."""
+        with self.__lock:
+            copies, self.__frames, self.__free = self.__frames[1:], self.__frames[:1], self.__frames[:1]
+        try:
+            self.show(self.template)
+            for pdf_iframe in copies:
+                pdf_iframe.parent.execute_script(CLOSE_SCRIPT, pdf_iframe)
+        except Exception as e:
+            _error_message(e, inspect.currentframe())
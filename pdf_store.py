@@ -0,0 +1,123 @@
+"""
+PDF Store - post-save stage: validates saved PDFs and de-duplicates them in a content-addressed store
+    Every file is streamed once in fixed size chunks (constant memory), computing its SHA-256 and checking the
+    "%PDF-" header and the trailing "%%EOF" marker. Valid files go into the store as objects/<ab>/<sha256>.pdf and
+    the requested path becomes a hard link to that object, so the same document saved into many folders takes
+    the space of one. Store and saved files must be on the same volume for hard links, otherwise files are only
+    validated.
+
+        stage = PostSaveStage(ContentStore("D:\\PdfStore"))
+        result = stage.process(full_path)  # or stage.submit(full_path) -> Future
+        if not result.ok:
+            ...  # corrupt / incomplete, save it again
+
+    Hard linked paths share their content: editing one in place changes all of them. Replacing a file (as the Save
+    As dialog does) is safe.
+"""
+
+import os
+import inspect
+import logging
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from error_log import error_message as _error_message
+
+
+"""PDF markers. Readers accept the header within the first 1024 bytes and %%EOF within the last 1024 bytes."""
+PDF_HEADER = b"%PDF-"
+PDF_EOF = b"%%EOF"
+MARKER_WINDOW = 1024
+
+"""Outcome of the post-save stage for one file. duplicate: the content was already stored and path now links to
+it. error: why the file is not a complete PDF, or None."""
+StoreResult = namedtuple("StoreResult", ["path", "ok", "sha256", "size", "duplicate", "error"])
+
+
+def hash_and_validate(path, chunk_size=1 << 20):
+    """Streams path once. Returns (sha256 hex digest, size, error), error is None for a complete PDF."""
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    tail = b""
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if len(head) < MARKER_WINDOW:
+                head += chunk[:MARKER_WINDOW - len(head)]
+            tail = (tail + chunk)[-MARKER_WINDOW:]
+    if size == 0:
+        error = "empty file"
+    elif PDF_HEADER not in head:
+        error = "no %PDF- header"
+    elif PDF_EOF not in tail:
+        error = "no %%EOF marker, file is truncated"
+    else:
+        error = None
+    return digest.hexdigest(), size, error
+
+
+class ContentStore:
+    """Directory of PDFs named by their SHA-256. Thread-safe."""
+
+    def __init__(self, root):
+        self.root = root
+        self.__lock = threading.Lock()
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, "objects", sha256[:2], sha256 + ".pdf")
+
+    def add(self, path, sha256):
+        """Stores the content of path under sha256 and makes path a hard link to the stored object. Returns True
+        if the content was already stored (path now shares it), False if path became the stored object."""
+        object_path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with self.__lock:
+            if not os.path.exists(object_path):
+                os.link(path, object_path)  # New content: the saved file itself becomes the object.
+                return False
+        if os.path.samefile(path, object_path):
+            return True
+        link_path = path + ".link"
+        os.link(object_path, link_path)
+        os.replace(link_path, path)  # Atomic, path is never missing.
+        return True
+
+
+class PostSaveStage:
+    """Worker pool running hash_and_validate() and ContentStore.add() on saved files. Without a store files are
+    only validated."""
+
+    def __init__(self, store=None, max_workers=4, chunk_size=1 << 20):
+        self.store = store
+        self.chunk_size = chunk_size  # Memory per worker is about one chunk, whatever the file size.
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="PostSaveStage")
+
+    def process(self, path):
+        """Validates and stores one file, returns its StoreResult."""
+        try:
+            sha256, size, error = hash_and_validate(path, self.chunk_size)
+        except OSError as e:
+            return StoreResult(path, False, None, 0, False, str(e))
+        if error is not None:
+            logging.warning(f"Corrupt PDF: {path} ({error})")
+            return StoreResult(path, False, sha256, size, False, error)
+        duplicate = False
+        if self.store is not None:
+            try:
+                duplicate = self.store.add(path, sha256)
+            except OSError as e:  # e.g. another volume or link limit: keep the file as it is.
+                _error_message(e, inspect.currentframe())
+        return StoreResult(path, True, sha256, size, duplicate, None)
+
+    def submit(self, path):
+        """process() on the worker pool, returns a Future."""
+        return self.__executor.submit(self.process, path)
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
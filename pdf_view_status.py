@@ -0,0 +1,115 @@
+"""
+PDF View Status - classifies the PDFViewer state ("Unknown", "Empty", "Loading", "Loaded") from screen pixels
+    One small region around the hotspot is grabbed per tick and several probe points inside it are classified at
+    once with NumPy (distance to the nearest palette color, within a tolerance), so anti-aliasing, themes and DPI
+    scaling no longer leave the status stuck on "Unknown".
+
+    Palettes map a status to one or more RGB colors and can be loaded from JSON:
+        {"light": {"Loaded": [[241, 241, 241]], ...}, "dark": {...}}
+"""
+
+import json
+import backends
+from time import perf_counter
+
+
+"""Colors sampled from the Chrome PDF viewer toolbar (the original exact-match values)."""
+DEFAULT_PALETTES = {
+    "default": {
+        "Loading": [(50, 54, 57)],
+        "Empty": [(169, 169, 169)],
+        "Loaded": [(241, 241, 241), (66, 70, 73)],
+    },
+}
+
+"""Probe points as (dx, dy) offsets from the hotspot."""
+DEFAULT_PROBE_OFFSETS = ((0, 0), (-3, 0), (3, 0), (0, -2), (0, 2))
+
+
+"""Backends (imported on first use)"""
+np = backends.register_module("numpy", "numpy")  # Install via 'numpy'
+ImageGrab = backends.register_module("ImageGrab", "PIL.ImageGrab")  # Install via 'Pillow'
+
+
+def load_palettes(path):
+    """Reads palettes from a JSON file: {palette name: {status: [[r, g, b], ...]}}."""
+    with open(path, "r", encoding="utf-8") as file:
+        palettes = json.load(file)
+    return {name: {status: [tuple(color) for color in colors] for status, colors in palette.items()}
+            for name, palette in palettes.items()}
+
+
+class PdfViewStatusClassifier:
+    """Classifies probe pixels against one or more palettes. A probe matches the status of its nearest palette
+    color if it lies within tolerance (Euclidean RGB distance); the status with the most matching probes wins."""
+
+    def __init__(self, palettes=None, tolerance=12.0):
+        self.tolerance = tolerance
+        self.palettes = DEFAULT_PALETTES if palettes is None else palettes
+
+    @property  # Get
+    def palettes(self):
+        return self.__palettes
+
+    @palettes.setter  # Set
+    def palettes(self, value):
+        """Flattens all palettes into one color table, so classification is one vectorized distance computation."""
+        self.__palettes = value
+        statuses, colors = [], []
+        for palette in value.values():
+            for status, status_colors in palette.items():
+                for color in status_colors:
+                    statuses.append(status)
+                    colors.append(color)
+        self.__statuses = sorted(set(statuses))
+        self.__color_status = np.array([self.__statuses.index(status) for status in statuses], dtype=np.intp)
+        self.__colors = np.array(colors, dtype=np.float32).reshape(-1, 3)
+
+    def classify_pixels(self, pixels):
+        """pixels: (N, 3) RGB array. Returns the winning status or "Unknown"."""
+        pixels = np.asarray(pixels, dtype=np.float32).reshape(-1, 3)
+        if len(self.__colors) == 0 or len(pixels) == 0:
+            return "Unknown"
+        distances = np.linalg.norm(pixels[:, None, :] - self.__colors[None, :, :], axis=2)  # (N probes, M colors)
+        nearest = distances.argmin(axis=1)
+        matched = distances[np.arange(len(pixels)), nearest] <= self.tolerance
+        if not matched.any():
+            return "Unknown"
+        votes = np.bincount(self.__color_status[nearest[matched]], minlength=len(self.__statuses))
+        return self.__statuses[int(votes.argmax())]
+
+    def classify_image(self, image, points):
+        """image: PIL image or (H, W, 3+) array, points: (x, y) pixel positions inside it."""
+        array = np.asarray(image)
+        points = np.asarray(points, dtype=np.intp).reshape(-1, 2)
+        inside = (points[:, 0] >= 0) & (points[:, 0] < array.shape[1]) & (points[:, 1] >= 0) & \
+                 (points[:, 1] < array.shape[0])
+        points = points[inside]
+        return self.classify_pixels(array[points[:, 1], points[:, 0], :3])
+
+
+class PdfViewStatusSampler:
+    """Grabs the region around the hotspot that covers all probe points (one capture per tick) and classifies it.
+    last_latency / last_classify_latency hold the time of the last sample and of the classification alone."""
+
+    def __init__(self, classifier=None, probe_offsets=DEFAULT_PROBE_OFFSETS, grab=None):
+        self.classifier = PdfViewStatusClassifier() if classifier is None else classifier
+        self.probe_offsets = probe_offsets
+        self.grab = grab  # grab(bbox=(left, top, right, bottom)) -> image, None uses the ImageGrab backend.
+        self.last_latency = 0.0
+        self.last_classify_latency = 0.0
+
+    def sample(self, hit_point):
+        start_time = perf_counter()
+        offsets = np.asarray(self.probe_offsets, dtype=np.intp).reshape(-1, 2)
+        left, top = offsets.min(axis=0)
+        right, bottom = offsets.max(axis=0) + 1
+        grab = ImageGrab.grab if self.grab is None else self.grab
+        image = grab(bbox=(int(hit_point[0] + left), int(hit_point[1] + top),
+                           int(hit_point[0] + right), int(hit_point[1] + bottom)))
+        classify_start_time = perf_counter()
+        status = self.classifier.classify_image(image, offsets - (left, top))
+        end_time = perf_counter()
+        self.last_classify_latency = end_time - classify_start_time
+        self.last_latency = end_time - start_time
+        return status
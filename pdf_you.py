@@ -4,23 +4,176 @@ https://stackoverflow.com/questions/56986848/how-to-download-embedded-pdf-from-w
 """
 
 import inspect
-import pyautogui
-from com_on_dlg_man import SaveAsCommonDlg
-import win32gui
-from time import sleep
-from PIL import ImageGrab  # Install via 'Pillow'
-from PIL.Image import Image
-from selenium.webdriver.common.action_chains import ActionChains
+import queue
+import weakref
+import itertools
+import functools
+import collections
+import backends
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+from com_on_dlg_man import CommonDlgSession, SaveAsCommonDlg, find_owned_windows, dialogs_claimed
+from click_strategies import FallbackClick, PostMessageClick, PointerClick
+from download_watch import DownloadCompletionDetector
+from pdf_view_status import PdfViewStatusSampler
+from pdf_dom_status import DomPdfViewStatus
+from pdf_fetch import get_default_fetcher, extract_iframe_blob
+from poll_scheduler import Backoff, wait_on_caller, wait_on_caller_async
+from window_events import get_default_event_source, EVENT_OBJECT_LOCATIONCHANGE
+from phase_metrics import span
+from save_policy import SavePolicy, CircuitOpenError, DialogNotFoundError, DialogCloseTimeoutError, \
+    PdfLoadTimeoutError
+from time import time
 # from selenium.webdriver.support.ui import WebDriverWait
 # from selenium.webdriver.support import expected_conditions as ec
 # from selenium.webdriver.common.by import By
 import logging
+from error_log import error_message as _error_message
 
 
-def _error_message(e, details):
-    calling_function_name = inspect.getframeinfo(details).function
-    logging.error("The exception type is:", type(e), f"An error occurred in function: "
-                                                     f"{calling_function_name}", f"Error details: {e}")
+def _wait_for_saved_file(full_path, start_time, wait_time=300, post_save=None, transfer=None):
+    """Waits for the download to full_path to complete and returns its SaveResult (used by save_many). transfer:
+    the staging transfer's Future when the file was staged, waited for instead of watching full_path. With a
+    pdf_store.PostSaveStage the file is then validated (and stored), a corrupt file is a failed SaveResult."""
+    if transfer is not None:  # Complete once the transfer has renamed it into place.
+        try:
+            size = transfer.result(wait_time)
+        except Exception as e:
+            return SaveResult(full_path, False, time() - start_time, 0, e)
+    else:
+        detector = DownloadCompletionDetector(full_path)
+        try:
+            detector.wait(wait_time)
+        except Exception as e:
+            return SaveResult(full_path, False, time() - start_time, detector.size, e)
+        size = detector.size
+    if post_save is not None:
+        stored = post_save.process(full_path)
+        if not stored.ok:
+            return SaveResult(full_path, False, time() - start_time, stored.size,
+                              IOError(f"Corrupt PDF {full_path}: {stored.error}"))
+    return SaveResult(full_path, True, time() - start_time, size, None)
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported on first use, see backends.
+win32gui = backends.register_module("win32gui", "win32gui")
+ActionChains = backends.register_module("ActionChains", "selenium.webdriver.common.action_chains", "ActionChains")
+
+
+def _save_as_dialog_opened(hwnd_parent):
+    """FallbackClick confirm, called before the click: returns a predicate that is True once a Save As dialog owned
+    by hwnd_parent opened after the click, also when a DialogResponder has already claimed and closed it."""
+    open_before = set(find_owned_windows(hwnd_parent, "#32770", "Save As"))
+    claimed_before = dialogs_claimed(hwnd_parent, "Save As")
+
+    def dialog_opened():
+        return dialogs_claimed(hwnd_parent, "Save As") != claimed_before or \
+            any(hwnd not in open_before for hwnd in find_owned_windows(hwnd_parent, "#32770", "Save As"))
+    return dialog_opened
+
+
+"""Download button click: posted mouse messages (no cursor move, no focus needed) first, the real mouse if they
+have no effect. Pass click_strategy to ClassPDFView to use another one."""
+DEFAULT_CLICK_STRATEGY = FallbackClick([PostMessageClick(), PointerClick()], confirm=_save_as_dialog_opened)
+
+"""Outcome of one save_many() job. latency is from the start of navigation until the file was complete."""
+SaveResult = namedtuple("SaveResult", ["full_path", "ok", "latency", "size", "error"])
+
+
+class BatchSummary:
+    """Running throughput and latency figures for save_many()."""
+
+    def __init__(self):
+        self.start_time = time()
+        self.end_time = None
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+        self.end_time = time()
+
+    @property  # Get
+    def succeeded(self):
+        return sum(1 for result in self.results if result.ok)
+
+    @property  # Get
+    def failed(self):
+        return len(self.results) - self.succeeded
+
+    @property  # Get
+    def elapsed(self):
+        return (self.end_time or time()) - self.start_time
+
+    @property  # Get
+    def documents_per_minute(self):
+        return 60 * self.succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property  # Get
+    def bytes_per_second(self):
+        return sum(result.size for result in self.results if result.ok) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def latency_percentile(self, percentile):
+        latencies = sorted(result.latency for result in self.results if result.ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def __str__(self):
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        return (f"{self.succeeded} saved, {self.failed} failed in {self.elapsed:.1f} s "
+                f"({self.documents_per_minute:.1f} docs/min, {self.bytes_per_second / 1e6:.2f} MB/s), latency "
+                f"p50 {p50 if p50 is None else round(p50, 2)} s, p95 {p95 if p95 is None else round(p95, 2)} s")
+
+
+class HotspotGeometry:
+    """Browser window rect and PDFViewer iframe rect. The iframe rect costs a WebDriver round-trip and is only
+    fetched again (with one rect call instead of location + size) after GetWindowRect returned a different rect or
+    a location change event arrived for the browser window. round_trips_avoided counts the calls saved compared
+    with fetching location and size every time. Location changes are only subscribed to on a source that delivers
+    them (the default WinEventSource doesn't, moves are caught by GetWindowRect)."""
+
+    def __init__(self, hwnd_parent, pdf_iframe, event_source=None):
+        self.hwnd_parent = hwnd_parent
+        self.pdf_iframe = pdf_iframe
+        self.hits = 0
+        self.misses = 0
+        self.__browser_rect = None
+        self.__iframe_rect = None
+        self.__stale = True
+        source = get_default_event_source() if event_source is None else event_source
+        if source is not None and (source.events is None or EVENT_OBJECT_LOCATIONCHANGE in source.events):
+            source.subscribe(self.__location_change_function(weakref.ref(self), hwnd_parent, source))
+
+    @staticmethod
+    def __location_change_function(geometry_ref, hwnd_parent, source):
+        """Holds the geometry weakly and unsubscribes once it is gone."""
+        def on_location_change(event, hwnd):
+            geometry = geometry_ref()
+            if geometry is None:
+                source.unsubscribe(on_location_change)
+            elif event == EVENT_OBJECT_LOCATIONCHANGE and hwnd == hwnd_parent:
+                geometry.invalidate()
+        return on_location_change
+
+    @property  # Get
+    def round_trips_avoided(self):
+        return 2 * self.hits + self.misses
+
+    def invalidate(self):
+        self.__stale = True
+
+    def get(self):
+        """Returns (browser window rect, iframe rect {"x", "y", "width", "height"})."""
+        browser_rect = tuple(win32gui.GetWindowRect(self.hwnd_parent))
+        if self.__stale or browser_rect != self.__browser_rect:
+            self.__stale = False  # Before fetching, so a move during the fetch invalidates again.
+            self.__iframe_rect = self.pdf_iframe.rect
+            self.__browser_rect = browser_rect
+            self.misses += 1
+        else:
+            self.hits += 1
+        return browser_rect, self.__iframe_rect
 
 
 class ClassPDFView:
@@ -31,48 +184,41 @@ class ClassPDFView:
     __hwndParent = 0
     __pdf_loaded = False
     __pdf_view_is_initialized = None
+    __hotspot_geometry = None  # HotspotGeometry, rebuilt when hwnd_parent or pdf_view_element change
+    batch_summary = None  # BatchSummary of the last save_many()
 
     def __refresh_pdf_view_status(self):  # , x_pos = 1593, y_pos = 375) -> str:
         """ Tests image in PDFViewer for color to determine status. Returns (str): "Unknown", "Empty", "Loading",
         "Loaded"" """
-        try:
-            image = self.__get_pixel_color_imagegrab()
+        """Asks the page first (pdf_dom_status, sampled off this thread), works for minimized and background windows.
+        Falls back to several probe points around the hotspot classified with tolerance, see pdf_view_status. The
+        page reports "Loaded" before the toolbar is painted, so while the window is on screen that is only taken
+        once the pixels no longer show the Loading / Empty colors (a covered window reads "Unknown" and is
+        trusted). A failing pixel grab raises (it ends the wait with that error instead of polling until the
+        timeout)."""
+        status = None if self.dom_status is None else self.dom_status.sample_nowait(self.pdf_view_element)
+        if status is None:
             # win32api.SetCursorPos((save_dx, save_dy))
-            self.pdf_view_status = "Unknown"
-            if image == (50, 54, 57):
-                self.pdf_view_status = "Loading"
-            elif image == (169, 169, 169):
-                self.pdf_view_status = "Empty"
-            elif image == (241, 241, 241) or image == (66, 70, 73):
-                self.pdf_view_status = "Loaded"
-            return self.pdf_view_status
-        except Exception as e:
-            _error_message(e, inspect.currentframe())
+            status = self.status_sampler.sample(self.hit_point)
+        elif status == "Loaded" and not win32gui.IsIconic(self.hwnd_parent):
+            if self.status_sampler.sample(self.hit_point) in ("Loading", "Empty"):
+                status = "Loading"  # Toolbar not painted yet.
+        self.pdf_view_status = status
+        return self.pdf_view_status
 
     def __update_pdf_view_hotspot(self):
         """ finds the pdfView hotspot test pixel """
+        """Geometry is cached, see HotspotGeometry and hotspot_geometry."""
         # Get the top-left and bottom-right coordinates of the window.
-        browser_rect = win32gui.GetWindowRect(self.hwnd_parent)
+        browser_rect, element_rect = self.hotspot_geometry.get()
         # pyautogui.moveTo(rect[2] - rect[0], rect[3] - rect[1])  # This is bottom right corner of browser window.
-        element_x = self.pdf_view_element.location["x"]  # X-coordinate
-        element_y = self.pdf_view_element.location["y"]  # Y-coordinate
-        element_width = self.pdf_view_element.size["width"]  # Width
+        element_x = element_rect["x"]  # X-coordinate
+        element_y = element_rect["y"]  # Y-coordinate
+        element_width = element_rect["width"]  # Width
         self.hit_point = ([browser_rect[0] + (element_x + element_width) - 108, browser_rect[1] + element_y + 159])
         # __y_hit_point = element_y + 169  # 375 When: "Chrome is being controlled by automated test
         # pyautogui.moveTo(self.hit_point[0], self.hit_point[1])  # Test
 
-    def __get_pixel_color_imagegrab(self) -> Image:
-        # Capture a region around the pixel (1x1)
-        pixel_region = (self.hit_point[0], self.hit_point[1], self.hit_point[0] + 1,
-                        self.hit_point[1] + 1)
-
-        # Capture the pixel
-        pixel_image = ImageGrab.grab(bbox=pixel_region)
-
-        # Get the color of the pixel
-        pixel_color = pixel_image.getpixel((0, 0))
-        return pixel_color
-
     # def __get_pixel_color(self, hwnd, x, y):
     #     """Get the color of a pixel in an inactive window."""
     #     pixel_color = win32gui.GetPixel(hwnd, x, y)
@@ -87,31 +233,271 @@ class ClassPDFView:
     #         print("Blue:", pixel_color & 0xFF)
 
     def save_pdf(self, full_path, make_directory=True, file_overwrite=True):
+        """Saves the document through the Download button and the Save As dialog. Failed attempts are retried as
+        self.policy allows (see save_policy), then the last error is raised. With self.staging the transfer's
+        Future is returned (see staging), None when an existing full_path was kept."""
+        with span("save_pdf"):
+            return self.__save_with_policy(full_path, make_directory, file_overwrite, True)
+        # os.chdir(saved_working_directory)
+
+    def fetch_pdf(self, full_path, make_directory=True, file_overwrite=True, fetcher=None):
+        """Direct-fetch mode: streams the iframe's document to full_path over HTTP with the browser's cookies,
+        without clicking or a Save As dialog (works headless). Returns the number of bytes written."""
+        self.pdf_view_save_full_path = full_path
+        fetcher = get_default_fetcher() if fetcher is None else fetcher
+        with span("fetch"):
+            size = fetcher.fetch_iframe(self.pdf_view_element, full_path, make_directory, file_overwrite)
+        logging.info(f"Downloaded: {full_path} ({size} bytes)")
+        return size
+
+    def extract_pdf(self, full_path, make_directory=True, file_overwrite=True, chunk_size=4 << 20):
+        """In-page extraction mode for blob: documents (or a pdf.js viewer's loaded document) that fetch_pdf() cannot
+        reach: the page hands its document back in bounded chunks. Not for POST generated documents, see pdf_fetch.
+        Returns the number of bytes written."""
+        self.pdf_view_save_full_path = full_path
+        with span("extract"):
+            size = extract_iframe_blob(self.pdf_view_element, full_path, chunk_size, make_directory, file_overwrite)
+        logging.info(f"Downloaded: {full_path} ({size} bytes)")
+        return size
+
+    def __save_with_policy(self, full_path, make_directory, file_overwrite, wait_for_file):
+        """__start_save_pdf() through self.policy. Retries show the same document, so they skip the unload wait."""
+        attempts = itertools.count()
+        return self.policy.call(lambda: self.__start_save_pdf(full_path, make_directory, file_overwrite,
+                                                              wait_for_file, next(attempts) == 0))
+
+    def __start_save_pdf(self, full_path, make_directory, file_overwrite, wait_for_file, new_document=True):
+        """Waits for the document to load, clicks Download and fills the Save As dialog. Returns the staging
+        transfer's Future, None without staging."""
+        # Set the process as the foreground window
+        # Could also save the window Z-order and reset here.
+        # win32gui.SetForegroundWindow(hwnd)
+        self.pdf_view_save_full_path = full_path
+
+        self.__update_pdf_view_hotspot()  # Browser window can move.
+
+        # Wait for unload of previous pdf after first load
+        if self.__pdf_view_is_initialized and new_document:
+            with span("pdf_unload"):
+                self.wait_for_pdf_view_status("Loaded", negate=True, wait_time=self.policy.timeout("pdf_load"))
+
+        with span("pdf_load"):
+            self.wait_for_pdf_view_status("Loaded", wait_time=self.policy.timeout("pdf_load"))
+        self.pdf_view_is_initialized = True
+
+        expected_dialog = None
+        if self.dialog_responder is not None:  # Armed before the click, see dialog_responder.
+            expected_dialog = self.dialog_responder.expect_save_as(self.hwnd_parent, self.pdf_view_save_full_path,
+                                                                   make_directory, file_overwrite, wait_for_file,
+                                                                   self.staging, self.__dialog_session())
+
+        with span("click"):
+            try:
+                self.__click_pdfview_download_button()
+            except Exception:
+                if expected_dialog is not None:  # No dialog is coming, stop the responder waiting for it.
+                    expected_dialog.cancel()
+                raise
+
+        if expected_dialog is not None:
+            result_time = self.__dialog_wait_time(wait_for_file)
+            try:
+                transfer = expected_dialog.result(result_time)
+            except FuturesTimeoutError:  # The responder enforces each phase, this only catches a wedged loop.
+                expected_dialog.cancel()
+                raise DialogCloseTimeoutError(f"Save As dialog not handled within {result_time} s")
+            return transfer if self.staging is not None else None
+        obj = SaveAsCommonDlg(session=self.__dialog_session())  # Only the Save As dialog owned by this window.
+        return obj.save_as_window_interact(self.pdf_view_save_full_path, make_directory, file_overwrite,
+                                           wait_for_file, self.staging)
+
+    def save_many(self, jobs, make_directory=True, file_overwrite=True, max_pending=4, wait_time=300,
+                  post_save=None, prefetch=None):
+        """Pipelined save_pdf() for an iterable (or generator) of (navigate, full_path) jobs, where navigate() loads
+        the next document into this viewer. Once a Save As dialog has closed, the wait for that file runs on a
+        worker thread while the next document is navigated to and loaded. Yields a SaveResult per job as each
+        download finishes; throughput and latency figures are kept in self.batch_summary. post_save: optional
+        pdf_store.PostSaveStage, run on each finished file by the same worker thread. Saves are retried as
+        self.policy allows, CircuitOpenError stops the batch.
+        prefetch: optional pdf_prefetch.PrefetchPool, jobs are then (url or navigate(pdf_iframe), full_path) and
+        the next prefetch.depth documents load in hidden iframes while the current one is saved."""
+        self.batch_summary = BatchSummary()
+        pending = set()
+        if prefetch is None:
+            jobs = ((navigate, full_path, None) for navigate, full_path in jobs)
+        else:
+            jobs = self.__prefetched_jobs(jobs, prefetch)
+        with ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="save_many") as executor:
+            for navigate, full_path, release in jobs:
+                start_time = time()
+                future = None
+                try:
+                    navigate()
+                    transfer = self.__save_with_policy(full_path, make_directory, file_overwrite, False)
+                    future = executor.submit(_wait_for_saved_file, full_path, start_time, wait_time, post_save,
+                                             transfer)
+                    pending.add(future)
+                except CircuitOpenError:  # Desktop / browser wedged, stop the batch.
+                    raise
+                except Exception as e:
+                    _error_message(e, inspect.currentframe())
+                    yield self.__add_batch_result(SaveResult(full_path, False, time() - start_time, 0, e))
+                finally:  # The document is needed until its download is complete.
+                    if release is not None:
+                        if future is None:
+                            release()
+                        else:
+                            future.add_done_callback(lambda _future, release=release: release())
+
+                # Hand back what has finished, and block only when too many downloads are in flight.
+                done, pending = wait(pending, timeout=0 if len(pending) < max_pending else None,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self.__add_batch_result(future.result())
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self.__add_batch_result(future.result())
+        logging.info(f"save_many: {self.batch_summary}")
+
+    def __prefetched_jobs(self, jobs, prefetch):
+        """(navigate, full_path, release) jobs for save_many(): keeps prefetch loaded ahead, navigate() shows the
+        loaded iframe. save_many() calls release() once the job's download is complete or the job failed, the
+        iframe is recycled here then (on the thread driving WebDriver). While prefetch.max_held iframes are still
+        downloading the next load waits for one."""
+        loaded = collections.deque()  # (pdf_iframe or the load error, full_path)
+        released = queue.Queue()
+        busy = 0  # Shown iframes not released yet
+        jobs = iter(jobs)
         try:
-            # Set the process as the foreground window
-            # Could also save the window Z-order and reset here.
-            # win32gui.SetForegroundWindow(hwnd)
-            self.pdf_view_save_full_path = full_path
-
-            self.__update_pdf_view_hotspot()  # Browser window can move.
-
-            # Wait for unload of previous pdf after first load
-            if self.__pdf_view_is_initialized:
-                while self.__refresh_pdf_view_status() == "Loaded":
-                    sleep(0.1)
-
-            while self.__refresh_pdf_view_status() != "Loaded":
-                sleep(0.1)
-            self.pdf_view_is_initialized = True
-
-            self.__click_pdfview_download_button()
-
-            obj = SaveAsCommonDlg()
-            obj.save_as_window_interact(self.pdf_view_save_full_path, make_directory, file_overwrite)
-
-            # os.chdir(saved_working_directory)
-        except Exception as e:
-            _error_message(e, inspect.currentframe())
+            while True:
+                while not released.empty():
+                    prefetch.recycle(released.get())
+                    busy -= 1
+                room = min(prefetch.capacity, prefetch.max_frames - busy) - len(loaded)
+                for source, full_path in itertools.islice(jobs, max(0, room)):
+                    try:
+                        loaded.append((prefetch.load(source), full_path))
+                    except Exception as e:  # Reported by navigate(), as a failed job.
+                        loaded.append((e, full_path))
+                if not loaded:
+                    job = next(jobs, None)
+                    if job is None:  # Leave every iframe blank.
+                        for _ in range(busy):
+                            prefetch.recycle(released.get())
+                        return
+                    jobs = itertools.chain([job], jobs)
+                    prefetch.recycle(released.get())  # Every iframe is held, wait for a download.
+                    busy -= 1
+                    continue
+                pdf_iframe, full_path = loaded.popleft()
+                if isinstance(pdf_iframe, Exception):
+                    yield functools.partial(self.__show_prefetched, prefetch, pdf_iframe), full_path, None
+                else:
+                    busy += 1
+                    yield functools.partial(self.__show_prefetched, prefetch, pdf_iframe), full_path, \
+                        functools.partial(released.put, pdf_iframe)
+        finally:  # Batch stopped early. Iframes still downloading keep their documents until prefetch.close().
+            for pdf_iframe, _full_path in loaded:
+                if not isinstance(pdf_iframe, Exception):
+                    prefetch.recycle(pdf_iframe)
+            while not released.empty():
+                prefetch.recycle(released.get())
+
+    def __show_prefetched(self, prefetch, pdf_iframe):
+        if isinstance(pdf_iframe, Exception):
+            raise pdf_iframe
+        prefetch.show(pdf_iframe)
+        self.pdf_view_element = pdf_iframe
+        self.pdf_view_is_initialized = None  # Loaded from about:blank, no previous document to wait for.
+
+    def __add_batch_result(self, result):
+        self.batch_summary.add(result)
+        return result
+
+    async def save_pdf_async(self, full_path, make_directory=True, file_overwrite=True, wait_time=None):
+        """Awaitable save_pdf(). Nothing blocks the event loop while waiting, so one loop can supervise many
+        ClassPDFView instances. Cancellation and deadlines (asyncio.wait_for / asyncio.timeout) apply to every
+        wait and errors are raised rather than logged. wait_time: seconds per document load, default the
+        policy's pdf_load timeout. Failed attempts are retried as self.policy allows, like save_pdf()."""
+        wait_time = self.policy.timeout("pdf_load") if wait_time is None else wait_time
+        attempts = itertools.count()
+        with span("save_pdf"):
+            return await self.policy.call_async(lambda: self.__start_save_pdf_async(
+                full_path, make_directory, file_overwrite, wait_time, next(attempts) == 0))
+
+    async def __start_save_pdf_async(self, full_path, make_directory, file_overwrite, wait_time, new_document):
+        """Awaitable __start_save_pdf(), without the responder."""
+        self.pdf_view_save_full_path = full_path
+
+        self.__update_pdf_view_hotspot()  # Browser window can move.
+
+        # Wait for unload of previous pdf after first load
+        if self.__pdf_view_is_initialized and new_document:
+            with span("pdf_unload"):
+                await self.wait_for_pdf_view_status_async("Loaded", negate=True, wait_time=wait_time)
+
+        with span("pdf_load"):
+            await self.wait_for_pdf_view_status_async("Loaded", wait_time=wait_time)
+        self.pdf_view_is_initialized = True
+
+        with span("click"):
+            await self.__click_pdfview_download_button_async()
+
+        obj = await SaveAsCommonDlg.create_async(session=self.__dialog_session())
+        return await obj.save_as_window_interact_async(self.pdf_view_save_full_path, make_directory, file_overwrite,
+                                                       staging=self.staging)
+
+    def __dialog_session(self):
+        """Save As dialog session owned by this browser window, with the policy's phase timeouts."""
+        return CommonDlgSession(self.hwnd_parent, self.policy.timeout("window_open"),
+                                self.policy.timeout("window_close"), self.policy.timeout("file_wait"),
+                                self.policy.timeout("handle_discovery"))
+
+    def __dialog_wait_time(self, wait_for_file):
+        """Longest a responder can take on the Save As dialog with the policy's phase timeouts, plus a margin."""
+        phases = ("window_open", "handle_discovery", "window_close") + (("file_wait",) if wait_for_file else ())
+        return sum(self.policy.timeout(phase) for phase in phases) + 5
+
+    def __status_events(self):
+        """Event source waking the status waits when the page reports a change, see pdf_dom_status."""
+        return None if self.dom_status is None else self.dom_status.changed
+
+    def __pdf_view_status_function(self, status, negate):
+        """The wait predicate. A negated wait (the unload wait) also takes a status the page only went through
+        between two samples, see DomPdfViewStatus.statuses_since()."""
+        transitions = None if self.dom_status is None else self.dom_status.transitions
+
+        def check_status():
+            current_status = self.__refresh_pdf_view_status()
+            if (current_status == status) != negate:
+                return current_status
+            if negate and transitions is not None:
+                return next((passed for passed in self.dom_status.statuses_since(transitions) if passed != status),
+                            None)
+            return None
+        return check_status
+
+    def wait_for_pdf_view_status(self, status, negate=False, sleep_time=0.1, wait_time=300):
+        """Waits until the PDF viewer reports status (or anything else when negate) and returns the status.
+        Checked on this thread (the pixel fallback grabs the screen, too slow for the shared PollScheduler),
+        backing off up to sleep_time seconds. Raises TimeoutError after wait_time seconds."""
+        current_status = wait_on_caller(self.__pdf_view_status_function(status, negate), wait_time,
+                                        Backoff(maximum=sleep_time), source=self.__status_events())
+        if current_status is None:
+            raise PdfLoadTimeoutError(f"PDF viewer status {'not ' if negate else ''}{status} not reached within "
+                                      f"{wait_time} s")
+        return current_status
+
+    async def wait_for_pdf_view_status_async(self, status, negate=False, sleep_time=0.1, wait_time=300):
+        """Awaitable wait_for_pdf_view_status(). Checked on a worker thread."""
+        current_status = await wait_on_caller_async(self.__pdf_view_status_function(status, negate), wait_time,
+                                                    Backoff(maximum=sleep_time), source=self.__status_events())
+        if current_status is None:
+            raise PdfLoadTimeoutError(f"PDF viewer status {'not ' if negate else ''}{status} not reached within "
+                                      f"{wait_time} s")
+        return current_status
 
     def __click_pdfview_download_button_javascript(self):
         """Tested as a way to remove the mouse move"""
@@ -195,19 +581,27 @@ class ClassPDFView:
         return
 
     def __click_pdfview_download_button(self):
+        """Clicks the Download button. Raises DialogNotFoundError when no click strategy opened the dialog."""
         self.__update_pdf_view_hotspot()
-        try:  # Click the Download button
-            saved_x, saved_y = pyautogui.position()
-            # win32gui.SetActiveWindow(hwnd)
-            pyautogui.click(self.hit_point[0], self.hit_point[1])
-            pyautogui.moveTo(saved_x, saved_y)
-            return
-        except Exception as e:
-            _error_message(e, inspect.currentframe())
+        if not self.click_strategy.click(self.hwnd_parent, self.hit_point):
+            raise DialogNotFoundError(f"Download button click had no effect: {self.pdf_view_save_full_path}")
+
+    async def __click_pdfview_download_button_async(self):
+        """Awaitable __click_pdfview_download_button(), the click is confirmed without blocking the event loop."""
+        self.__update_pdf_view_hotspot()
+        if not await self.click_strategy.click_async(self.hwnd_parent, self.hit_point):
+            raise DialogNotFoundError(f"Download button click had no effect: {self.pdf_view_save_full_path}")
 
-    def __init__(self, hwnd_parent, pdf_iframe):
+    def __init__(self, hwnd_parent, pdf_iframe, status_sampler=None, click_strategy=None, dialog_responder=None,
+                 staging=None, policy=None, dom_status=None):
         self.hwnd_parent = hwnd_parent
         self.pdf_view_element = pdf_iframe
+        self.status_sampler = PdfViewStatusSampler() if status_sampler is None else status_sampler
+        self.dom_status = DomPdfViewStatus() if dom_status is None else dom_status or None  # False: pixels only
+        self.click_strategy = DEFAULT_CLICK_STRATEGY if click_strategy is None else click_strategy  # click_strategies
+        self.dialog_responder = dialog_responder  # DialogResponder filling the Save As dialog, None: done inline
+        self.staging = staging  # staging.StagingArea: save locally, move to the target path in the background
+        self.policy = SavePolicy() if policy is None else policy  # Timeouts, retries and circuit breaker
         # self.pdf_view_save_full_path = pdf_full_path
         return
 
@@ -223,6 +617,7 @@ class ClassPDFView:
     @hwnd_parent.setter  # Set
     def hwnd_parent(self, value):
         self.__hwndParent = value
+        self.__hotspot_geometry = None
 
     @property  # Get
     def pdf_view_status(self):
@@ -239,7 +634,16 @@ class ClassPDFView:
     @pdf_view_element.setter  # Set
     def pdf_view_element(self, value):
         # element = _get_element(driver, By.CSS_SELECTOR, "iframe[class='pdfView']")
+        if value is not self.__pdf_view_element:  # No previous document in another iframe to wait for.
+            self.__pdf_view_is_initialized = None
         self.__pdf_view_element = value
+        self.__hotspot_geometry = None
+
+    @property  # Get
+    def hotspot_geometry(self):
+        if self.__hotspot_geometry is None:
+            self.__hotspot_geometry = HotspotGeometry(self.hwnd_parent, self.pdf_view_element)
+        return self.__hotspot_geometry
 
     @property  # Get
     def pdf_view_save_full_path(self):
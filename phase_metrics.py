@@ -0,0 +1,178 @@
+"""
+Phase Metrics - per-phase timing for the download pipeline (window open, handle discovery, WM_SETTEXT, dialog close,
+file wait, PDF viewer loading, ...)
+    with span("window_open") as phase:
+        ...
+        phase.outcome = "timeout"  # Optional, for waits that give up without raising.
+    Every span records its latency into a histogram along with its outcome ("ok", "timeout", "error"). Retries are
+    counted with count_retry(). Results can be exported as JSON lines or as a Prometheus textfile
+    (node_exporter textfile collector).
+
+    Metrics are disabled by default. While disabled span() returns a shared no-op context manager, so the overhead
+    is one attribute check per phase. Enable with enable() or the environment variable PDF_YOU_METRICS=1.
+"""
+
+import os
+import json
+import threading
+from bisect import bisect_left
+from time import time
+from time import perf_counter
+
+
+"""Histogram bucket upper bounds in seconds."""
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _NullSpan:
+    """Shared span returned while metrics are disabled."""
+    outcome = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _PhaseStats:
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * (len(buckets) + 1)  # Last bucket is +Inf.
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.outcomes = {"ok": 0, "timeout": 0, "error": 0}
+        self.retries = 0
+
+
+class _Span:
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+        self.start_time = 0.0
+        self.outcome = None  # Set to override the outcome, e.g. "timeout" for a wait that gave up without raising.
+
+    def __enter__(self):
+        self.start_time = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.outcome is not None:
+            outcome = self.outcome
+        elif exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, TimeoutError):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        self.metrics.record(self.phase, perf_counter() - self.start_time, outcome)
+        return False
+
+
+class PhaseMetrics:
+    """Thread-safe per-phase latency histograms, outcome and retry counters."""
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.__lock = threading.Lock()
+        self.__phases = {}
+
+    def __stats(self, phase):
+        stats = self.__phases.get(phase)
+        if stats is None:
+            stats = self.__phases[phase] = _PhaseStats(self.buckets)
+        return stats
+
+    def span(self, phase):
+        """Context manager timing one phase. An exception marks it "timeout" (TimeoutError) or "error"."""
+        return _Span(self, phase) if self.enabled else _NULL_SPAN
+
+    def record(self, phase, seconds, outcome="ok"):
+        if not self.enabled:
+            return
+        index = bisect_left(self.buckets, seconds)  # First bucket with seconds <= bound, len(buckets) is +Inf.
+        with self.__lock:
+            stats = self.__stats(phase)
+            stats.bucket_counts[index] += 1
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+
+    def count_retry(self, phase, count=1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__stats(phase).retries += count
+
+    def reset(self):
+        with self.__lock:
+            self.__phases.clear()
+
+    def snapshot(self):
+        """Returns {phase: {...}} with counts, sum, max, outcomes, retries and cumulative histogram buckets."""
+        with self.__lock:
+            result = {}
+            for phase, stats in self.__phases.items():
+                cumulative, running = [], 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), stats.bucket_counts):
+                    running += bucket_count
+                    cumulative.append(["+Inf" if bound == float("inf") else bound, running])
+                result[phase] = {"count": stats.count, "sum": stats.total, "max": stats.max,
+                                 "outcomes": dict(stats.outcomes), "retries": stats.retries, "buckets": cumulative}
+            return result
+
+    def export_jsonl(self, path):
+        """Appends one JSON line per phase, stamped with the current time."""
+        timestamp = time()
+        with open(path, "a", encoding="utf-8") as file:
+            for phase, stats in sorted(self.snapshot().items()):
+                file.write(json.dumps({"time": timestamp, "phase": phase, **stats}) + "\n")
+
+    def prometheus_text(self, prefix="pdf_you"):
+        lines = [f"# HELP {prefix}_phase_seconds Latency of download pipeline phases.",
+                 f"# TYPE {prefix}_phase_seconds histogram"]
+        snapshot = sorted(self.snapshot().items())
+        for phase, stats in snapshot:
+            for bound, count in stats["buckets"]:
+                lines.append(f'{prefix}_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{phase}"}} {stats["sum"]}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+        lines += [f"# HELP {prefix}_phase_outcomes_total Completed phases by outcome.",
+                  f"# TYPE {prefix}_phase_outcomes_total counter"]
+        for phase, stats in snapshot:
+            for outcome, count in sorted(stats["outcomes"].items()):
+                lines.append(f'{prefix}_phase_outcomes_total{{phase="{phase}",outcome="{outcome}"}} {count}')
+        lines += [f"# HELP {prefix}_phase_retries_total Retries per phase.",
+                  f"# TYPE {prefix}_phase_retries_total counter"]
+        for phase, stats in snapshot:
+            lines.append(f'{prefix}_phase_retries_total{{phase="{phase}"}} {stats["retries"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_textfile(self, path, prefix="pdf_you"):
+        """Writes the textfile atomically, so the collector never reads a half written file."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text(prefix))
+        os.replace(temp_path, path)
+
+
+"""Global variables"""
+metrics = PhaseMetrics(enabled=os.environ.get("PDF_YOU_METRICS") == "1")
+
+
+def span(phase):
+    """Times a phase in the process wide metrics."""
+    return metrics.span(phase)
+
+
+def count_retry(phase, count=1):
+    metrics.count_retry(phase, count)
+
+
+def enable(enabled=True):
+    metrics.enabled = enabled
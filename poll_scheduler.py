@@ -0,0 +1,249 @@
+"""
+Poll Scheduler - one thread that services every pending wait in the process
+    Conditions (predicates) are kept on a heap ordered by their next check time instead of each waiter running its
+    own sleep loop. Every condition backs off on its own (fast at first, slower later, with jitter so many sessions
+    don't poll in lockstep), can be woken early by window events, and resolves a concurrent.futures.Future with
+    the predicate's first truthy value, or None once its deadline has passed.
+
+        future = get_default_scheduler().submit(predicate, wait_time=120)
+        result = future.result()  # Blocking
+        result = await asyncio.wrap_future(future)  # asyncio
+
+    Predicates run on the scheduler thread, so they must be quick and must never block: no waiting on the
+    scheduler, no SendMessage to another process's window (hangs with it), no screen grabs or WebDriver round
+    trips. One slow predicate delays every other wait in the process. Such checks go through wait_on_caller() /
+    wait_on_caller_async() instead, with the same backoff and event wake-ups. Cancelling the future drops the
+    condition.
+"""
+
+import heapq
+import random
+import inspect
+import backends
+import itertools
+import threading
+from time import monotonic
+from concurrent.futures import Future, InvalidStateError
+from error_log import error_message as _error_message
+
+
+class Backoff:
+    """Check intervals: initial, multiplied by factor after every unsuccessful check up to maximum, each varied by
+    +/- jitter (fraction of the interval)."""
+
+    def __init__(self, initial=0.01, maximum=1.0, factor=1.5, jitter=0.1):
+        self.initial = min(initial, maximum)
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+
+    def interval(self, attempt):
+        interval = min(self.maximum, self.initial * self.factor ** min(attempt, 64))
+        return interval * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+
+"""10 ms growing by 1.5x per check up to 1 s, +/- 10 %."""
+DEFAULT_BACKOFF = Backoff()
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported on first use, by then a loop is running anyway.
+
+
+class _Condition:
+    def __init__(self, predicate, deadline, backoff, future):
+        self.predicate = predicate
+        self.deadline = deadline
+        self.backoff = backoff
+        self.future = future
+        self.attempt = 0
+        self.due = 0.0  # Only the heap entry with this due time is live, others are stale.
+        self.checking = False
+        self.woken = False  # Woken by an event while being checked: check again right away.
+
+
+class PollScheduler:
+    """Multiplexes pending conditions on a deadline heap, serviced by one daemon thread. The thread is started by
+    the first submit() and exits after idle_time seconds without pending conditions."""
+
+    def __init__(self, name="PollScheduler", idle_time=5.0):
+        self.name = name
+        self.idle_time = idle_time
+        self.__heap = []  # (due, sequence, _Condition)
+        self.__sequence = itertools.count()
+        self.__pending = set()
+        self.__lock = threading.Condition()
+        self.__thread = None
+
+    @property  # Get
+    def pending(self):
+        """Number of conditions still waiting."""
+        with self.__lock:
+            return len(self.__pending)
+
+    def submit(self, predicate, wait_time, backoff=DEFAULT_BACKOFF, events=None, source=None):
+        """Checks predicate() now and then according to backoff until it returns a truthy value or wait_time
+        seconds have passed. Returns a Future resolving to that value or None, or to the predicate's exception.
+        With an event source (see window_events) the condition is also checked whenever one of events (None: any)
+        arrives. predicate runs on the scheduler thread and must not block, see wait_on_caller()."""
+        future = Future()
+        condition = _Condition(predicate, monotonic() + wait_time, backoff, future)
+        if source is not None:
+            def on_event(event, _hwnd):
+                if events is None or event in events:
+                    self.__wake(condition)
+            source.subscribe(on_event)
+            future.add_done_callback(lambda _future: source.unsubscribe(on_event))
+        future.add_done_callback(lambda _future: self.__discard(condition))
+        with self.__lock:
+            self.__pending.add(condition)
+            self.__schedule(condition, monotonic())
+        return future
+
+    def wait(self, predicate, wait_time, backoff=DEFAULT_BACKOFF, events=None, source=None):
+        """Blocking submit(): returns the predicate's value or None."""
+        return self.submit(predicate, wait_time, backoff, events, source).result()
+
+    def __schedule(self, condition, due):
+        """Call with the lock held."""
+        condition.due = due
+        heapq.heappush(self.__heap, (due, next(self.__sequence), condition))
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name=self.name, daemon=True)
+            self.__thread.start()
+        self.__lock.notify()
+
+    def __wake(self, condition):
+        with self.__lock:
+            if condition.future.done():
+                return
+            if condition.checking:
+                condition.woken = True
+            elif condition.due > monotonic():
+                self.__schedule(condition, monotonic())
+
+    def __discard(self, condition):
+        with self.__lock:
+            self.__pending.discard(condition)
+
+    def __next_condition(self):
+        """Waits for the next due condition. Returns None when the thread should exit."""
+        with self.__lock:
+            while True:
+                while self.__heap and (self.__heap[0][0] != self.__heap[0][2].due or
+                                       self.__heap[0][2].future.done()):
+                    heapq.heappop(self.__heap)  # Stale or cancelled.
+                if not self.__heap:
+                    if not self.__lock.wait(self.idle_time) and not self.__heap:
+                        self.__thread = None
+                        return None
+                    continue
+                due, _, condition = self.__heap[0]
+                timeout = due - monotonic()
+                if timeout <= 0:
+                    heapq.heappop(self.__heap)
+                    condition.checking, condition.woken = True, False
+                    return condition
+                self.__lock.wait(timeout)
+
+    def __run(self):
+        while True:
+            condition = self.__next_condition()
+            if condition is None:
+                return
+            try:
+                self.__check(condition)
+            except Exception as e:  # Keep servicing the other conditions.
+                _error_message(e, inspect.currentframe())
+
+    def __check(self, condition):
+        try:
+            result, exception = condition.predicate(), None
+        except Exception as e:
+            result, exception = None, e
+        now = monotonic()
+        with self.__lock:
+            condition.checking = False
+            if not (result or exception is not None or now >= condition.deadline):
+                condition.attempt += 1
+                due = now if condition.woken else now + condition.backoff.interval(condition.attempt)
+                self.__schedule(condition, min(condition.deadline, due))
+                return
+        try:  # Outside the lock: done callbacks run here.
+            if exception is not None:
+                condition.future.set_exception(exception)
+            else:
+                condition.future.set_result(result or None)
+        except InvalidStateError:  # Cancelled meanwhile.
+            pass
+
+
+def wait_on_caller(predicate, wait_time, backoff=DEFAULT_BACKOFF, events=None, source=None):
+    """PollScheduler.wait() for a predicate that may block (SendMessage to another process's window, a screen
+    grab): it runs on the calling thread, so a slow check only holds up its own wait. Same backoff and event
+    wake-ups. Returns the predicate's first truthy value, or None after wait_time seconds."""
+    deadline = monotonic() + wait_time
+    wake = threading.Event()
+
+    def on_event(event, _hwnd):
+        if events is None or event in events:
+            wake.set()
+    if source is not None:
+        source.subscribe(on_event)
+    try:
+        for attempt in itertools.count(1):
+            wake.clear()  # Before the check: an event during it triggers the next one right away.
+            result = predicate()
+            remaining = deadline - monotonic()
+            if result or remaining <= 0:
+                return result or None
+            wake.wait(min(remaining, backoff.interval(attempt)))
+    finally:
+        if source is not None:
+            source.unsubscribe(on_event)
+
+
+async def wait_on_caller_async(predicate, wait_time, backoff=DEFAULT_BACKOFF, events=None, source=None,
+                               executor=None):
+    """Awaitable wait_on_caller(). Each check runs on a worker thread (executor, default: the loop's), never on the
+    loop. A check still running at the deadline is abandoned and None returned."""
+    loop = asyncio.get_running_loop()
+    deadline = monotonic() + wait_time
+    wake = asyncio.Event()
+
+    def on_event(event, _hwnd):
+        if events is None or event in events:
+            loop.call_soon_threadsafe(wake.set)
+    if source is not None:
+        source.subscribe(on_event)
+    try:
+        for attempt in itertools.count(1):
+            wake.clear()
+            try:
+                result = await asyncio.wait_for(loop.run_in_executor(executor, predicate),
+                                                max(0.001, deadline - monotonic()))
+            except asyncio.TimeoutError:
+                return None
+            remaining = deadline - monotonic()
+            if result or remaining <= 0:
+                return result or None
+            try:
+                await asyncio.wait_for(wake.wait(), min(remaining, backoff.interval(attempt)))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if source is not None:
+            source.unsubscribe(on_event)
+
+
+"""Global variables"""
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Returns the process wide PollScheduler used by window_events, com_on_dlg_man and pdf_you waits."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = PollScheduler()
+        return _default_scheduler
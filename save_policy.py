@@ -0,0 +1,181 @@
+"""
+Save Policy - per-phase timeouts, bounded retries and a circuit breaker for saving documents
+    Each phase of a save has its own timeout and raises its own SaveError when it runs out, instead of logging and
+    carrying on into the next long wait:
+        window_open         DialogNotFoundError          Save As / Open dialog didn't appear
+        handle_discovery    DialogControlsNotFoundError  its buttons / file name box weren't found
+        window_close        DialogCloseTimeoutError      dialog still open after it was confirmed
+        file_wait           DownloadTimeoutError         download didn't complete
+        pdf_load            PdfLoadTimeoutError          PDF viewer didn't report "Loaded"
+    These are TimeoutErrors too, so existing "except TimeoutError" handlers still catch them.
+
+    SavePolicy.call(attempt) (await call_async(attempt) for a coroutine function) retries a failed save up to
+    max_attempts times, backing off in between, and reports every outcome to its CircuitBreaker. After
+    failure_threshold failures in a row the breaker opens: calls raise CircuitOpenError right away for reset_time
+    seconds, then a single trial call decides whether it closes again.
+    CircuitOpenError means the desktop or browser is wedged, the worker should restart it (PdfPool does).
+
+        view = ClassPDFView(hwnd, iframe, policy=SavePolicy(timeouts={"file_wait": 60}))
+"""
+
+import logging
+import backends
+import threading
+from time import sleep
+from time import monotonic
+from poll_scheduler import Backoff
+
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported on first use, by then a loop is running anyway.
+
+"""Seconds per phase. The dialog phases normally take well under a second, generous but not minutes."""
+DEFAULT_TIMEOUTS = {"window_open": 15, "handle_discovery": 10, "window_close": 15, "file_wait": 120, "pdf_load": 60}
+
+
+class SaveError(Exception):
+    """Base class of the save pipeline errors. phase: the phase that failed (see the module docstring)."""
+    phase = None
+
+
+class DialogNotFoundError(SaveError, TimeoutError):
+    phase = "window_open"
+
+
+class DialogControlsNotFoundError(SaveError, TimeoutError):
+    phase = "handle_discovery"
+
+
+class DialogCloseTimeoutError(SaveError, TimeoutError):
+    phase = "window_close"
+
+
+class DownloadTimeoutError(SaveError, TimeoutError):
+    phase = "file_wait"
+
+
+class PdfLoadTimeoutError(SaveError, TimeoutError):
+    phase = "pdf_load"
+
+
+class CircuitOpenError(SaveError):
+    """Raised instead of trying while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Counts consecutive failures. Thread-safe. States: "closed" (calls allowed), "open" (calls refused until
+    reset_time has passed) and "half_open" (one trial call allowed)."""
+
+    def __init__(self, failure_threshold=5, reset_time=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_time = reset_time
+        self.failures = 0  # Consecutive
+        self.opened = 0  # Times the breaker opened
+        self.__opened_time = None
+        self.__trial = False
+        self.__lock = threading.Lock()
+
+    @property  # Get
+    def state(self):
+        with self.__lock:
+            return self.__state()
+
+    def __state(self):
+        if self.__opened_time is None:
+            return "closed"
+        return "half_open" if monotonic() - self.__opened_time >= self.reset_time else "open"
+
+    def before(self):
+        """Raises CircuitOpenError unless a call may go ahead."""
+        with self.__lock:
+            state = self.__state()
+            if state == "open" or (state == "half_open" and self.__trial):
+                raise CircuitOpenError(f"Circuit open after {self.failures} consecutive failures")
+            self.__trial = state == "half_open"
+
+    def record_success(self):
+        with self.__lock:
+            self.failures, self.__opened_time, self.__trial = 0, None, False
+
+    def record_cancel(self):
+        """The call ended without an outcome (cancelled, interrupted): a trial call may go ahead again."""
+        with self.__lock:
+            self.__trial = False
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.__trial or (self.__opened_time is None and self.failures >= self.failure_threshold):
+                if self.__opened_time is None:
+                    self.opened += 1
+                    logging.error(f"Circuit breaker opened after {self.failures} consecutive failures")
+                self.__opened_time, self.__trial = monotonic(), False
+
+
+class SavePolicy:
+    """Per-phase timeouts plus bounded retries with backoff behind a CircuitBreaker. retry_on: the exceptions
+    worth another attempt, anything else is raised right away (and counted by the breaker)."""
+
+    def __init__(self, timeouts=None, max_attempts=2, backoff=None, breaker=None, retry_on=(SaveError,)):
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.max_attempts = max_attempts
+        self.backoff = Backoff(initial=0.5, maximum=5.0, factor=2.0) if backoff is None else backoff
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+        self.retry_on = retry_on
+        self.retries = 0
+
+    def timeout(self, phase):
+        return self.timeouts[phase]
+
+    def call(self, attempt, *args, **kwargs):
+        """Returns attempt(*args, **kwargs), retried as described above. Raises the last error, or
+        CircuitOpenError when the breaker refuses the call."""
+        for attempt_number in range(1, self.max_attempts + 1):
+            self.breaker.before()
+            try:
+                result = attempt(*args, **kwargs)
+            except CircuitOpenError:  # From a nested breaker, not an outcome of this call.
+                self.breaker.record_cancel()
+                raise
+            except Exception as e:
+                delay = self.__failed(e, attempt_number)
+                if delay is None:
+                    raise
+                sleep(delay)
+            except BaseException:
+                self.breaker.record_cancel()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def call_async(self, attempt, *args, **kwargs):
+        """Awaitable call(): returns await attempt(*args, **kwargs), backing off with asyncio.sleep()."""
+        for attempt_number in range(1, self.max_attempts + 1):
+            self.breaker.before()
+            try:
+                result = await attempt(*args, **kwargs)
+            except CircuitOpenError:  # From a nested breaker, not an outcome of this call.
+                self.breaker.record_cancel()
+                raise
+            except Exception as e:
+                delay = self.__failed(e, attempt_number)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            except BaseException:  # e.g. asyncio.CancelledError
+                self.breaker.record_cancel()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def __failed(self, e, attempt_number):
+        """Records a failed attempt. Returns the delay before the next one, None when e is to be raised."""
+        self.breaker.record_failure()
+        if not isinstance(e, self.retry_on) or attempt_number == self.max_attempts:
+            return None
+        delay = self.backoff.interval(attempt_number - 1)
+        logging.warning(f"Attempt {attempt_number} failed ({type(e).__name__}: {e}), retrying in {delay:.1f} s")
+        self.retries += 1
+        return delay
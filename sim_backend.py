@@ -0,0 +1,552 @@
+"""
+Sim Backend - in-memory stand-ins for win32gui, win32con, pyautogui, PIL.ImageGrab and a WebDriver PDFViewer iframe
+    SimulatedWindowManager: Window tree with the win32gui calls used by com_on_dlg_man. Builds Save As / Open
+        dialogs with the same class chains as Windows (DUIViewWndClassName/DirectUIHWND/FloatNotifySink/ComboBox/Edit,
+        ComboBoxEx32/ComboBox/Edit), after configurable open/close delays, and raises window events.
+    SimulatedScreen / SimulatedPointer: Pixel grabs and mouse clicks against simulated browser windows.
+    DownloadWriter: Writes a download the way Chrome does (".crdownload" first, renamed when complete).
+    SimulatedBrowser: A browser window with a PDFViewer iframe whose status colors follow navigate(). Clicks arrive
+        through SimulatedPointer or as mouse messages posted to its render window. Its driver answers the
+        pdf_dom_status and pdf_prefetch scripts, minimize() leaves only the DOM status usable.
+
+    desktop = SimulatedDesktop()
+    desktop.install()  # backends.use(...) + window_events.set_default_event_source(...)
+    browser = desktop.create_browser()
+    ...
+    desktop.uninstall()
+"""
+
+import os
+import re
+import itertools
+import threading
+import numpy as np  # Install via 'numpy'
+from types import SimpleNamespace
+import backends
+from pdf_view_status import DEFAULT_PALETTES
+from pdf_dom_status import HOOK_SCRIPT, TAKE_SCRIPT
+from pdf_prefetch import OPEN_SCRIPT, SHOW_SCRIPT, LOAD_SCRIPT, CLOSE_SCRIPT
+from window_events import SimulatedEventSource, set_default_event_source, get_default_event_source, \
+    EVENT_OBJECT_CREATE, EVENT_OBJECT_SHOW, EVENT_OBJECT_DESTROY, EVENT_OBJECT_LOCATIONCHANGE
+
+
+"""win32con constants used by these modules."""
+SIM_WIN32CON = SimpleNamespace(
+    WM_CLOSE=0x0010, WM_SETTEXT=0x000C, WM_GETTEXT=0x000D, WM_GETTEXTLENGTH=0x000E, BM_CLICK=0x00F5,
+    WM_MOUSEMOVE=0x0200, WM_LBUTTONDOWN=0x0201, WM_LBUTTONUP=0x0202, MK_LBUTTON=0x0001,
+    GW_HWNDNEXT=2, GW_OWNER=4, GW_CHILD=5,
+)
+
+"""Status colors shown by the simulated PDF viewer."""
+STATUS_COLORS = {status: colors[0] for status, colors in DEFAULT_PALETTES["default"].items()}
+STATUS_COLORS["Unknown"] = (255, 0, 255)
+
+
+class _Window:
+    def __init__(self, hwnd, class_name, caption, parent, owner, rect, text):
+        self.hwnd = hwnd
+        self.class_name = class_name
+        self.caption = caption
+        self.parent = parent
+        self.owner = owner
+        self.rect = rect
+        self.text = text  # Control contents (WM_GETTEXT / WM_SETTEXT), the caption when None.
+        self.iconic = False  # Minimized
+        self.children = []
+        self.on_click = None  # BM_CLICK handler
+        self.on_mouse_click = None  # WM_LBUTTONUP handler, on_mouse_click(x, y) in client coordinates
+
+
+class SimulatedWindowManager:
+    """Thread-safe in-memory window tree exposing the win32gui functions used here."""
+
+    def __init__(self, open_delay=0.02, close_delay=0.01, event_source=None, download_writer=None):
+        self.open_delay = open_delay  # Seconds between the click and the dialog tree being complete.
+        self.close_delay = close_delay  # Seconds between Save / Open and the dialog being destroyed.
+        self.event_source = SimulatedEventSource() if event_source is None else event_source
+        self.download_writer = DownloadWriter() if download_writer is None else download_writer
+        self.opened_files = []  # Text confirmed in Open dialogs.
+        self.__windows = {}
+        self.__top_level = []
+        self.__lock = threading.RLock()
+        self.__hwnds = itertools.count(0x10010, 4)
+
+    """___Window tree___"""
+    def create_window(self, class_name, caption="", parent=0, owner=0, rect=(0, 0, 0, 0), text=None):
+        with self.__lock:
+            hwnd = next(self.__hwnds)
+            self.__windows[hwnd] = _Window(hwnd, class_name, caption, parent, owner, rect, text)
+            (self.__windows[parent].children if parent else self.__top_level).append(hwnd)
+        self.event_source.emit(EVENT_OBJECT_CREATE, hwnd)
+        self.event_source.emit(EVENT_OBJECT_SHOW, hwnd)
+        return hwnd
+
+    def destroy_window(self, hwnd):
+        with self.__lock:
+            window = self.__windows.pop(hwnd, None)
+            if window is None:
+                return
+            for child in list(window.children):
+                self.destroy_window(child)
+            siblings = self.__windows[window.parent].children if window.parent in self.__windows else \
+                self.__top_level
+            if hwnd in siblings:
+                siblings.remove(hwnd)
+        self.event_source.emit(EVENT_OBJECT_DESTROY, hwnd)
+
+    def move_window(self, hwnd, rect):
+        self.__window(hwnd).rect = rect
+        self.event_source.emit(EVENT_OBJECT_LOCATIONCHANGE, hwnd)
+
+    def set_iconic(self, hwnd, iconic):
+        self.__window(hwnd).iconic = iconic
+
+    def set_on_click(self, hwnd, on_click):
+        self.__windows[hwnd].on_click = on_click
+
+    def set_on_mouse_click(self, hwnd, on_mouse_click):
+        self.__windows[hwnd].on_mouse_click = on_mouse_click
+
+    def window_count(self):
+        with self.__lock:
+            return len(self.__windows)
+
+    def __window(self, hwnd):
+        window = self.__windows.get(hwnd)
+        if window is None:
+            raise OSError(1400, "Invalid window handle.")
+        return window
+
+    """___win32gui___"""
+    def IsWindow(self, hwnd):
+        return 1 if hwnd in self.__windows else 0
+
+    def IsWindowVisible(self, hwnd):
+        return self.IsWindow(hwnd)
+
+    def IsWindowEnabled(self, hwnd):
+        return self.IsWindow(hwnd)
+
+    def IsIconic(self, hwnd):
+        return 1 if self.__window(hwnd).iconic else 0
+
+    def FindWindowEx(self, hwnd_parent, hwnd_child_after, class_name, caption):
+        with self.__lock:
+            siblings = self.__windows[hwnd_parent].children if hwnd_parent else self.__top_level
+            start = siblings.index(hwnd_child_after) + 1 if hwnd_child_after in siblings else 0
+            for hwnd in siblings[start:]:
+                window = self.__windows[hwnd]
+                if (class_name is None or window.class_name == class_name) and \
+                        (caption is None or window.caption == caption):
+                    return hwnd
+        return 0
+
+    def EnumWindows(self, call_back, param):
+        with self.__lock:
+            hwnds = list(self.__top_level)
+        for hwnd in hwnds:
+            if call_back(hwnd, param) is False:
+                return
+
+    def EnumChildWindows(self, hwnd_parent, call_back, param):
+        with self.__lock:
+            hwnds = []
+            stack = list(reversed(self.__window(hwnd_parent).children))
+            while stack:  # Depth first, in Z-order, like Windows.
+                hwnd = stack.pop()
+                hwnds.append(hwnd)
+                stack.extend(reversed(self.__windows[hwnd].children))
+        for hwnd in hwnds:
+            if call_back(hwnd, param) is False:
+                return
+
+    def GetClassName(self, hwnd):
+        return self.__window(hwnd).class_name
+
+    def GetWindowText(self, hwnd):
+        return self.__window(hwnd).caption
+
+    def GetParent(self, hwnd):
+        window = self.__window(hwnd)
+        return window.parent or window.owner  # Top level windows return their owner, as on Windows.
+
+    def GetWindow(self, hwnd, command):
+        with self.__lock:
+            window = self.__window(hwnd)
+            if command == SIM_WIN32CON.GW_OWNER:
+                return window.owner
+            if command == SIM_WIN32CON.GW_CHILD:
+                return window.children[0] if window.children else 0
+            if command == SIM_WIN32CON.GW_HWNDNEXT:
+                siblings = self.__windows[window.parent].children if window.parent else self.__top_level
+                index = siblings.index(hwnd) + 1
+                return siblings[index] if index < len(siblings) else 0
+        return 0
+
+    def GetWindowRect(self, hwnd):
+        return self.__window(hwnd).rect
+
+    def ScreenToClient(self, hwnd, point):
+        left, top = self.__window(hwnd).rect[:2]
+        return point[0] - left, point[1] - top
+
+    def ClientToScreen(self, hwnd, point):
+        left, top = self.__window(hwnd).rect[:2]
+        return point[0] + left, point[1] + top
+
+    def PyMakeBuffer(self, size):
+        return memoryview(bytearray(size))
+
+    def SendMessage(self, hwnd, message, wparam, lparam):
+        window = self.__window(hwnd)
+        text = window.caption if window.text is None else window.text
+        if message == SIM_WIN32CON.WM_GETTEXT:
+            encoded = text.encode("utf-16-le")[:max(0, len(lparam) - 2)]
+            lparam[:len(encoded)] = encoded
+            return len(encoded) // 2
+        if message == SIM_WIN32CON.WM_GETTEXTLENGTH:
+            return len(text)
+        if message == SIM_WIN32CON.WM_SETTEXT:
+            window.text = lparam
+            return 1
+        if message == SIM_WIN32CON.BM_CLICK and window.on_click is not None:
+            window.on_click()
+        if message == SIM_WIN32CON.WM_CLOSE:
+            self.__close_later(hwnd)
+        if message == SIM_WIN32CON.WM_LBUTTONUP and window.on_mouse_click is not None:
+            window.on_mouse_click(lparam & 0xFFFF, lparam >> 16 & 0xFFFF)
+        return 0
+
+    def PostMessage(self, hwnd, message, wparam, lparam):
+        threading.Timer(0, self.SendMessage, (hwnd, message, wparam, lparam)).start()
+
+    """___Dialogs___"""
+    def open_save_as_dialog(self, owner, default_name="document.pdf"):
+        """Builds a Save As dialog owned by owner after open_delay. Save writes the download with download_writer."""
+        threading.Timer(self.open_delay, self.__build_save_as_dialog, (owner, default_name)).start()
+
+    def open_open_dialog(self, owner):
+        """Builds an Open dialog owned by owner after open_delay. Open records the text in opened_files."""
+        threading.Timer(self.open_delay, self.__build_open_dialog, (owner,)).start()
+
+    def __close_later(self, hwnd, then=None):
+        def close():
+            self.destroy_window(hwnd)
+            if then is not None:
+                then()
+        threading.Timer(self.close_delay, close).start()
+
+    def __build_save_as_dialog(self, owner, default_name):
+        with self.__lock:  # Build the whole tree before anyone can enumerate it.
+            dialog = self.create_window("#32770", "Save As", owner=owner)
+            save = self.create_window("Button", "&Save", dialog)
+            cancel = self.create_window("Button", "Cancel", dialog)
+            view = self.create_window("DUIViewWndClassName", "", dialog)
+            direct_ui = self.create_window("DirectUIHWND", "", view)
+            name_sink = self.create_window("FloatNotifySink", "", direct_ui)
+            name_combo = self.create_window("ComboBox", "", name_sink)
+            name_edit = self.create_window("Edit", "", name_combo, text=default_name)
+            type_sink = self.create_window("FloatNotifySink", "", direct_ui)
+            self.create_window("ComboBox", "", type_sink, text="Adobe Acrobat Document (*.pdf)")
+
+            def on_save():
+                path = self.__window(name_edit).text
+                self.__close_later(dialog, lambda: self.download_writer.start(path))
+
+            self.set_on_click(save, on_save)
+            self.set_on_click(cancel, lambda: self.__close_later(dialog))
+
+    def __build_open_dialog(self, owner):
+        with self.__lock:
+            dialog = self.create_window("#32770", "Open", owner=owner)
+            open_button = self.create_window("Button", "&Open", dialog)
+            cancel = self.create_window("Button", "Cancel", dialog)
+            combo_ex = self.create_window("ComboBoxEx32", "", dialog)
+            combo = self.create_window("ComboBox", "", combo_ex)
+            edit = self.create_window("Edit", "", combo, text="")
+            self.create_window("ComboBox", "", dialog, text="All Files (*.*)")
+
+            def on_open():
+                text = self.__window(edit).text
+                self.opened_files.extend(re.findall(r'"([^"]+)"', text) if text.startswith('"') else [text])
+                self.__close_later(dialog)
+
+            self.set_on_click(open_button, on_open)
+            self.set_on_click(cancel, lambda: self.__close_later(dialog))
+
+
+class DownloadWriter:
+    """Writes size bytes to path + ".crdownload" in chunks and renames it to path when complete."""
+
+    def __init__(self, size=256 * 1024, chunk_size=64 * 1024, chunk_delay=0.001):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+
+    def start(self, path):
+        thread = threading.Thread(target=self.write, args=(path,), name="DownloadWriter", daemon=True)
+        thread.start()
+        return thread
+
+    def write(self, path):
+        partial_path = path + ".crdownload"
+        stop = threading.Event()
+        with open(partial_path, "wb") as file:
+            file.write(b"%PDF-1.7\n")
+            written = 9
+            while written < self.size - 6:
+                chunk = min(self.chunk_size, self.size - 6 - written)
+                file.write(b"0" * chunk)
+                written += chunk
+                stop.wait(self.chunk_delay)
+            file.write(b"%%EOF\n")
+        os.replace(partial_path, path)
+
+
+class SimulatedScreen:
+    """ImageGrab replacement. grab() fills the region with the color of the region covering its top left corner."""
+
+    def __init__(self, background=(0, 0, 0)):
+        self.background = background
+        self.__regions = []  # [(rect, color_function)]
+        self.__lock = threading.Lock()
+
+    def add_region(self, rect, color_function):
+        with self.__lock:
+            self.__regions.insert(0, (rect, color_function))
+
+    def color_at(self, x, y):
+        with self.__lock:
+            regions = list(self.__regions)
+        for (left, top, right, bottom), color_function in regions:
+            if left <= x < right and top <= y < bottom:
+                return color_function()
+        return self.background
+
+    def grab(self, bbox=None):
+        left, top, right, bottom = bbox
+        image = np.empty((bottom - top, right - left, 3), dtype=np.uint8)
+        image[:] = self.color_at(left, top)
+        return image
+
+
+class SimulatedPointer:
+    """pyautogui replacement. click() calls the handler of the region under the point."""
+
+    def __init__(self):
+        self.__position = (0, 0)
+        self.__regions = []  # [(rect, on_click(x, y))]
+        self.__lock = threading.Lock()
+        self.clicks = 0
+
+    def add_region(self, rect, on_click):
+        with self.__lock:
+            self.__regions.insert(0, (rect, on_click))
+
+    def position(self):
+        return self.__position
+
+    def moveTo(self, x, y, *args, **kwargs):
+        self.__position = (x, y)
+
+    def click(self, x=None, y=None, *args, **kwargs):
+        x, y = self.__position if x is None else (x, y)
+        self.__position = (x, y)
+        self.clicks += 1
+        with self.__lock:
+            regions = list(self.__regions)
+        for (left, top, right, bottom), on_click in regions:
+            if left <= x < right and top <= y < bottom:
+                on_click(x, y)
+                return
+
+
+class SimulatedDriver:
+    """The parts of a WebDriver used through pdf_view_element.parent."""
+
+    def __init__(self, current_url="http://localhost/viewer"):
+        self.current_url = current_url
+        self.cookies = []
+        self.scripts = {}  # script -> function(*args) returning its result, unknown scripts return None
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def execute_script(self, script, *args):
+        function = self.scripts.get(script)
+        return None if function is None else function(*args)
+
+
+class SimulatedPdfIframe:
+    """A PDFViewer iframe element: location, size, rect, get_attribute() and parent (the driver). status, visible
+    and the transitions recorded by the pdf_dom_status hook are kept by its SimulatedBrowser."""
+
+    def __init__(self, driver, x=0, y=80, width=1200, height=800, src="about:blank"):
+        self.parent = driver
+        self.location = {"x": x, "y": y}
+        self.size = {"width": width, "height": height}
+        self.src = src
+        self.status = "Empty"
+        self.visible = True
+        self.dom_transitions = None  # [(old, new, source)] since the last TAKE_SCRIPT, None until hooked
+        self.load_timer = None
+        self.round_trips = 0  # WebDriver calls made on this element.
+
+    @property  # Get
+    def rect(self):
+        self.round_trips += 1
+        return {**self.location, **self.size}
+
+    def get_attribute(self, name):
+        self.round_trips += 1
+        return self.src if name == "src" else None
+
+
+class SimulatedBrowser:
+    """A browser window (with a render child window) showing a PDFViewer iframe. navigate() shows "Loading" and
+    switches to "Loaded" after load_delay. Clicking the viewer while loaded opens a Save As dialog owned by it.
+    Its driver answers the pdf_dom_status and pdf_prefetch scripts: hidden iframes stacked over the first one load
+    the same way, the screen and clicks go to the visible one."""
+
+    def __init__(self, desktop, rect=(100, 100, 1400, 1000), load_delay=0.05):
+        self.desktop = desktop
+        self.rect = rect
+        self.load_delay = load_delay
+        self.minimized = False  # Screen grabs show the desktop background instead of the viewer
+        manager = desktop.manager
+        self.hwnd = manager.create_window("Chrome_WidgetWin_1", "PDF Viewer - Google Chrome", rect=rect)
+        self.render_hwnd = manager.create_window("Chrome_RenderWidgetHostHWND", "Chrome Legacy Window", self.hwnd,
+                                                 rect=rect)
+        self.driver = SimulatedDriver()
+        self.pdf_iframe = SimulatedPdfIframe(self.driver)
+        self.frames = [self.pdf_iframe]  # In the page
+        self.documents = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.driver.scripts.update({
+            HOOK_SCRIPT: self.__install_dom_hook, TAKE_SCRIPT: self.__take_dom_transitions,
+            OPEN_SCRIPT: self.__open_frame, SHOW_SCRIPT: self.__show_frame,
+            LOAD_SCRIPT: lambda pdf_iframe, src: self.__load(self.__frame(pdf_iframe), src),
+            CLOSE_SCRIPT: self.__close_frame,
+        })
+        desktop.screen.add_region(rect, lambda: desktop.screen.background if self.minimized else
+                                  STATUS_COLORS[self.status])
+        desktop.pointer.add_region(rect, self.__on_click)
+        manager.set_on_mouse_click(self.render_hwnd, lambda x, y: self.__on_click(x + rect[0], y + rect[1]))
+        self.clicks = 0  # Clicks received, by the real pointer or posted messages
+
+    @property  # Get
+    def visible_iframe(self):
+        with self.__lock:
+            return next((frame for frame in reversed(self.frames) if frame.visible), self.pdf_iframe)
+
+    @property  # Get
+    def status(self):
+        return self.visible_iframe.status
+
+    def navigate(self, document=None, pdf_iframe=None):
+        """Starts loading the next document, into the visible iframe by default."""
+        document = f"document-{next(self.documents)}.pdf" if document is None else document
+        self.__load(self.visible_iframe if pdf_iframe is None else pdf_iframe, f"http://localhost/{document}")
+
+    def minimize(self, minimized=True):
+        self.minimized = minimized
+        self.desktop.manager.set_iconic(self.hwnd, minimized)
+
+    def __load(self, pdf_iframe, src):
+        pdf_iframe.src = src
+        if pdf_iframe.load_timer is not None:
+            pdf_iframe.load_timer.cancel()
+        if src == "about:blank":
+            self.__set_status(pdf_iframe, "Empty", "src")
+            return
+        self.__set_status(pdf_iframe, "Loading", "src")
+        pdf_iframe.load_timer = threading.Timer(self.load_delay, self.__set_status, (pdf_iframe, "Loaded", "load"))
+        pdf_iframe.load_timer.start()
+
+    def __set_status(self, pdf_iframe, status, source):
+        with self.__lock:
+            if status != pdf_iframe.status and pdf_iframe.dom_transitions is not None:
+                pdf_iframe.dom_transitions.append([pdf_iframe.status, status, source])
+            pdf_iframe.status = status
+
+    def __frame(self, pdf_iframe):
+        if pdf_iframe not in self.frames:
+            raise RuntimeError("stale element reference")
+        return pdf_iframe
+
+    def __install_dom_hook(self, pdf_iframe):
+        with self.__lock:
+            if self.__frame(pdf_iframe).dom_transitions is None:
+                pdf_iframe.dom_transitions = []
+        return True
+
+    def __take_dom_transitions(self, pdf_iframe):
+        with self.__lock:
+            if self.__frame(pdf_iframe).dom_transitions is None:
+                return None
+            transitions, pdf_iframe.dom_transitions = pdf_iframe.dom_transitions, []
+            return {"status": pdf_iframe.status, "transitions": transitions}
+
+    def __open_frame(self, template):
+        location, size = self.__frame(template).location, template.size
+        pdf_iframe = SimulatedPdfIframe(self.driver, location["x"], location["y"], size["width"], size["height"])
+        pdf_iframe.visible = False
+        with self.__lock:
+            self.frames.append(pdf_iframe)
+        return pdf_iframe
+
+    def __show_frame(self, show, hide):
+        self.__frame(show).visible = True
+        if hide is not None and hide is not show:
+            self.__frame(hide).visible = False
+
+    def __close_frame(self, pdf_iframe):
+        if self.__frame(pdf_iframe).load_timer is not None:
+            pdf_iframe.load_timer.cancel()
+        with self.__lock:
+            self.frames.remove(pdf_iframe)
+
+    def __on_click(self, _x, _y):
+        self.clicks += 1
+        if self.status == "Loaded":
+            self.desktop.manager.open_save_as_dialog(self.hwnd)
+
+    def close(self):
+        for pdf_iframe in self.frames:
+            if pdf_iframe.load_timer is not None:
+                pdf_iframe.load_timer.cancel()
+        self.desktop.manager.destroy_window(self.hwnd)
+
+
+class SimulatedDesktop:
+    """Window manager, screen and pointer wired together, installable as the process wide backends."""
+
+    def __init__(self, open_delay=0.02, close_delay=0.01, download_writer=None):
+        self.manager = SimulatedWindowManager(open_delay, close_delay, download_writer=download_writer)
+        self.screen = SimulatedScreen()
+        self.pointer = SimulatedPointer()
+        self.__previous_event_source = None
+
+    def install(self):
+        backends.use(win32gui=self.manager, win32con=SIM_WIN32CON, pyautogui=self.pointer, ImageGrab=self.screen)
+        self.__previous_event_source = get_default_event_source()
+        set_default_event_source(self.manager.event_source)
+        return self
+
+    def uninstall(self):
+        backends.use(win32gui=None, win32con=None, pyautogui=None, ImageGrab=None)
+        set_default_event_source(self.__previous_event_source)
+
+    def create_browser(self, rect=None, load_delay=0.05):
+        """Creates a browser window; without rect each new browser is placed next to the previous ones."""
+        if rect is None:
+            offset = 1400 * self.manager.window_count()
+            rect = (offset, 0, offset + 1300, 900)
+        return SimulatedBrowser(self, rect, load_delay)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+        return False
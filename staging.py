@@ -0,0 +1,164 @@
+"""
+Staging - save into a fast local directory, move files to slow (network) destinations in the background
+    The Save As dialog is pointed at a local staging file, so it closes and the local write completes quickly; a
+    pool of copy threads then moves the file to its destination:
+    - Directories created (or checked) at the destination are remembered, no exists / makedirs per file.
+    - The copy is written to "<destination>.partial" and renamed into place, readers never see half a file and a
+      DownloadCompletionDetector on the destination waits for the rename (".partial" is a partial suffix).
+    - Bytes staged but not yet at their destination are bounded by max_in_flight_bytes: transfer() blocks the
+      saving thread while the pool is that far behind, so the staging directory can't fill up. A file still being
+      written is reserved at the mean size transferred so far (default_size before the first one), corrected
+      once it is complete.
+
+        staging = StagingArea("C:\\Temp\\PdfStaging")
+        future = SaveAsCommonDlg(hwnd).save_as_window_interact(full_path, staging=staging)
+        ...
+        staging.drain()  # Every transfer finished, failed ones raise from their futures.
+"""
+
+import os
+import shutil
+import inspect
+import logging
+import threading
+import itertools
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from download_watch import DownloadCompletionDetector
+from error_log import error_message as _error_message
+
+
+class StagingArea:
+    """Local staging directory plus the pool that transfers staged files to their destinations. Thread-safe."""
+
+    def __init__(self, root, max_workers=4, max_in_flight_bytes=256 << 20, default_size=1 << 20):
+        self.root = root
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.default_size = default_size  # Bytes reserved for a file still being written, until sizes are known
+        self.transferred = 0  # Files
+        self.transferred_bytes = 0
+        self.failed = 0
+        self.__in_flight_bytes = 0
+        self.__pending = set()  # Futures
+        self.__directories = set()  # Destination directories known to exist
+        self.__counter = itertools.count()
+        self.__condition = threading.Condition()
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="StagingArea")
+        os.makedirs(root, exist_ok=True)
+
+    @property  # Get
+    def in_flight_bytes(self):
+        return self.__in_flight_bytes
+
+    def local_path(self, destination):
+        """Returns a new staging file path for destination. The file name is kept, prefixed to keep it unique."""
+        return os.path.join(self.root, f"{os.getpid()}_{next(self.__counter)}_{os.path.basename(destination)}")
+
+    def prepare_destination(self, destination, make_directory=True):
+        """Creates (or checks) the directory of destination before the dialog saves, through the directory cache.
+        Raises FileNotFoundError when it is missing and make_directory is False."""
+        self.__directory(os.path.dirname(destination), make_directory)
+
+    def transfer(self, local_path, destination, make_directory=True, file_overwrite=True, wait_time=300):
+        """Moves local_path to destination on the pool and returns a Future (resolving to the size in bytes).
+        A local file still being written is waited for (up to wait_time) on the pool. Blocks while more than
+        max_in_flight_bytes are waiting to be transferred."""
+        complete = os.path.isfile(local_path)
+        reserved = self.__reserve(os.path.getsize(local_path) if complete else self.__estimated_size())
+        future = self.__executor.submit(self.__transfer, local_path, destination, make_directory, file_overwrite,
+                                        wait_time, reserved, complete)
+        with self.__condition:
+            self.__pending.add(future)
+        future.add_done_callback(self.__done)
+        return future
+
+    def drain(self, wait_time=None):
+        """Waits until every transfer submitted so far has finished. Returns False if wait_time ran out."""
+        end_time = None if wait_time is None else time() + wait_time
+        with self.__condition:
+            while self.__pending:
+                remaining = None if end_time is None else end_time - time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__condition.wait(remaining)
+        return True
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
+
+    def __reserve(self, size):
+        with self.__condition:
+            while self.__in_flight_bytes and self.__in_flight_bytes + size > self.max_in_flight_bytes:
+                self.__condition.wait()
+            self.__in_flight_bytes += size
+        return size
+
+    def __estimated_size(self):
+        with self.__condition:
+            return self.transferred_bytes // self.transferred if self.transferred else self.default_size
+
+    def __resize(self, reserved, size):
+        """Replaces a reservation of reserved bytes by one of size bytes, never blocks (pool threads)."""
+        with self.__condition:
+            self.__in_flight_bytes += size - reserved
+            self.__condition.notify_all()
+        return size
+
+    def __release(self, size):
+        with self.__condition:
+            self.__in_flight_bytes -= size
+            self.__condition.notify_all()
+
+    def __done(self, future):
+        with self.__condition:
+            self.__pending.discard(future)
+            if future.exception() is None:
+                self.transferred += 1
+                self.transferred_bytes += future.result()
+            else:
+                self.failed += 1
+            self.__condition.notify_all()
+
+    def __directory(self, directory, make_directory):
+        if directory in self.__directories:
+            return
+        if make_directory:
+            os.makedirs(directory, exist_ok=True)
+        elif not os.path.isdir(directory):
+            raise FileNotFoundError(f"Destination directory does not exist: {directory}")
+        with self.__condition:
+            self.__directories.add(directory)
+
+    def __copy(self, local_path, destination, make_directory):
+        partial_path = destination + ".partial"
+        directory = os.path.dirname(destination)
+        self.__directory(directory, make_directory)
+        try:
+            shutil.copyfile(local_path, partial_path)
+        except FileNotFoundError:  # Directory removed since it was cached, create / check it once more.
+            with self.__condition:
+                self.__directories.discard(directory)
+            self.__directory(directory, make_directory)
+            shutil.copyfile(local_path, partial_path)
+        try:
+            os.replace(partial_path, destination)
+        except Exception:
+            os.remove(partial_path)
+            raise
+
+    def __transfer(self, local_path, destination, make_directory, file_overwrite, wait_time, reserved, complete):
+        try:
+            if not complete:
+                DownloadCompletionDetector(local_path).wait(wait_time)
+                reserved = self.__resize(reserved, os.path.getsize(local_path))
+            if not file_overwrite and os.path.exists(destination):
+                raise FileExistsError(f"Destination exists: {destination}")
+            self.__copy(local_path, destination, make_directory)
+            os.remove(local_path)
+            logging.info(f"Transferred: {destination} ({reserved} bytes)")
+            return reserved
+        except Exception as e:  # The staged file is kept, the transfer can be repeated.
+            _error_message(e, inspect.currentframe())
+            raise
+        finally:
+            self.__release(reserved)
@@ -0,0 +1,60 @@
+"""FallbackClick with scripted strategies."""
+
+from click_strategies import ClickStrategy, FallbackClick
+
+
+class _Strategy(ClickStrategy):
+    def __init__(self, name, effect, moves_pointer=False):
+        self.name = name
+        self.moves_pointer = moves_pointer
+        self.effect = effect  # {"working": strategy names that open a dialog, "opened": dialogs opened}
+        self.clicks = 0
+
+    def click(self, hwnd_parent, point):
+        self.clicks += 1
+        if self.name in self.effect["working"]:
+            self.effect["opened"] += 1
+        return True
+
+
+def _confirm(effect):
+    """New dialogs since the click, the way pdf_you confirms: a count taken before the click."""
+    def confirm(_hwnd_parent):
+        opened_before = effect["opened"]
+        return lambda: effect["opened"] != opened_before
+    return confirm
+
+
+def _fallback(working):
+    effect = {"working": set(working), "opened": 0}
+    posted, pointer = _Strategy("post_message", effect), _Strategy("pointer", effect, moves_pointer=True)
+    return FallbackClick([posted, pointer], confirm=_confirm(effect), confirm_time=0.2), posted, pointer, effect
+
+
+def test_first_strategy_confirmed():
+    fallback, posted, pointer, _effect = _fallback({"post_message"})
+    assert fallback.click(1, (0, 0))
+    assert (posted.clicks, pointer.clicks, fallback.last_strategy) == (1, 0, "post_message")
+
+
+def test_effect_before_the_click_does_not_confirm():
+    fallback, posted, pointer, effect = _fallback(set())
+    effect["opened"] = 5  # A dialog opened (and was handled) before this click.
+    assert not fallback.click(1, (0, 0))
+    assert (posted.clicks, pointer.clicks) == (1, 1)
+
+
+def test_pointer_is_never_preferred():
+    fallback, posted, pointer, effect = _fallback({"pointer"})
+    assert fallback.click(1, (0, 0))
+    assert fallback.preferred(1) == 0
+    assert fallback.click(1, (0, 0))
+    assert (posted.clicks, pointer.clicks) == (2, 2)
+
+
+def test_preference_is_per_window():
+    posted_effect = {"working": {"post_message"}, "opened": 0}
+    fallback = FallbackClick([_Strategy("pointer", posted_effect), _Strategy("post_message", posted_effect)],
+                             confirm=_confirm(posted_effect), confirm_time=0.2)
+    assert fallback.click(1, (0, 0))
+    assert (fallback.preferred(1), fallback.preferred(2)) == (1, 0)
@@ -0,0 +1,55 @@
+"""DownloadCompletionDetector against files written by a test thread."""
+
+import os
+import threading
+import time
+from download_watch import DownloadCompletionDetector, PollingBackend, unconfirmed_files
+
+
+def _write(path, data=b"%PDF-1.7"):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_stable_file_completes(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    _write(path)
+    detector = DownloadCompletionDetector(path, stable_time=0.05, backend=PollingBackend(0.01))
+    assert detector.wait(2)
+    assert detector.size == 8
+
+
+def test_partial_file_renamed_away(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    _write(path + ".crdownload")
+    detector = DownloadCompletionDetector(path, stable_time=10, backend=PollingBackend(0.01))
+    assert not detector.poll()
+    os.rename(path + ".crdownload", path)
+    assert detector.wait(2)  # Renamed: no need to wait stable_time.
+
+
+def test_stale_unconfirmed_file_does_not_block(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    _write(str(tmp_path / "Unconfirmed 123.crdownload"))
+    _write(path)
+    detector = DownloadCompletionDetector(path, stable_time=0.05, backend=PollingBackend(0.01))
+    start = time.time()
+    assert detector.wait(2)
+    assert time.time() - start < 1
+
+
+def test_new_unconfirmed_file_blocks_until_renamed(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    unconfirmed = str(tmp_path / "Unconfirmed 456.crdownload")
+    before = unconfirmed_files(str(tmp_path))
+    _write(unconfirmed)
+    _write(path)
+    detector = DownloadCompletionDetector(path, stable_time=0.05, backend=PollingBackend(0.01),
+                                          partials_before=before)
+    assert unconfirmed_files(str(tmp_path)) == {unconfirmed}
+    timer = threading.Timer(0.3, os.remove, (unconfirmed,))
+    timer.start()
+    start = time.time()
+    assert detector.wait(2)
+    assert time.time() - start >= 0.25
+    timer.join()
@@ -0,0 +1,43 @@
+"""multi_select_chunks() and multi_select_text() for OpenCommonDlg.open_many()."""
+
+import os
+from com_on_dlg_man import multi_select_chunks, multi_select_text
+
+
+def _paths(folder, count, name="document"):
+    return [os.path.join(folder, f"{name}{index}.pdf") for index in range(count)]
+
+
+def test_one_folder_one_chunk(tmp_path):
+    paths = _paths(str(tmp_path), 3)
+    assert multi_select_chunks(paths) == [paths]
+
+
+def test_split_by_folder_keeping_order(tmp_path):
+    first, second = _paths(str(tmp_path / "a"), 2), _paths(str(tmp_path / "b"), 2)
+    interleaved = [first[0], second[0], first[1], second[1]]
+    assert multi_select_chunks(interleaved) == [first, second]
+
+
+def test_relative_paths_made_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert multi_select_chunks(["a.pdf"]) == [[os.path.join(str(tmp_path), "a.pdf")]]
+
+
+def test_split_by_length(tmp_path):
+    paths = _paths(str(tmp_path), 10)
+    max_length = 3 * (len(paths[0]) + 3)  # Three quoted entries each.
+    chunks = multi_select_chunks(paths, max_length)
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert [path for chunk in chunks for path in chunk] == paths
+    assert all(len(multi_select_text(chunk)) <= max_length for chunk in chunks)
+
+
+def test_path_longer_than_max_length_gets_its_own_chunk(tmp_path):
+    paths = _paths(str(tmp_path), 2)
+    assert multi_select_chunks(paths, 5) == [[paths[0]], [paths[1]]]
+
+
+def test_text():
+    assert multi_select_text(["C:\\a\\x.pdf"]) == "C:\\a\\x.pdf"  # Single path as it is.
+    assert multi_select_text(["C:\\a\\x.pdf", "C:\\a\\y z.pdf"]) == '"C:\\a\\x.pdf" "C:\\a\\y z.pdf"'
@@ -0,0 +1,79 @@
+"""DomPdfViewStatus against a scripted driver."""
+
+import threading
+import time
+from pdf_dom_status import DomPdfViewStatus, HOOK_SCRIPT
+
+
+class _Driver:
+    """Answers HOOK_SCRIPT with True and TAKE_SCRIPT with the queued states, delay seconds per round trip."""
+
+    def __init__(self, states, delay=0.0):
+        self.states = list(states)
+        self.delay = delay
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+        time.sleep(self.delay)
+        if script == HOOK_SCRIPT:
+            return True
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+
+class _Iframe:
+    def __init__(self, driver):
+        self.parent = driver
+
+
+def _state(status, *transitions):
+    return {"status": status, "transitions": [list(transition) for transition in transitions]}
+
+
+def test_sample_reports_status_and_transitions():
+    seen = []
+    dom_status = DomPdfViewStatus()
+    dom_status.subscribe(lambda old, new, source: seen.append((old, new, source)))
+    iframe = _Iframe(_Driver([_state("Loading", ("Unknown", "Loading", "src")),
+                              _state("Loaded", ("Loading", "Loaded", "load"))]))
+    assert dom_status.sample(iframe) == "Loading"
+    assert dom_status.sample(iframe) == "Loaded"
+    assert seen == [("Unknown", "Loading", "src"), ("Loading", "Loaded", "load")]
+
+
+def test_statuses_since_keeps_fast_reloads():
+    dom_status = DomPdfViewStatus()
+    iframe = _Iframe(_Driver([_state("Loaded", ("Loading", "Loaded", "load")),
+                              _state("Loaded", ("Loaded", "Loading", "src"), ("Loading", "Loaded", "load"))]))
+    dom_status.sample(iframe)
+    mark = dom_status.transitions
+    assert dom_status.sample(iframe) == "Loaded"
+    assert dom_status.statuses_since(mark) == ["Loading", "Loaded"]
+
+
+def test_sample_nowait_does_not_wait_for_the_driver():
+    dom_status = DomPdfViewStatus()
+    iframe = _Iframe(_Driver([_state("Loaded")], delay=0.3))
+    assert dom_status.sample_nowait(iframe) is None  # Nothing sampled yet.
+    time.sleep(0.05)  # Round trip running on the sampling thread.
+    start_time = time.perf_counter()
+    dom_status.sample_nowait(iframe)
+    assert time.perf_counter() - start_time < 0.05
+    changed = threading.Event()
+    dom_status.changed.subscribe(lambda _event, _hwnd: changed.set())
+    assert changed.wait(2)
+    assert dom_status.sample_nowait(iframe) == "Loaded"
+    dom_status.close()
+
+
+def test_unavailable_after_failures():
+    class _Failing(_Driver):
+        def execute_script(self, script, *args):
+            raise RuntimeError("stale element reference")
+    dom_status = DomPdfViewStatus(max_failures=2)
+    iframe = _Iframe(_Failing([]))
+    assert dom_status.sample(iframe) is None
+    assert dom_status.sample(iframe) is None
+    assert not dom_status.available
+    dom_status.reset()
+    assert dom_status.available
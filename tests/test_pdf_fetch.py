@@ -0,0 +1,151 @@
+"""PdfFetcher.fetch and extract_iframe_blob against a local http.server."""
+
+import os
+import base64
+import urllib.request
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pdf_fetch import PdfFetcher, extract_iframe_blob, _BLOB_FETCH_SCRIPT, _BLOB_CHUNK_SCRIPT, _BLOB_RELEASE_SCRIPT
+
+PDF = b"%PDF-1.7\n" + b"0" * 5000 + b"\n%%EOF\n"
+HTML = b"<!DOCTYPE html><html><body>Please sign in</body></html>" + b" " * 2000
+OLD = b"%PDF-1.4\nprevious document\n%%EOF\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    routes = {"/document.pdf": (200, "application/pdf", PDF), "/login": (200, "text/html", HTML),
+              "/empty.pdf": (200, "application/pdf", b"")}
+
+    def do_GET(self):
+        status, content_type, body = self.routes.get(self.path, (404, "text/plain", b"not found"))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = PdfFetcher(max_concurrency=2, timeout=(5, 5))
+    yield fetcher
+    fetcher.close()
+
+
+def _existing(tmp_path):
+    full_path = tmp_path / "saved.pdf"
+    full_path.write_bytes(OLD)
+    return str(full_path)
+
+
+def test_fetch(base_url, fetcher, tmp_path):
+    full_path = str(tmp_path / "sub" / "document.pdf")
+    assert fetcher.fetch(f"{base_url}/document.pdf", full_path) == len(PDF)
+    assert open(full_path, "rb").read() == PDF
+    assert not os.path.exists(full_path + ".part")
+
+
+def test_overwrite(base_url, fetcher, tmp_path):
+    full_path = _existing(tmp_path)
+    fetcher.fetch(f"{base_url}/document.pdf", full_path)
+    assert open(full_path, "rb").read() == PDF
+
+
+def test_http_error_keeps_existing_file(base_url, fetcher, tmp_path):
+    full_path = _existing(tmp_path)
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch(f"{base_url}/missing.pdf", full_path)
+    assert open(full_path, "rb").read() == OLD
+
+
+def test_not_a_pdf(base_url, fetcher, tmp_path):
+    full_path = _existing(tmp_path)
+    with pytest.raises(IOError, match="Not a PDF"):
+        fetcher.fetch(f"{base_url}/login", full_path)
+    assert open(full_path, "rb").read() == OLD
+    assert not os.path.exists(full_path + ".part")
+
+
+def test_no_overwrite(base_url, fetcher, tmp_path):
+    full_path = _existing(tmp_path)
+    assert fetcher.fetch(f"{base_url}/document.pdf", full_path, file_overwrite=False) == 0
+    assert open(full_path, "rb").read() == OLD
+
+
+def test_missing_directory(base_url, fetcher, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        fetcher.fetch(f"{base_url}/document.pdf", str(tmp_path / "missing" / "document.pdf"), make_directory=False)
+
+
+class _PageDriver:
+    """Runs the extract_iframe_blob() page scripts the way the page would (no browser here): the fetch script GETs
+    the iframe's src from the local server, the chunk script returns base64 slices of the fetched bytes."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def execute_async_script(self, script, *args):
+        if script == _BLOB_FETCH_SCRIPT:
+            try:
+                with urllib.request.urlopen(args[0].get_attribute("src")) as response:
+                    data = response.read()
+            except Exception as e:
+                return {"error": str(e)}
+            self.blobs[str(len(self.blobs))] = data
+            return {"id": str(len(self.blobs) - 1), "size": len(data)}
+        if script == _BLOB_CHUNK_SCRIPT:
+            blob_id, offset, length = args
+            return base64.b64encode(self.blobs[blob_id][offset:offset + length]).decode()
+        raise AssertionError("unexpected script")
+
+    def execute_script(self, script, *args):
+        assert script == _BLOB_RELEASE_SCRIPT
+        self.blobs.pop(args[0], None)
+
+
+class _PageIframe:
+    def __init__(self, src):
+        self.parent = _PageDriver()
+        self.src = src
+
+    def get_attribute(self, name):
+        return self.src
+
+
+def test_extract(base_url, tmp_path):
+    full_path = _existing(tmp_path)
+    iframe = _PageIframe(f"{base_url}/document.pdf")
+    assert extract_iframe_blob(iframe, full_path, chunk_size=1000) == len(PDF)
+    assert open(full_path, "rb").read() == PDF
+    assert not iframe.parent.blobs  # Released in the page.
+
+
+@pytest.mark.parametrize("path", ["/login", "/empty.pdf"])
+def test_extract_not_a_pdf_keeps_existing_file(base_url, tmp_path, path):
+    full_path = _existing(tmp_path)
+    with pytest.raises(IOError, match="Not a PDF"):
+        extract_iframe_blob(_PageIframe(base_url + path), full_path, chunk_size=1000)
+    assert open(full_path, "rb").read() == OLD
+    assert not os.path.exists(full_path + ".part")
+
+
+def test_extract_failed_fetch(base_url, tmp_path):
+    full_path = _existing(tmp_path)
+    with pytest.raises(IOError, match="In-page fetch failed"):
+        extract_iframe_blob(_PageIframe(f"{base_url}/missing.pdf"), full_path)
+    assert open(full_path, "rb").read() == OLD
@@ -0,0 +1,70 @@
+"""hash_and_validate(), ContentStore and PostSaveStage on files in a temporary directory."""
+
+import hashlib
+import os
+import pytest
+from pdf_store import ContentStore, PostSaveStage, hash_and_validate
+
+DOCUMENT = b"%PDF-1.7\n" + b"x" * 5000 + b"\n%%EOF\n"
+
+
+def _write(path, data=DOCUMENT):
+    with open(path, "wb") as file:
+        file.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1024, 1 << 20])
+def test_hash_any_chunk_size(tmp_path, chunk_size):
+    path = _write(tmp_path / "a.pdf")
+    assert hash_and_validate(path, chunk_size) == (hashlib.sha256(DOCUMENT).hexdigest(), len(DOCUMENT), None)
+
+
+@pytest.mark.parametrize("data, error", [
+    (b"", "empty file"),
+    (b"<html>login</html>", "no %PDF- header"),
+    (b" " * 2000 + DOCUMENT, "no %PDF- header"),  # Beyond the first 1024 bytes.
+    (DOCUMENT[:-20], "no %%EOF marker, file is truncated"),
+])
+def test_invalid(tmp_path, data, error):
+    assert hash_and_validate(_write(tmp_path / "a.pdf", data), 64)[2] == error
+
+
+def test_store_links_duplicates(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    first, second = _write(tmp_path / "a.pdf"), _write(tmp_path / "b.pdf")
+    sha256 = hashlib.sha256(DOCUMENT).hexdigest()
+    assert store.add(first, sha256) is False  # New content: first becomes the object.
+    assert os.path.samefile(first, store.object_path(sha256))
+    assert store.add(second, sha256) is True
+    assert os.path.samefile(second, first)
+    assert os.stat(first).st_nlink == 3
+    assert store.add(second, sha256) is True  # Already linked.
+    with open(second, "rb") as file:
+        assert file.read() == DOCUMENT
+
+
+def test_stage_process(tmp_path):
+    stage = PostSaveStage(ContentStore(str(tmp_path / "store")), max_workers=2, chunk_size=256)
+    try:
+        first = stage.process(_write(tmp_path / "a.pdf"))
+        assert first.ok and not first.duplicate and first.size == len(DOCUMENT)
+        futures = [stage.submit(_write(tmp_path / f"{index}.pdf")) for index in range(4)]
+        assert all(future.result().ok and future.result().duplicate for future in futures)
+        corrupt = stage.process(_write(tmp_path / "bad.pdf", DOCUMENT[:100]))
+        assert not corrupt.ok and corrupt.error.startswith("no %%EOF")
+        assert os.stat(str(tmp_path / "bad.pdf")).st_nlink == 1  # Not stored.
+        missing = stage.process(str(tmp_path / "missing.pdf"))
+        assert not missing.ok and missing.sha256 is None
+    finally:
+        stage.close()
+
+
+def test_stage_without_store_only_validates(tmp_path):
+    stage = PostSaveStage()
+    try:
+        result = stage.process(_write(tmp_path / "a.pdf"))
+        assert result.ok and not result.duplicate
+        assert os.stat(result.path).st_nlink == 1
+    finally:
+        stage.close()
@@ -0,0 +1,56 @@
+"""PdfViewStatusClassifier against synthetic images."""
+
+import numpy as np
+import pytest
+from PIL import Image
+from pdf_view_status import DEFAULT_PALETTES, DEFAULT_PROBE_OFFSETS, PdfViewStatusClassifier
+
+CENTER = (10, 10)
+POINTS = [(CENTER[0] + dx, CENTER[1] + dy) for dx, dy in DEFAULT_PROBE_OFFSETS]
+
+
+def _image(color, size=(20, 20)):
+    image = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    image[:] = color
+    return image
+
+
+@pytest.mark.parametrize("status, color", [(status, color) for status, colors in DEFAULT_PALETTES["default"].items()
+                                           for color in colors])
+def test_palette_colors(status, color):
+    assert PdfViewStatusClassifier().classify_image(_image(color), POINTS) == status
+
+
+def test_within_tolerance():
+    """Anti-aliasing / theme drift of a few levels per channel still matches."""
+    assert PdfViewStatusClassifier().classify_image(_image((245, 238, 243)), POINTS) == "Loaded"
+
+
+def test_outside_tolerance_is_unknown():
+    assert PdfViewStatusClassifier().classify_image(_image((255, 0, 255)), POINTS) == "Unknown"
+    assert PdfViewStatusClassifier(tolerance=2.0).classify_image(_image((245, 238, 243)), POINTS) == "Unknown"
+
+
+def test_majority_of_probes_wins():
+    image = _image((241, 241, 241))
+    x, y = POINTS[0]
+    image[y, x] = (50, 54, 57)  # One probe on "Loading" text / a cursor.
+    assert PdfViewStatusClassifier().classify_image(image, POINTS) == "Loaded"
+
+
+def test_pil_image_with_alpha():
+    image = Image.fromarray(np.dstack([_image((50, 54, 57)), np.full((20, 20), 255, dtype=np.uint8)]), "RGBA")
+    assert PdfViewStatusClassifier().classify_image(image, POINTS) == "Loading"
+
+
+def test_points_outside_image_are_ignored():
+    points = POINTS + [(-1, 5), (5, 100)]
+    assert PdfViewStatusClassifier().classify_image(_image((169, 169, 169)), points) == "Empty"
+    assert PdfViewStatusClassifier().classify_image(_image((169, 169, 169)), [(-1, -1)]) == "Unknown"
+
+
+def test_custom_palettes():
+    palettes = {"dark": {"Loaded": [(30, 30, 30)], "Loading": [(90, 0, 0)]}}
+    classifier = PdfViewStatusClassifier(palettes)
+    assert classifier.classify_image(_image((32, 29, 31)), POINTS) == "Loaded"
+    assert classifier.classify_image(_image((241, 241, 241)), POINTS) == "Unknown"
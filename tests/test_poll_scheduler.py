@@ -0,0 +1,119 @@
+"""PollScheduler, Backoff and wait_on_caller()."""
+
+import asyncio
+import threading
+import time
+import pytest
+from poll_scheduler import Backoff, PollScheduler, wait_on_caller, wait_on_caller_async
+from window_events import SimulatedEventSource
+
+EVENT = 0x8000
+
+
+def test_backoff_grows_to_maximum():
+    backoff = Backoff(initial=0.01, maximum=0.1, factor=2.0, jitter=0.0)
+    assert [backoff.interval(attempt) for attempt in range(6)] == pytest.approx([0.01, 0.02, 0.04, 0.08, 0.1, 0.1])
+    assert Backoff(initial=5, maximum=1, jitter=0).interval(0) == 1  # initial is capped
+
+
+def test_backoff_jitter_stays_in_range():
+    backoff = Backoff(initial=0.1, maximum=0.1, jitter=0.2)
+    intervals = [backoff.interval(attempt) for attempt in range(200)]
+    assert all(0.08 <= interval <= 0.12 for interval in intervals)
+    assert len(set(intervals)) > 1
+
+
+def test_result_and_exception():
+    scheduler = PollScheduler(idle_time=0.1)
+    checks = iter([0, "", "done"])
+    assert scheduler.wait(lambda: next(checks), 2, Backoff(0.001, 0.001)) == "done"
+    future = scheduler.submit(lambda: 1 / 0, 2)
+    with pytest.raises(ZeroDivisionError):
+        future.result(2)
+    assert scheduler.pending == 0
+
+
+def test_deadlines_resolve_in_order():
+    scheduler = PollScheduler(idle_time=0.1)
+    order = []
+    backoff = Backoff(0.01, 0.01, jitter=0)
+    futures = [scheduler.submit(lambda: False, wait_time, backoff) for wait_time in (0.3, 0.1, 0.2)]
+    for index, future in enumerate(futures):
+        future.add_done_callback(lambda _future, index=index: order.append(index))
+    assert [future.result(2) for future in futures] == [None, None, None]
+    assert order == [1, 2, 0]
+
+
+def test_event_wakes_condition_early():
+    scheduler = PollScheduler(idle_time=0.1)
+    source = SimulatedEventSource((EVENT,))
+    ready = threading.Event()
+    future = scheduler.submit(ready.is_set, 5, Backoff(10, 10), (EVENT,), source)
+    time.sleep(0.05)
+    start = time.monotonic()
+    ready.set()
+    source.emit(EVENT)
+    assert future.result(2) is True
+    assert time.monotonic() - start < 0.5  # Not the 10 s backoff.
+    assert not source._subscribers
+
+
+def test_event_during_check_triggers_another_check():
+    scheduler = PollScheduler(idle_time=0.1)
+    source = SimulatedEventSource((EVENT,))
+    checks = []
+
+    def predicate():
+        checks.append(time.monotonic())
+        if len(checks) == 1:
+            source.emit(EVENT)  # Arrives while this check runs: must not be lost.
+            return False
+        return True
+    future = scheduler.submit(predicate, 5, Backoff(10, 10), (EVENT,), source)
+    assert future.result(2) is True
+    assert checks[1] - checks[0] < 0.5
+
+
+def test_other_events_do_not_wake():
+    scheduler = PollScheduler(idle_time=0.1)
+    source = SimulatedEventSource((EVENT, EVENT + 1))
+    checks = []
+    future = scheduler.submit(lambda: checks.append(1), 0.3, Backoff(10, 10), (EVENT,), source)
+    time.sleep(0.05)
+    source.emit(EVENT + 1)
+    assert future.result(2) is None
+    assert len(checks) == 2  # The first check and the one at the deadline.
+
+
+def test_wait_on_caller_runs_on_calling_thread():
+    source = SimulatedEventSource((EVENT,))
+    threads = []
+
+    def predicate():
+        threads.append(threading.current_thread())
+        return len(threads) == 2 and "done"
+    threading.Timer(0.05, source.emit, (EVENT,)).start()
+    start = time.monotonic()
+    assert wait_on_caller(predicate, 5, Backoff(10, 10), (EVENT,), source) == "done"
+    assert time.monotonic() - start < 0.5
+    assert threads == [threading.current_thread()] * 2
+    assert not source._subscribers
+    assert wait_on_caller(lambda: 0, 0.05, Backoff(0.01, 0.01)) is None
+
+
+def test_wait_on_caller_async_abandons_blocked_check():
+    async def main():
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def predicate():
+            threads.append(threading.current_thread())
+            time.sleep(0.5)
+            return True
+        start = time.monotonic()
+        result = await wait_on_caller_async(predicate, 0.1, Backoff(0.01, 0.01))
+        return result, time.monotonic() - start, threads, loop_thread
+    result, elapsed, threads, loop_thread = asyncio.run(main())
+    assert result is None
+    assert elapsed < 0.4
+    assert threads and loop_thread not in threads
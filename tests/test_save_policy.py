@@ -0,0 +1,122 @@
+"""CircuitBreaker and SavePolicy retries."""
+
+import asyncio
+import time
+import pytest
+from poll_scheduler import Backoff
+from save_policy import SavePolicy, CircuitBreaker, CircuitOpenError, DialogNotFoundError, DownloadTimeoutError, \
+    SaveError
+
+
+def _policy(max_attempts=3, failure_threshold=5, reset_time=60.0):
+    return SavePolicy(max_attempts=max_attempts, backoff=Backoff(0.001, 0.001),
+                      breaker=CircuitBreaker(failure_threshold, reset_time))
+
+
+def _attempts(*outcomes):
+    """An attempt returning or raising the given outcomes in turn. calls counts them."""
+    outcomes = list(outcomes)
+
+    def attempt():
+        attempt.calls += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    attempt.calls = 0
+    return attempt
+
+
+def test_timeouts_and_errors():
+    policy = SavePolicy(timeouts={"file_wait": 5})
+    assert policy.timeout("file_wait") == 5 and policy.timeout("window_open") == 15
+    assert issubclass(DialogNotFoundError, TimeoutError) and issubclass(DialogNotFoundError, SaveError)
+    assert DownloadTimeoutError.phase == "file_wait"
+
+
+def test_retries_save_errors():
+    policy = _policy()
+    attempt = _attempts(DialogNotFoundError("a"), DownloadTimeoutError("b"), "saved")
+    assert policy.call(attempt) == "saved"
+    assert attempt.calls == 3 and policy.retries == 2
+    assert policy.breaker.failures == 0  # Reset by the success.
+
+
+def test_raises_last_error_and_other_errors_right_away():
+    policy = _policy(max_attempts=2)
+    with pytest.raises(DownloadTimeoutError):
+        policy.call(_attempts(DialogNotFoundError("a"), DownloadTimeoutError("b")))
+    attempt = _attempts(ValueError("not retried"))
+    with pytest.raises(ValueError):
+        policy.call(attempt)
+    assert attempt.calls == 1
+    assert policy.breaker.failures == 3
+
+
+def test_breaker_opens_and_closes_after_trial():
+    policy = _policy(max_attempts=1, failure_threshold=2, reset_time=0.05)
+    for _ in range(2):
+        with pytest.raises(DialogNotFoundError):
+            policy.call(_attempts(DialogNotFoundError("a")))
+    assert policy.breaker.state == "open" and policy.breaker.opened == 1
+    attempt = _attempts("saved")
+    with pytest.raises(CircuitOpenError):
+        policy.call(attempt)
+    assert attempt.calls == 0
+    time.sleep(0.06)
+    assert policy.breaker.state == "half_open"
+    assert policy.call(attempt) == "saved"
+    assert policy.breaker.state == "closed"
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_time=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before()  # The trial.
+    with pytest.raises(CircuitOpenError):
+        breaker.before()  # Only one at a time.
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 1  # Still the same opening.
+
+
+@pytest.mark.parametrize("interruption", [KeyboardInterrupt(), CircuitOpenError("nested")])
+def test_interrupted_trial_allows_another(interruption):
+    policy = _policy(max_attempts=1, failure_threshold=1, reset_time=0.05)
+    with pytest.raises(DialogNotFoundError):
+        policy.call(_attempts(DialogNotFoundError("a")))
+    time.sleep(0.06)
+    with pytest.raises(type(interruption)):
+        policy.call(_attempts(interruption))
+    assert policy.breaker.state == "half_open"
+    assert policy.call(_attempts("saved")) == "saved"  # Not refused as a second trial.
+    assert policy.breaker.state == "closed"
+
+
+def test_call_async():
+    policy = _policy()
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            raise DialogNotFoundError("a")
+        return "saved"
+    assert asyncio.run(policy.call_async(attempt)) == "saved"
+    assert len(calls) == 2 and policy.retries == 1
+
+
+def test_cancelled_async_trial_allows_another():
+    policy = _policy(max_attempts=1, failure_threshold=1, reset_time=0.05)
+    with pytest.raises(DialogNotFoundError):
+        policy.call(_attempts(DialogNotFoundError("a")))
+    time.sleep(0.06)
+
+    async def main():
+        task = asyncio.ensure_future(policy.call_async(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+    assert policy.call(_attempts("saved")) == "saved"
@@ -0,0 +1,90 @@
+"""StagingArea transfers, reservations and failed transfers on a temporary directory."""
+
+import os
+import threading
+import time
+import pytest
+from staging import StagingArea
+
+
+def _write(path, size):
+    with open(path, "wb") as file:
+        file.write(b"x" * size)
+    return path
+
+
+@pytest.fixture
+def staging(tmp_path):
+    staging = StagingArea(str(tmp_path / "staging"), max_workers=2, max_in_flight_bytes=1000, default_size=300)
+    yield staging
+    staging.close()
+
+
+def test_transfer_moves_file(tmp_path, staging):
+    destination = str(tmp_path / "out" / "sub" / "a.pdf")
+    local_path = _write(staging.local_path(destination), 100)
+    assert os.path.basename(local_path).endswith("_a.pdf")
+    assert staging.transfer(local_path, destination).result(5) == 100
+    assert staging.drain(5)
+    assert os.path.getsize(destination) == 100
+    assert not os.path.exists(local_path) and not os.path.exists(destination + ".partial")
+    assert (staging.transferred, staging.transferred_bytes, staging.in_flight_bytes) == (1, 100, 0)
+
+
+def test_prepare_destination(tmp_path, staging):
+    with pytest.raises(FileNotFoundError):
+        staging.prepare_destination(str(tmp_path / "missing" / "a.pdf"), make_directory=False)
+    staging.prepare_destination(str(tmp_path / "made" / "a.pdf"))
+    assert os.path.isdir(str(tmp_path / "made"))
+
+
+def test_incomplete_file_reserved_at_estimate(tmp_path, staging):
+    destination = str(tmp_path / "a.pdf")
+    local_path = staging.local_path(destination)
+    future = staging.transfer(local_path, destination, wait_time=5)  # Not written yet.
+    assert staging.in_flight_bytes == 300  # default_size
+    _write(local_path, 50)
+    assert future.result(5) == 50
+    assert staging.in_flight_bytes == 0
+
+
+def test_reservations_block_until_transferred(tmp_path, staging):
+    first = staging.local_path(str(tmp_path / "a.pdf"))
+    staging.transfer(first, str(tmp_path / "a.pdf"), wait_time=5)  # Reserves 300 while it is written.
+    big = _write(staging.local_path(str(tmp_path / "big.pdf")), 800)
+    blocked = threading.Event()
+
+    def transfer_big():
+        staging.transfer(big, str(tmp_path / "big.pdf"))
+        blocked.set()
+    thread = threading.Thread(target=transfer_big)
+    thread.start()
+    assert not blocked.wait(0.3)  # 300 + 800 > 1000
+    _write(first, 10)
+    assert blocked.wait(5)
+    thread.join()
+    assert staging.drain(5)
+    assert staging.in_flight_bytes == 0 and staging.transferred == 2
+
+
+def test_failed_transfer_keeps_staged_file(tmp_path, staging):
+    destination = _write(str(tmp_path / "a.pdf"), 5)
+    local_path = _write(staging.local_path(destination), 100)
+    future = staging.transfer(local_path, destination, file_overwrite=False)
+    with pytest.raises(FileExistsError):
+        future.result(5)
+    assert staging.drain(5)
+    assert os.path.getsize(local_path) == 100  # Kept, the transfer can be repeated.
+    assert os.path.getsize(destination) == 5
+    assert (staging.failed, staging.in_flight_bytes) == (1, 0)
+    assert staging.transfer(local_path, destination).result(5) == 100
+
+
+def test_drain_times_out(tmp_path, staging):
+    local_path = staging.local_path(str(tmp_path / "a.pdf"))
+    staging.transfer(local_path, str(tmp_path / "a.pdf"), wait_time=0.5)
+    start = time.time()
+    assert not staging.drain(0.1)
+    assert time.time() - start < 0.4
+    assert staging.drain(5)  # The missing file times out, counted as failed.
+    assert staging.failed == 1 and staging.in_flight_bytes == 0
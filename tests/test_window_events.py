@@ -0,0 +1,127 @@
+"""SimulatedEventSource, wait_for_condition() and wait_for_condition_async()."""
+
+import asyncio
+import threading
+import time
+from window_events import SimulatedEventSource, WINDOW_OPEN_EVENTS, EVENT_OBJECT_CREATE, EVENT_OBJECT_DESTROY, \
+    wait_for_condition, wait_for_condition_async
+
+
+class _CountingSource(SimulatedEventSource):
+    """Counts _start() / _stop() calls."""
+
+    def __init__(self):
+        super().__init__(WINDOW_OPEN_EVENTS)
+        self.starts = 0
+        self.stops = 0
+
+    def _start(self):
+        self.starts += 1
+
+    def _stop(self):
+        self.stops += 1
+
+
+def test_subscriber_start_stop():
+    source = _CountingSource()
+    seen = []
+    first, second = (lambda event, hwnd: seen.append((event, hwnd))), (lambda event, hwnd: None)
+    source.subscribe(first)
+    source.subscribe(second)
+    assert (source.starts, source.stops) == (1, 0)
+    source.emit(EVENT_OBJECT_CREATE, 42)
+    assert seen == [(EVENT_OBJECT_CREATE, 42)]
+    source.unsubscribe(first)
+    source.unsubscribe(first)  # Not subscribed any more: ignored.
+    assert source.stops == 0
+    source.unsubscribe(second)
+    assert (source.starts, source.stops) == (1, 1)
+    source.subscribe(first)
+    assert source.starts == 2
+    source.unsubscribe(first)
+
+
+def test_failing_subscriber_does_not_stop_the_others():
+    source = SimulatedEventSource()
+    seen = []
+    source.subscribe(lambda event, hwnd: 1 / 0)
+    source.subscribe(lambda event, hwnd: seen.append(event))
+    source.emit(EVENT_OBJECT_CREATE)
+    assert seen == [EVENT_OBJECT_CREATE]
+
+
+def test_wait_for_condition_event_wake_up():
+    source = _CountingSource()
+    ready = threading.Event()
+
+    def open_window():
+        ready.set()
+        source.emit(EVENT_OBJECT_CREATE, 7)
+    threading.Timer(0.05, open_window).start()
+    start = time.monotonic()
+    assert wait_for_condition(ready.is_set, 5, WINDOW_OPEN_EVENTS, source, recheck_time=10) is True
+    assert time.monotonic() - start < 0.5  # Woken by the event, not the 10 s recheck.
+    assert (source.starts, source.stops) == (1, 1)  # Unsubscribed once done.
+
+
+def test_wait_for_condition_ignores_other_events():
+    source = SimulatedEventSource()
+    checks = []
+
+    def close_windows():
+        for _ in range(20):
+            source.emit(EVENT_OBJECT_DESTROY)
+            time.sleep(0.005)
+    threading.Timer(0.05, close_windows).start()
+    assert wait_for_condition(lambda: checks.append(1), 0.3, WINDOW_OPEN_EVENTS, source, recheck_time=10) is None
+    assert len(checks) < 15  # About 8 backing off, each of the 20 events would have added one.
+
+
+def test_wait_for_condition_timeout():
+    source = _CountingSource()
+    start = time.monotonic()
+    assert wait_for_condition(lambda: 0, 0.1, WINDOW_OPEN_EVENTS, source, recheck_time=0.02) is None
+    assert 0.1 <= time.monotonic() - start < 0.5
+    assert source.stops == 1
+
+
+def test_wait_for_condition_blocking_runs_on_caller():
+    source = SimulatedEventSource()
+    threads = []
+    assert wait_for_condition(lambda: threads.append(threading.current_thread()) or True, 1, source=source,
+                              blocking=True) is True
+    assert threads == [threading.current_thread()]
+
+
+def test_wait_for_condition_async():
+    source = _CountingSource()
+
+    async def main():
+        ready = threading.Event()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, lambda: (ready.set(), source.emit(EVENT_OBJECT_CREATE)))
+        start = time.monotonic()
+        result = await wait_for_condition_async(ready.is_set, 5, WINDOW_OPEN_EVENTS, source, recheck_time=10)
+        woken = time.monotonic() - start
+        timed_out = await wait_for_condition_async(lambda: 0, 0.1, WINDOW_OPEN_EVENTS, source, recheck_time=0.02)
+        return result, woken, timed_out
+    result, woken, timed_out = asyncio.run(main())
+    assert result is True and woken < 0.5
+    assert timed_out is None
+    assert source.starts == source.stops == 2
+
+
+def test_wait_for_condition_async_cancel_unsubscribes():
+    source = _CountingSource()
+
+    async def main():
+        task = asyncio.ensure_future(wait_for_condition_async(lambda: 0, 5, WINDOW_OPEN_EVENTS, source))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.05)
+    asyncio.run(main())
+    assert (source.starts, source.stops) == (1, 1)
@@ -0,0 +1,210 @@
+"""
+Window Events - event sources used to wait for windows to open and close without busy polling
+    WinEventSource: Wraps SetWinEventHook (object create/destroy/show/hide/name change) on Windows.
+    SimulatedEventSource: In-process source, events are raised by calling emit(). Used off Windows and for testing.
+
+    Waiters subscribe to a source and re-check their condition only when an event arrives, so idle CPU is near zero
+    and the wake-up happens within milliseconds of the window appearing or closing. The checks themselves run on
+    the shared PollScheduler (see poll_scheduler).
+"""
+
+import sys
+import inspect
+import backends
+import threading
+from poll_scheduler import Backoff, get_default_scheduler, wait_on_caller, wait_on_caller_async
+from error_log import error_message as _error_message
+
+
+"""WinEvent constants (winuser.h)"""
+EVENT_OBJECT_CREATE = 0x8000
+EVENT_OBJECT_DESTROY = 0x8001
+EVENT_OBJECT_SHOW = 0x8002
+EVENT_OBJECT_HIDE = 0x8003
+EVENT_OBJECT_LOCATIONCHANGE = 0x800B
+EVENT_OBJECT_NAMECHANGE = 0x800C
+OBJID_WINDOW = 0
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+WM_QUIT = 0x0012
+
+"""Events a waiter for a window to open or close is interested in."""
+WINDOW_OPEN_EVENTS = (EVENT_OBJECT_CREATE, EVENT_OBJECT_SHOW, EVENT_OBJECT_NAMECHANGE)
+WINDOW_CLOSE_EVENTS = (EVENT_OBJECT_DESTROY, EVENT_OBJECT_HIDE)
+WINDOW_EVENTS = WINDOW_OPEN_EVENTS + WINDOW_CLOSE_EVENTS
+
+"""Backends"""
+asyncio = backends.register_module("asyncio", "asyncio")  # Imported on first use, by then a loop is running anyway.
+
+"""Global variables"""
+_default_event_source = None
+_default_event_source_lock = threading.Lock()
+
+
+def _event_ranges(events):
+    """Groups events into contiguous (event_min, event_max) ranges, one SetWinEventHook each."""
+    ranges = []
+    for event in sorted(set(events)):
+        if ranges and event == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], event)
+        else:
+            ranges.append((event, event))
+    return ranges
+
+
+class EventSource:
+    """Base class for window event sources. Callbacks are called as callback(event, hwnd). events: the events the
+    source delivers, None for any."""
+
+    def __init__(self, events=None):
+        self.events = events
+        self._subscribers = []
+        self._lock = threading.Lock()  # Guards the subscriber list.
+        self._lifecycle_lock = threading.Lock()  # Serializes _start() / _stop().
+
+    def subscribe(self, callback):
+        with self._lifecycle_lock:
+            with self._lock:
+                self._subscribers.append(callback)
+                first = len(self._subscribers) == 1
+            if first:
+                self._start()
+
+    def unsubscribe(self, callback):
+        with self._lifecycle_lock:
+            with self._lock:
+                if callback not in self._subscribers:
+                    return
+                self._subscribers.remove(callback)
+                last = len(self._subscribers) == 0
+            if last:
+                self._stop()
+
+    def _emit(self, event, hwnd):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, hwnd)
+            except Exception as e:
+                _error_message(e, inspect.currentframe())
+
+    def _start(self):
+        """Called when the first subscriber is added."""
+        pass
+
+    def _stop(self):
+        """Called when the last subscriber is removed."""
+        pass
+
+
+class SimulatedEventSource(EventSource):
+    """In-process event source. The caller raises events with emit(event, hwnd)."""
+
+    def emit(self, event, hwnd=0):
+        self._emit(event, hwnd)
+
+
+class WinEventSource(EventSource):
+    """SetWinEventHook based event source. The hooks live on their own thread, which pumps messages while
+    there are subscribers and is shut down when the last one leaves.
+    Only events are hooked (one hook per contiguous range): focus, state and location changes fire on every caret
+    and cursor move across the desktop, each one a call into Python. process_id limits the hooks to one process,
+    e.g. WinEventSource((EVENT_OBJECT_LOCATIONCHANGE,), browser_pid) for HotspotGeometry."""
+
+    def __init__(self, events=WINDOW_EVENTS, process_id=0):
+        super().__init__(tuple(events))
+        self.process_id = process_id
+        self.__thread = None
+        self.__thread_id = None
+        self.__ready = threading.Event()
+
+    def _start(self):
+        self.__ready.clear()
+        self.__thread = threading.Thread(target=self.__run, name="WinEventSource", daemon=True)
+        self.__thread.start()
+        self.__ready.wait(5)
+
+    def _stop(self):
+        import ctypes
+        if self.__thread_id is not None:
+            ctypes.windll.user32.PostThreadMessageW(self.__thread_id, WM_QUIT, 0, 0)
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join(5)
+        self.__thread = None
+        self.__thread_id = None
+
+    def __run(self):
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        kernel32 = ctypes.windll.kernel32
+
+        win_event_proc_type = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                                 wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+
+        def callback(_hook, event, hwnd, id_object, id_child, _thread, _time):
+            if id_object == OBJID_WINDOW and id_child == 0 and hwnd:
+                self._emit(event, hwnd)
+
+        win_event_proc = win_event_proc_type(callback)  # Keep a reference for the lifetime of the hooks.
+        self.__thread_id = kernel32.GetCurrentThreadId()
+        hooks = [user32.SetWinEventHook(event_min, event_max, 0, win_event_proc, self.process_id, 0,
+                                        WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS)
+                 for event_min, event_max in _event_ranges(self.events)]
+        self.__ready.set()
+        try:
+            msg = wintypes.MSG()
+            while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+        finally:
+            for hook in hooks:
+                if hook:
+                    user32.UnhookWinEvent(hook)
+
+
+def get_default_event_source():
+    """Returns the process wide event source. WinEventSource on Windows, otherwise None (polling)."""
+    global _default_event_source
+    with _default_event_source_lock:
+        if _default_event_source is None and sys.platform == "win32":
+            _default_event_source = WinEventSource()
+        return _default_event_source
+
+
+def set_default_event_source(source):
+    """Replace the process wide event source, e.g. with a SimulatedEventSource."""
+    global _default_event_source
+    with _default_event_source_lock:
+        _default_event_source = source
+
+
+def _condition_source(source, poll_time, recheck_time):
+    """Returns the event source and the Backoff for a wait."""
+    source = get_default_event_source() if source is None else source
+    return source, Backoff(maximum=poll_time if source is None else recheck_time)
+
+
+def wait_for_condition(predicate, wait_time, events=None, source=None, poll_time=0.1, recheck_time=1.0,
+                       blocking=False):
+    """Waits until predicate() returns a truthy value and returns it, or returns None when wait_time runs out.
+    The predicate is checked on the process wide PollScheduler (see poll_scheduler), backing off up to poll_time
+    seconds between checks, or up to recheck_time (a safety net) with an event source, where each of the given
+    events triggers a check right away. A predicate that may block (blocking) is checked on the calling thread
+    instead, see poll_scheduler.wait_on_caller()."""
+    source, backoff = _condition_source(source, poll_time, recheck_time)
+    if blocking:
+        return wait_on_caller(predicate, wait_time, backoff, events, source)
+    return get_default_scheduler().wait(predicate, wait_time, backoff, events, source)
+
+
+async def wait_for_condition_async(predicate, wait_time, events=None, source=None, poll_time=0.1, recheck_time=1.0,
+                                   blocking=False):
+    """Awaitable counterpart of wait_for_condition(). The scheduler's future is wrapped for the running loop, so
+    no thread is blocked while waiting. Cancelling the awaiting task cancels the condition. A blocking predicate
+    is checked on a worker thread."""
+    source, backoff = _condition_source(source, poll_time, recheck_time)
+    if blocking:
+        return await wait_on_caller_async(predicate, wait_time, backoff, events, source)
+    return await asyncio.wrap_future(get_default_scheduler().submit(predicate, wait_time, backoff, events, source))